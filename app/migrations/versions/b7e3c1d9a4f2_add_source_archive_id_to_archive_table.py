@@ -0,0 +1,54 @@
+"""add source_archive_id to archive table
+
+Revision ID: b7e3c1d9a4f2
+Revises: 63ac79df4ad0
+Create Date: 2026-10-17 09:12:41.518204
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e3c1d9a4f2"
+down_revision = "63ac79df4ad0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col["name"] for col in inspector.get_columns("archives")]
+
+    if "source_archive_id" not in columns:
+        with op.batch_alter_table("archives") as batch_op:
+            batch_op.add_column(
+                sa.Column(
+                    "source_archive_id",
+                    sa.String(),
+                    nullable=True,
+                    default=None,
+                )
+            )
+            batch_op.create_foreign_key(
+                "fk_source_archive_id",
+                "archives",
+                ["source_archive_id"],
+                ["id"],
+            )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    foreign_keys = [fk["name"] for fk in inspector.get_foreign_keys("archives")]
+    columns = [col["name"] for col in inspector.get_columns("archives")]
+
+    with op.batch_alter_table("archives") as batch_op:
+        if "fk_source_archive_id" in foreign_keys:
+            batch_op.drop_constraint("fk_source_archive_id", type_="foreignkey")
+
+        if "source_archive_id" in columns:
+            batch_op.drop_column("source_archive_id")
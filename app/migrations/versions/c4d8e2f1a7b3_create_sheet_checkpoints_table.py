@@ -0,0 +1,53 @@
+"""create sheet_checkpoints table
+
+Revision ID: c4d8e2f1a7b3
+Revises: b7e3c1d9a4f2
+Create Date: 2026-10-17 11:02:17.204918
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "c4d8e2f1a7b3"
+down_revision = "b7e3c1d9a4f2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if "sheet_checkpoints" not in inspector.get_table_names():
+        op.create_table(
+            "sheet_checkpoints",
+            sa.Column(
+                "sheet_id",
+                sa.String(),
+                sa.ForeignKey("sheets.id"),
+                primary_key=True,
+            ),
+            sa.Column("run_id", sa.String(), nullable=True),
+            sa.Column("runs", sa.Integer(), nullable=True),
+            sa.Column("rows", sa.JSON(), nullable=True),
+            sa.Column("finished_worksheets", sa.JSON(), nullable=True),
+            sa.Column("stats", sa.JSON(), nullable=True),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=True,
+            ),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if "sheet_checkpoints" in inspector.get_table_names():
+        op.drop_table("sheet_checkpoints")
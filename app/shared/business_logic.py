@@ -19,11 +19,20 @@ def get_store_archive_until(
         f"Group {group_id} has no permissions."
     )
 
-    max_lifespan = group.permissions.get("max_archive_lifespan_months", -1)
-    if max_lifespan == -1:
+    return store_until_from_lifespan(
+        group.permissions.get("max_archive_lifespan_months", -1)
+    )
+
+
+def store_until_from_lifespan(
+    max_lifespan_months: int,
+) -> Union[datetime.datetime, None]:
+    if max_lifespan_months == -1:
         return None
 
-    return datetime.datetime.now() + datetime.timedelta(days=30 * max_lifespan)
+    return datetime.datetime.now() + datetime.timedelta(
+        days=30 * max_lifespan_months
+    )
 
 
 def get_store_archive_until_or_never(
@@ -1,4 +1,5 @@
 from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from functools import lru_cache
 
 from sqlalchemy import Engine, create_engine, event, text
@@ -8,18 +9,26 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
 )
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.shared.settings import get_settings
 
 
+# connections each engine keeps open and how many more it opens under load,
+# worker processes size their own with configure_engine
+_POOL_SIZES = {"pool_size": 15, "max_overflow": 20}
+# the session of the worker task running in this thread or greenlet
+_TASK_SESSION: ContextVar[Session | None] = ContextVar(
+    "task_session", default=None
+)
+
+
 @lru_cache
 def make_engine(database_url: str):
     engine = create_engine(
         database_url,
         connect_args={"check_same_thread": False},
-        pool_size=15,  # Increase pool size
-        max_overflow=20,  # Allow more temporary connections
+        **_POOL_SIZES,
         pool_recycle=1800,  # Recycle connections every 30 minutes
         pool_pre_ping=True,  # Detect and replace stale connections
         pool_timeout=30,  # Timeout waiting for a connection from pool
@@ -34,6 +43,19 @@ def make_engine(database_url: str):
     return engine
 
 
+def configure_engine(pool_size: int, max_overflow: int) -> None:
+    """
+    Drops the engine built so far, the next one uses these pool sizes. Safe
+    in forked worker children: connections inherited from the parent are
+    left to it instead of being closed under its feet.
+    """
+    make_engine(get_settings().DATABASE_PATH).dispose(close=False)
+    make_engine.cache_clear()
+    make_session_local.cache_clear()
+    _POOL_SIZES.update(pool_size=pool_size, max_overflow=max_overflow)
+
+
+@lru_cache
 def make_session_local(engine: Engine):
     session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     return session_local
@@ -41,6 +63,7 @@ def make_session_local(engine: Engine):
 
 @contextmanager
 def get_db():
+    # a new session per call, never share one between threads or greenlets
     session = make_session_local(make_engine(get_settings().DATABASE_PATH))()
     try:
         yield session
@@ -48,6 +71,41 @@ def get_db():
         session.close()
 
 
+@contextmanager
+def unit_of_work():
+    """
+    Shares one session between every task_db block of a worker task, closed
+    once the task ends. Nested calls reuse the outer session.
+    """
+    if _TASK_SESSION.get() is not None:
+        yield
+        return
+    with get_db() as session:
+        token = _TASK_SESSION.set(session)
+        try:
+            yield
+        finally:
+            _TASK_SESSION.reset(token)
+
+
+@contextmanager
+def task_db():
+    """
+    The session of the current unit_of_work, or a new one outside of it.
+    Errors roll it back so the rest of the task can keep using it.
+    """
+    session = _TASK_SESSION.get()
+    if session is None:
+        with get_db() as session:
+            yield session
+        return
+    try:
+        yield session
+    except BaseException:
+        session.rollback()
+        raise
+
+
 def get_db_dependency():
     # to use with Depends and ensure proper session closing
     with get_db() as db:
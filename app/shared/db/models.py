@@ -6,6 +6,7 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Integer,
     String,
     Table,
 )
@@ -53,6 +54,8 @@ class Archive(Base):
     group_id = Column(String, ForeignKey("groups.id"), default=None)
     author_id = Column(String, ForeignKey("users.email"))
     sheet_id = Column(String, ForeignKey("sheets.id"), default=None)
+    # set when the result was copied from another archive of the same URL
+    source_archive_id = Column(String, ForeignKey("archives.id"), default=None)
 
     tags = relationship(
         "Tag",
@@ -151,3 +154,28 @@ class Sheet(Base):
     group = relationship("Group", back_populates="sheets")
     author = relationship("User", back_populates="sheets")
     archives = relationship("Archive", back_populates="sheet")
+    checkpoint = relationship(
+        "SheetCheckpoint",
+        back_populates="sheet",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+
+
+class SheetCheckpoint(Base):
+    __tablename__ = "sheet_checkpoints"
+
+    sheet_id = Column(String, ForeignKey("sheets.id"), primary_key=True)
+    run_id = Column(
+        String, doc="Task id of the first run, shared by the runs resuming it."
+    )
+    runs = Column(Integer, default=1, doc="Runs so far, including resumes.")
+    rows = Column(
+        JSON, default={}, doc="Last row processed, by worksheet title."
+    )
+    finished_worksheets = Column(JSON, default=[])
+    stats = Column(JSON, default={}, doc="Stats of the runs so far.")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    sheet = relationship("Sheet", back_populates="checkpoint")
@@ -26,27 +26,34 @@ def get_group(db: Session, group_name: str) -> models.Group:
     return db.query(models.Group).filter(models.Group.id == group_name).first()
 
 
-def create_or_get_user(db: Session, author_id: str) -> models.User:
+def _save(db: Session, instance, commit: bool):
+    # commit=False only adds to the session so the caller can group inserts
+    # in one transaction, sessions don't autoflush so the row is not visible
+    # to queries until then
+    db.add(instance)
+    if commit:
+        db.commit()
+        db.refresh(instance)
+    return instance
+
+
+def create_or_get_user(
+    db: Session, author_id: str, commit: bool = True
+) -> models.User:
     if isinstance(author_id, str):
         author_id = author_id.lower()
     db_user = (
         db.query(models.User).filter(models.User.email == author_id).first()
     )
     if not db_user:
-        db_user = models.User(email=author_id)
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        db_user = _save(db, models.User(email=author_id), commit)
     return db_user
 
 
-def create_tag(db: Session, tag: str) -> models.Tag:
+def create_tag(db: Session, tag: str, commit: bool = True) -> models.Tag:
     db_tag = db.query(models.Tag).filter(models.Tag.id == tag).first()
     if not db_tag:
-        db_tag = models.Tag(id=tag)
-        db.add(db_tag)
-        db.commit()
-        db.refresh(db_tag)
+        db_tag = _save(db, models.Tag(id=tag), commit)
     return db_tag
 
 
@@ -55,6 +62,7 @@ def create_archive(
     archive: schemas.ArchiveCreate,
     tags: list[models.Tag],
     urls: list[models.ArchiveUrl],
+    commit: bool = True,
 ) -> models.Archive:
     db_archive = models.Archive(
         id=archive.id,
@@ -65,13 +73,11 @@ def create_archive(
         group_id=archive.group_id,
         sheet_id=archive.sheet_id,
         store_until=archive.store_until,
+        source_archive_id=archive.source_archive_id,
     )
     db_archive.tags = tags
     db_archive.urls = urls
-    db.add(db_archive)
-    db.commit()
-    db.refresh(db_archive)
-    return db_archive
+    return _save(db, db_archive, commit)
 
 
 def store_archived_url(
@@ -85,3 +91,63 @@ def store_archived_url(
         db, archive=archive, tags=db_tags, urls=archive.urls
     )
     return db_archive
+
+
+def store_archived_urls(
+    db: Session, archives: list[schemas.ArchiveCreate]
+) -> list[models.Archive]:
+    """
+    Stores several archives in a single transaction, if any of them fails
+    nothing is committed and the error is raised for the caller to decide.
+    """
+    users: dict[str, models.User] = {}
+    tags: dict[str, models.Tag] = {}
+    db_archives = []
+    try:
+        for archive in archives:
+            # users and tags are only looked up once per batch, as unflushed
+            # rows are invisible to queries
+            author_id = archive.author_id
+            if isinstance(author_id, str):
+                author_id = author_id.lower()
+            if author_id not in users:
+                users[author_id] = create_or_get_user(
+                    db, author_id, commit=False
+                )
+            db_tags = []
+            for tag in archive.tags or []:
+                if tag not in tags:
+                    tags[tag] = create_tag(db, tag, commit=False)
+                db_tags.append(tags[tag])
+            db_archives.append(
+                create_archive(db, archive, db_tags, archive.urls, commit=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return db_archives
+
+
+def get_sheet_checkpoint(
+    db: Session, sheet_id: str
+) -> models.SheetCheckpoint | None:
+    return db.get(models.SheetCheckpoint, sheet_id)
+
+
+def save_sheet_checkpoint(
+    db: Session, checkpoint: models.SheetCheckpoint
+) -> models.SheetCheckpoint:
+    db_checkpoint = db.merge(checkpoint)
+    db.commit()
+    return db_checkpoint
+
+
+def delete_sheet_checkpoint(db: Session, sheet_id: str) -> bool:
+    deleted = (
+        db.query(models.SheetCheckpoint)
+        .filter(models.SheetCheckpoint.sheet_id == sheet_id)
+        .delete()
+    )
+    db.commit()
+    return deleted > 0
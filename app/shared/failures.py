@@ -0,0 +1,159 @@
+"""
+Sorts the exceptions of archiving tasks into failure classes, each of them
+either transient (worth retrying: timeouts, network, a locked database) or
+permanent (retrying would fail the same way: invalid URLs, missing content,
+unsupported platforms, orchestrator configuration errors).
+
+Exceptions are classified by type first, then by HTTP status when they carry
+a response, then by their message, and last by what caused them. Anything not
+recognised is "unknown" and treated as transient, which is how every failure
+was handled before.
+"""
+
+import re
+
+import requests
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded
+from sqlalchemy import exc as sqlalchemy_exc
+
+import redis
+
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+INVALID_URL = "invalid_url"
+NOT_FOUND = "not_found"
+REMOVED = "removed"
+UNSUPPORTED = "unsupported"
+CLIENT_ERROR = "client_error"
+CONFIG = "config"
+INTEGRITY = "integrity"
+TIMEOUT = "timeout"
+NETWORK = "network"
+RATE_LIMITED = "rate_limited"
+SERVER_ERROR = "server_error"
+DATABASE = "database"
+UNKNOWN = "unknown"
+# not an exception: the orchestrator ran but no extractor got anything, eg:
+# deleted posts or private accounts
+NOTHING_ARCHIVED = "nothing_archived"
+
+FAILURE_KINDS = {
+    INVALID_URL: PERMANENT,
+    NOT_FOUND: PERMANENT,
+    REMOVED: PERMANENT,
+    UNSUPPORTED: PERMANENT,
+    CLIENT_ERROR: PERMANENT,
+    CONFIG: PERMANENT,
+    INTEGRITY: PERMANENT,
+    NOTHING_ARCHIVED: PERMANENT,
+    TIMEOUT: TRANSIENT,
+    NETWORK: TRANSIENT,
+    RATE_LIMITED: TRANSIENT,
+    SERVER_ERROR: TRANSIENT,
+    DATABASE: TRANSIENT,
+    UNKNOWN: TRANSIENT,
+}
+
+_URL = re.compile(r"https?://\S+")
+# checked in order, on the lowercase message of the exception
+_MESSAGES = [
+    (re.compile(r"unsupported url|no (suitable )?extractor"), UNSUPPORTED),
+    (
+        re.compile(
+            r"invalid url|localhost urls|not globally reachable|"
+            r"reserved ip|link-local ip|private ip"
+        ),
+        INVALID_URL,
+    ),
+    (re.compile(r"too many requests|rate.?limit|\b429\b"), RATE_LIMITED),
+    (
+        re.compile(
+            r"has been removed|been deleted|no longer available|"
+            r"account (has been )?suspended|\b410\b"
+        ),
+        REMOVED,
+    ),
+    (re.compile(r"\b404\b|not found"), NOT_FOUND),
+    (re.compile(r"timed? ?out"), TIMEOUT),
+]
+
+
+class PermanentFailure(Exception):
+    """
+    Raised from a task in place of an exception that retrying would not fix,
+    keeps its message and carries its failure class.
+    """
+
+    def __init__(self, message: str, failure_class: str):
+        super().__init__(message)
+        self.failure_class = failure_class
+
+
+def failure_kind(failure_class: str) -> str:
+    return FAILURE_KINDS.get(failure_class, TRANSIENT)
+
+
+def classify(e: BaseException) -> str:
+    # the failure class of `e`, see FAILURE_KINDS
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if failure_class := _classify_one(e):
+            return failure_class
+        e = e.__cause__ or e.__context__
+    return UNKNOWN
+
+
+def _classify_one(e: BaseException) -> str | None:
+    if isinstance(e, PermanentFailure):
+        return e.failure_class
+    if isinstance(e, SystemExit) or type(e).__name__ == "SetupError":
+        return CONFIG
+    if isinstance(
+        e,
+        (
+            SoftTimeLimitExceeded,
+            TimeLimitExceeded,
+            TimeoutError,
+            redis.exceptions.TimeoutError,
+            requests.exceptions.Timeout,
+        ),
+    ):
+        return TIMEOUT
+    if isinstance(e, sqlalchemy_exc.IntegrityError):
+        return INTEGRITY
+    if isinstance(e, sqlalchemy_exc.SQLAlchemyError):
+        return DATABASE
+    if isinstance(
+        e,
+        (
+            ConnectionError,
+            redis.exceptions.ConnectionError,
+            requests.exceptions.ConnectionError,
+        ),
+    ):
+        return NETWORK
+    if status := getattr(getattr(e, "response", None), "status_code", None):
+        return _classify_status(status)
+    # URLs in the message could match anything
+    message = _URL.sub("", str(e).lower())
+    for pattern, failure_class in _MESSAGES:
+        if pattern.search(message):
+            return failure_class
+    return None
+
+
+def _classify_status(status: int) -> str | None:
+    if status == 404:
+        return NOT_FOUND
+    if status in (410, 451):
+        return REMOVED
+    if status == 429:
+        return RATE_LIMITED
+    if 400 <= status < 500:
+        return CLIENT_ERROR
+    if status >= 500:
+        return SERVER_ERROR
+    return None
@@ -0,0 +1,419 @@
+"""
+Fair scheduling between the users sharing a celery queue: `-O fair` only
+balances prefetching between worker processes, so one user bulk submitting
+URLs or registering many sheets would otherwise fill low_priority and make
+everyone else in it wait behind them.
+
+Tasks sent to a queue in FAIR_QUEUES go to a Redis sub-queue of their author
+instead, and a dispatcher in the web process moves them into the celery queue
+by deficit round robin: each user with pending tasks gets a quantum of credit
+per round, spent on the cost of their tasks (the URLs in a batch, 1 for the
+rest), and the celery queue is only topped up to its target depth so that
+the order users are served in is decided here and not by the broker.
+
+Users are grouped in lanes, themselves served by deficit round robin with a
+quantum proportional to their weight: groups with a `share` in the
+user-groups file get a lane of that weight, every other group shares a lane
+of weight 1. Under saturation a lane gets its weight's share of what is
+dispatched, and what an idle lane does not use goes to the busy ones, as
+its credit does not build up while it has nothing queued.
+
+Sending falls back to the celery queue directly when Redis fails, as before
+there were sub-queues.
+"""
+
+import json
+import time
+import uuid
+from functools import lru_cache
+
+from celery import Celery
+
+import redis
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import broker_queue_keys, get_redis
+
+
+PREFIX = "fair-queue"
+DISPATCHER_LOCK = f"{PREFIX}:dispatcher"
+# the lane of the groups without a share
+SHARED_LANE = "_shared"
+
+# queues the task, registering its author in the round robin of their lane,
+# and the lane in that of the queue, if they had nothing queued
+_PUSH = """
+redis.call('RPUSH', KEYS[1], ARGV[2])
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[3], ARGV[1])
+end
+if redis.call('SADD', KEYS[4], ARGV[3]) == 1 then
+    redis.call('RPUSH', KEYS[5], ARGV[3])
+end
+redis.call('HSET', KEYS[6], ARGV[3], ARGV[4])
+return 1
+"""
+
+# removes a member from a round robin once the list KEYS[1] of what it has
+# queued is empty
+_RETIRE = """
+if redis.call('LLEN', KEYS[1]) > 0 then
+    return 0
+end
+redis.call('SREM', KEYS[2], ARGV[1])
+redis.call('LREM', KEYS[3], 0, ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+return 1
+"""
+
+_UNLOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lanes_key(queue: str) -> str:
+    return f"{PREFIX}:{queue}:lanes"
+
+
+def users_key(queue: str, lane: str) -> str:
+    return f"{PREFIX}:{queue}:lane:{lane}:users"
+
+
+def user_key(queue: str, lane: str, author_id: str) -> str:
+    return f"{PREFIX}:{queue}:lane:{lane}:user:{author_id}"
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class _Ring:
+    """
+    The members of a round robin as stored in Redis under `key`: their order
+    (a list), who is in it (`key`:active), their credit (`key`:deficits) and
+    whose turn is next (`key`:cursor).
+    """
+
+    def __init__(self, Redis: redis.Redis, key: str):
+        self.Redis = Redis
+        self.key = key
+        self.members = [_decode(m) for m in Redis.lrange(key, 0, -1)]
+        self.deficits = {
+            _decode(member): float(deficit)
+            for member, deficit in Redis.hgetall(f"{key}:deficits").items()
+        }
+        cursor = _decode(Redis.get(f"{key}:cursor"))
+        self.turn = self.members.index(cursor) if cursor in self.members else 0
+
+    def current(self) -> str:
+        self.turn %= len(self.members)
+        return self.members[self.turn]
+
+    def advance(self, deficit: float) -> None:
+        self.deficits[self.current()] = deficit
+        self.turn += 1
+
+    def retire(self, queued_key: str) -> bool:
+        # drops the current member, unless it queued something since
+        member = self.current()
+        if not self.Redis.register_script(_RETIRE)(
+            keys=[
+                queued_key,
+                f"{self.key}:active",
+                self.key,
+                f"{self.key}:deficits",
+            ],
+            args=[member],
+        ):
+            return False
+        self.members.pop(self.turn)
+        self.deficits.pop(member, None)
+        return True
+
+    def save(self) -> None:
+        if not self.members:
+            return
+        pipeline = self.Redis.pipeline(transaction=False)
+        pipeline.set(f"{self.key}:cursor", self.current())
+        if self.deficits:
+            pipeline.hset(f"{self.key}:deficits", mapping=self.deficits)
+        pipeline.execute()
+
+
+class FairQueue:
+    def __init__(
+        self,
+        Redis: redis.Redis,
+        target_depths: dict[str, int],
+        quantum: int,
+    ):
+        self.Redis = Redis
+        # queue name: tasks kept in the celery queue
+        self.target_depths = target_depths
+        self.quantum = max(quantum, 1)
+
+    def submit(
+        self,
+        celery: Celery,
+        name: str,
+        args: list,
+        author_id: str | None,
+        task_id: str | None = None,
+        cost: int = 1,
+        **options,
+    ) -> str:
+        """
+        Sends the task `name` like celery.signature(name, args).apply_async
+        would, through the sub-queue of `author_id` when options["queue"] is
+        a fair queue. Returns the task id.
+
+        The "lane" and "share" options (see queue_options) choose the lane of
+        the task and its weight.
+        """
+        lane = options.pop("lane", None) or SHARED_LANE
+        share = options.pop("share", None) or 1
+        queue = options.get("queue")
+        if queue not in self.target_depths or not author_id:
+            return self._send(celery, name, args, task_id, options)
+        task_id = task_id or str(uuid.uuid4())
+        entry = json.dumps(
+            {
+                "task_id": task_id,
+                "name": name,
+                "args": args,
+                "options": options,
+                "cost": max(cost, 1),
+                "submitted_at": time.time(),
+                "author_id": author_id,
+                "lane": lane,
+            }
+        )
+        lane_users = users_key(queue, lane)
+        try:
+            self.Redis.register_script(_PUSH)(
+                keys=[
+                    user_key(queue, lane, author_id),
+                    f"{lane_users}:active",
+                    lane_users,
+                    f"{lanes_key(queue)}:active",
+                    lanes_key(queue),
+                    f"{PREFIX}:{queue}:weights",
+                ],
+                args=[author_id, entry, lane, share],
+            )
+        except Exception as e:
+            logger.warning(f"Could not queue {task_id} for {author_id}: {e}")
+            return self._send(celery, name, args, task_id, options)
+        return task_id
+
+    def dispatch(self, celery: Celery) -> list[dict]:
+        """
+        Tops up every fair queue to its target depth from the sub-queues,
+        returns the tasks sent. Only one web process dispatches at a time.
+        """
+        token = str(uuid.uuid4())
+        if not self.Redis.set(DISPATCHER_LOCK, token, nx=True, ex=60):
+            return []
+        try:
+            dispatched = []
+            for queue, target_depth in self.target_depths.items():
+                budget = target_depth - self.broker_depth(queue)
+                if budget > 0:
+                    dispatched += self._dispatch_queue(celery, queue, budget)
+            return dispatched
+        finally:
+            self.Redis.register_script(_UNLOCK)(
+                keys=[DISPATCHER_LOCK], args=[token]
+            )
+
+    def broker_depth(self, queue: str) -> int:
+        # tasks waiting in the celery queue, across its priority steps
+        pipeline = self.Redis.pipeline(transaction=False)
+        for key in broker_queue_keys(queue):
+            pipeline.llen(key)
+        return sum(pipeline.execute())
+
+    def pending(self) -> dict[str, dict]:
+        # the users with tasks in the sub-queues and the number of those tasks
+        pending = {}
+        for queue in self.target_depths:
+            users = self._users(queue)
+            pipeline = self.Redis.pipeline(transaction=False)
+            for key in users:
+                pipeline.llen(key)
+            pending[queue] = {
+                "lanes": len({lane for lane, _ in users.values()}),
+                "users": len(users),
+                "tasks": sum(pipeline.execute()),
+            }
+        return pending
+
+    def max_wait_seconds(self) -> dict[str, float]:
+        # how long the oldest task of each fair queue has been waiting in it
+        now = time.time()
+        waits = {}
+        for queue in self.target_depths:
+            pipeline = self.Redis.pipeline(transaction=False)
+            for key in self._users(queue):
+                pipeline.lindex(key, 0)
+            submitted = [
+                json.loads(entry)["submitted_at"]
+                for entry in pipeline.execute()
+                if entry
+            ]
+            waits[queue] = max(now - min(submitted), 0) if submitted else 0
+        return waits
+
+    def _users(self, queue: str) -> dict[str, tuple[str, str]]:
+        # the sub-queue key of every user with tasks in `queue`: (lane, user)
+        lanes = [
+            _decode(lane) for lane in self.Redis.lrange(lanes_key(queue), 0, -1)
+        ]
+        return {
+            user_key(queue, lane, _decode(user)): (lane, _decode(user))
+            for lane in lanes
+            for user in self.Redis.lrange(users_key(queue, lane), 0, -1)
+        }
+
+    def _dispatch_queue(
+        self, celery: Celery, queue: str, budget: int
+    ) -> list[dict]:
+        """
+        Deficit round robin over the lanes of `queue`, from where the last
+        dispatch stopped, until `budget` tasks were sent or none are left.
+        """
+        lanes = _Ring(self.Redis, lanes_key(queue))
+        weights = {
+            _decode(lane): float(weight)
+            for lane, weight in self.Redis.hgetall(
+                f"{PREFIX}:{queue}:weights"
+            ).items()
+        }
+        dispatched = []
+        while len(dispatched) < budget and lanes.members:
+            lane = lanes.current()
+            quantum = self.quantum * weights.get(lane, 1)
+            deficit = lanes.deficits.get(lane, 0) + quantum
+            sent, deficit, empty = self._serve_lane(
+                celery, queue, lane, deficit, budget - len(dispatched)
+            )
+            dispatched += sent
+            if empty:
+                if lanes.retire(users_key(queue, lane)):
+                    continue
+            elif len(dispatched) >= budget and deficit >= 1:
+                # out of budget mid-turn, the lane resumes its turn next time
+                lanes.deficits[lane] = deficit - quantum
+                break
+            # an idle lane does not bank credit for later
+            lanes.advance(deficit if not empty else 0)
+        lanes.save()
+        return dispatched
+
+    def _serve_lane(
+        self,
+        celery: Celery,
+        queue: str,
+        lane: str,
+        lane_deficit: float,
+        budget: int,
+    ) -> tuple[list[dict], float, bool]:
+        # round robin over the users of `lane` while its deficit lasts
+        users = _Ring(self.Redis, users_key(queue, lane))
+        sent = []
+        while len(sent) < budget and users.members:
+            user = users.current()
+            deficit = users.deficits.get(user, 0) + self.quantum
+            key = user_key(queue, lane, user)
+            served, deficit, head_cost = self._serve_user(
+                celery, queue, key, deficit, lane_deficit, budget - len(sent)
+            )
+            sent += served
+            lane_deficit -= sum(task["cost"] for task in served)
+            if head_cost is None:
+                if users.retire(key):
+                    continue
+            elif head_cost <= deficit:
+                # out of lane credit or budget mid-turn, the turn of the user
+                # resumes with the next turn of the lane
+                users.deficits[user] = deficit - self.quantum
+                break
+            users.advance(deficit if head_cost is not None else 0)
+        users.save()
+        return sent, lane_deficit, not users.members
+
+    def _serve_user(
+        self,
+        celery: Celery,
+        queue: str,
+        key: str,
+        deficit: float,
+        lane_deficit: float,
+        budget: int,
+    ) -> tuple[list[dict], float, int | None]:
+        """
+        Sends the tasks queued under `key` that both deficits cover, up to
+        `budget`. Returns them, what is left of the user's deficit and the
+        cost of the next task, None when there is none.
+        """
+        sent = []
+        while True:
+            head = self.Redis.lindex(key, 0)
+            if head is None:
+                return sent, deficit, None
+            entry = json.loads(head)
+            if len(sent) >= budget or entry["cost"] > min(
+                deficit, lane_deficit
+            ):
+                return sent, deficit, entry["cost"]
+            self.Redis.lpop(key)
+            try:
+                self._send(
+                    celery,
+                    entry["name"],
+                    entry["args"],
+                    entry["task_id"],
+                    entry["options"],
+                )
+            except Exception:
+                # back at the head of the sub-queue for the next dispatch
+                self.Redis.lpush(key, head)
+                raise
+            deficit -= entry["cost"]
+            lane_deficit -= entry["cost"]
+            sent.append(
+                {
+                    "id": entry["task_id"],
+                    "name": entry["name"],
+                    "queue": queue,
+                    "lane": entry["lane"],
+                    "author_id": entry["author_id"],
+                    "cost": entry["cost"],
+                    "wait_seconds": time.time() - entry["submitted_at"],
+                }
+            )
+
+    def _send(
+        self,
+        celery: Celery,
+        name: str,
+        args: list,
+        task_id: str | None,
+        options: dict,
+    ) -> str:
+        task = celery.signature(name, args=args).apply_async(
+            task_id=task_id, **options
+        )
+        return task.id
+
+
+@lru_cache
+def get_fair_queue() -> FairQueue:
+    return FairQueue(
+        get_redis(),
+        get_settings().FAIR_QUEUES,
+        get_settings().FAIR_QUEUE_QUANTUM,
+    )
@@ -0,0 +1,121 @@
+"""
+Remembers URLs that failed to archive recently, so resubmitting them (by
+sheets or API clients) does not cost another orchestrator run while the
+failure likely still holds: deleted posts, private accounts, invalid URLs.
+
+Entries are keyed by the normalized URL and expire after a TTL that depends
+on the failure class, see app/shared/failures.py and
+NEGATIVE_CACHE_TTL_SECONDS. Classes without a TTL are never cached. A
+successful archive of the URL removes its entry. Redis errors are logged and
+let everything through.
+"""
+
+import hashlib
+import json
+import time
+from functools import lru_cache
+from typing import Iterable, Iterator
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import redis
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
+
+
+PREFIX = "negative-cache"
+
+# query parameters that never change what a URL points to
+_TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "si", "feature", "ref_src"}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Lowercase scheme and host without "www.", default ports, fragments,
+    trailing slashes and tracking parameters, with sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").removeprefix("www.")
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in _TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    return urlunsplit(
+        (
+            parts.scheme.lower() or "https",
+            host,
+            parts.path.rstrip("/"),
+            urlencode(query),
+            "",
+        )
+    )
+
+
+def cache_key(url: str) -> str:
+    digest = hashlib.sha256(normalize_url(url).encode()).hexdigest()
+    return f"{PREFIX}:{digest}"
+
+
+class NegativeCache:
+    def __init__(self, Redis: redis.Redis):
+        self.Redis = Redis
+
+    def record(self, url: str, failure_class: str, error: str = "") -> bool:
+        # remembers the failure if its class has a TTL, returns if it did
+        ttl = get_settings().NEGATIVE_CACHE_TTL_SECONDS.get(failure_class, 0)
+        if not url or ttl <= 0:
+            return False
+        entry = {
+            "failure_class": failure_class,
+            "error": error[:500],
+            "failed_at": time.time(),
+        }
+        try:
+            self.Redis.set(cache_key(url), json.dumps(entry), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Could not cache failure of {url}: {e}")
+            return False
+        return True
+
+    def get(self, url: str) -> dict | None:
+        """
+        The recent failure of `url`: failure_class, error, failed_at and
+        retry_after (seconds until it expires), or None.
+        """
+        key = cache_key(url)
+        try:
+            pipeline = self.Redis.pipeline(transaction=False)
+            pipeline.get(key)
+            pipeline.ttl(key)
+            entry, ttl = pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Could not check failure cache for {url}: {e}")
+            return None
+        if not entry:
+            return None
+        return {**json.loads(entry), "retry_after": max(ttl, 0)}
+
+    def forget(self, url: str) -> None:
+        try:
+            self.Redis.delete(cache_key(url))
+        except Exception as e:
+            logger.warning(f"Could not clear failure cache for {url}: {e}")
+
+    def gate(self, items: Iterable, suppressed: list[dict]) -> Iterator:
+        """
+        Yields the feeder items (Metadata) whose URL did not fail recently,
+        the failures of the others are appended to `suppressed`.
+        """
+        for item in items:
+            if failure := self.get(item.get_url()):
+                suppressed.append(failure)
+                continue
+            yield item
+
+
+@lru_cache
+def get_negative_cache() -> NegativeCache:
+    return NegativeCache(get_redis())
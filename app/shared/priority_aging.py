@@ -0,0 +1,127 @@
+"""
+Priority aging, so low priority tasks cannot starve: workers consume
+high_priority before low_priority (`queue_order_strategy: priority`), and a
+steady stream of high priority work would otherwise keep low priority tasks
+waiting in the broker for as long as it lasts.
+
+Every task is stamped with the time it entered the broker (see
+task_messaging.stamp_submitted_at). A web cronjob moves the low priority
+tasks that waited longer than PRIORITY_AGING_SECONDS to the front of the high
+priority queue of their pool, at most PRIORITY_AGING_MAX_PER_RUN per queue
+and run, which bounds how much of the workers aged tasks take from high
+priority work. It also reports the age of the oldest task of every queue, the
+wait a latency objective of the default group is measured against.
+
+Time spent in the fair queues (app/shared/fair_queue.py) before reaching the
+broker does not count towards aging: the fair queues only hold tasks back
+while the low priority queue is busy, and promoting those would send every
+queued task ahead of high priority work.
+"""
+
+import json
+import time
+from functools import lru_cache
+
+import redis
+from app.shared.log import logger
+from app.shared.task_messaging import broker_queue_keys, get_redis, queue_name
+
+
+# the low priority queues and the high priority queue their tasks age into
+AGING_QUEUES = {
+    queue_name("low", sheet): queue_name("high", sheet)
+    for sheet in (False, True)
+}
+
+# moves the oldest message of KEYS[1] to the front of KEYS[2], unless a
+# worker took it since it was read
+_PROMOTE = """
+if redis.call('LINDEX', KEYS[1], -1) ~= ARGV[1] then
+    return 0
+end
+redis.call('RPOP', KEYS[1])
+redis.call('RPUSH', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def _submitted_at(message: bytes | str | None) -> float | None:
+    try:
+        return float(json.loads(message)["headers"]["submitted_at"])
+    except (TypeError, ValueError, KeyError):
+        # empty list, or sent before messages were stamped
+        return None
+
+
+def _aged(message: bytes, queue: str, to_queue: str) -> tuple[str, str]:
+    # the task id and the message, as if it had been sent to `to_queue`
+    aged = json.loads(message)
+    aged["headers"]["promoted_from"] = queue
+    properties = aged["properties"]
+    properties["priority"] = 0
+    # where the broker restores it if its worker dies
+    properties["delivery_info"]["routing_key"] = to_queue
+    return aged["headers"].get("id"), json.dumps(aged)
+
+
+class PriorityAging:
+    def __init__(self, Redis: redis.Redis):
+        self.Redis = Redis
+
+    def max_wait_seconds(self, queue: str) -> float:
+        # how long the oldest task of the celery queue has been waiting in it
+        pipeline = self.Redis.pipeline(transaction=False)
+        for key in broker_queue_keys(queue):
+            # producers push to the left, workers pop from the right
+            pipeline.lindex(key, -1)
+        submitted = [at for at in map(_submitted_at, pipeline.execute()) if at]
+        if not submitted:
+            return 0
+        return max(time.time() - min(submitted), 0)
+
+    def promote_aged(
+        self, older_than_seconds: float, limit: int
+    ) -> dict[str, list[str]]:
+        # promotes the aged tasks of every queue in AGING_QUEUES
+        promoted = {}
+        for queue, to_queue in AGING_QUEUES.items():
+            try:
+                promoted[queue] = self.promote(
+                    queue, to_queue, older_than_seconds, limit
+                )
+            except Exception as e:
+                logger.warning(f"Could not promote aged tasks of {queue}: {e}")
+                promoted[queue] = []
+        return promoted
+
+    def promote(
+        self, queue: str, to_queue: str, older_than_seconds: float, limit: int
+    ) -> list[str]:
+        """
+        Moves up to `limit` tasks that waited in `queue` for longer than
+        `older_than_seconds` to the front of `to_queue`. Returns the ids of
+        the tasks moved.
+        """
+        promote = self.Redis.register_script(_PROMOTE)
+        promoted = []
+        for key in broker_queue_keys(queue):
+            while len(promoted) < limit:
+                message = self.Redis.lindex(key, -1)
+                submitted_at = _submitted_at(message)
+                if not submitted_at:
+                    break
+                if time.time() - submitted_at < older_than_seconds:
+                    break
+                task_id, aged = _aged(message, queue, to_queue)
+                if promote(keys=[key, to_queue], args=[message, aged]):
+                    logger.info(
+                        f"Promoted {task_id} from {queue} to {to_queue} "
+                        f"after {time.time() - submitted_at:.0f}s"
+                    )
+                    promoted.append(task_id)
+        return promoted
+
+
+@lru_cache
+def get_priority_aging() -> PriorityAging:
+    return PriorityAging(get_redis())
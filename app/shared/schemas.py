@@ -10,6 +10,8 @@ class SubmitSheet(BaseModel):
     author_id: str | None = None
     group_id: str = "default"
     tags: set[str] | None = set()
+    # also archive rows whose URL failed recently, see negative_cache.py
+    force: bool = False
 
 
 class ArchiveUrl(BaseModel):
@@ -32,11 +34,29 @@ class Task(BaseModel):
     id: str
 
 
+class UrlTask(Task):
+    url: str
+
+
+class BatchTask(Task):
+    # None when every URL was reused, followed another task or failed
+    id: str | None
+    tasks: list[UrlTask]
+
+
 class TaskResult(Task):
     status: str
     result: str
 
 
+class ArchiveResultRef(BaseModel):
+    # what URL archiving tasks keep in the celery result backend, /task/{id}
+    # resolves it to the full result stored with the archive
+    archive_id: str
+    status: str
+    url: str
+
+
 class DeleteResponse(Task):
     deleted: bool
 
@@ -66,12 +86,17 @@ class ArchiveTrigger(BaseModel):
     tags: set[str] | None = None
 
 
+class ArchiveBatchTrigger(BaseModel):
+    archives: Annotated[list[ArchiveTrigger], Len(min_length=1)]
+
+
 class ArchiveCreate(ArchiveTrigger):
     id: str | None = None
     result: dict | None = None
     sheet_id: str | None = None
     urls: list | None = None
     store_until: datetime | None = None
+    source_archive_id: str | None = None
 
 
 class Archive(ArchiveCreate):
@@ -97,6 +122,11 @@ class CelerySheetTask(BaseModel):
     sheet_id: str
     time: datetime
     stats: dict
+    # id of the first run, runs > 1 when this one resumed interrupted runs
+    run_id: str | None = None
+    runs: int = 1
+    # set when skipped because this run of the sheet was already active
+    active_task_id: str | None = None
 
 
 class SubmitManualArchive(ArchiveTrigger):
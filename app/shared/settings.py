@@ -1,12 +1,22 @@
 import os
 from functools import lru_cache
-from typing import Annotated, Set
+from typing import Annotated, Literal, Set
 
 from annotated_types import Len
 from fastapi_mail import ConnectionConfig
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class DomainLimit(BaseModel):
+    # requests started per minute across all workers, 0 for no limit
+    per_minute: float = 0
+    # requests that can start back to back after the domain was idle
+    burst: int = 1
+    # requests in progress at the same time across all workers, 0 for no limit
+    max_concurrency: int = 0
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=os.environ.get("ENVIRONMENT_FILE"),
@@ -41,6 +51,20 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: str = ""
     REDIS_HOSTNAME: str = "localhost"
     REDIS_EXCEPTIONS_CHANNEL: str = "exceptions-channel"
+    REDIS_WORKER_METRICS_CHANNEL: str = "worker-metrics-channel"
+    # sheet tasks publish the exceptions of their rows, counted by
+    # fingerprint, this often and once they end
+    EXCEPTION_SUMMARY_INTERVAL_SECONDS: int = 60
+    # worker tasks publish the durations of their phases in one batch this
+    # often and once they end
+    TASK_PHASE_INTERVAL_SECONDS: int = 60
+    # bumped whenever the user-groups config is reloaded into the database
+    REDIS_GROUP_CONFIG_VERSION_KEY: str = "group-config-version"
+    # sheet task progress streams, capped at MAXLEN events and expiring with
+    # the celery task results
+    REDIS_SHEET_PROGRESS_PREFIX: str = "sheet-progress"
+    SHEET_PROGRESS_MAXLEN: int = 1000
+    SHEET_PROGRESS_TTL_SECONDS: int = 24 * 60 * 60
 
     @property
     def celery_broker_url(self) -> str:
@@ -48,12 +72,115 @@ class Settings(BaseSettings):
             return f"redis://:{self.REDIS_PASSWORD}@{self.REDIS_HOSTNAME}:6379"
         return f"redis://{self.REDIS_HOSTNAME}:6379"
 
+    # worker
+    # celery pool of the URL workers: prefork runs one process per slot,
+    # threads and gevent run every slot in one process, which fits many more
+    # slots in the same memory for IO-bound archiving. Pass it with --pool
+    # too (docker-compose does), gevent needs its monkey patching from the
+    # command line. Celery has no hard time limits and no memory recycling
+    # for threads and gevent
+    WORKER_POOL: Literal["prefork", "threads", "gevent"] = "prefork"
+    # worker children are replaced after the task during which their peak RSS
+    # went over this many MB, 0 to never replace them
+    WORKER_MAX_RSS_MB: int = 1536
+    # SQLite connections a worker keeps open per slot, and how many more it
+    # opens under load, the web keeps 15 + 20
+    WORKER_DB_POOL_SIZE: int = 1
+    WORKER_DB_MAX_OVERFLOW: int = 2
+    # how many set-up orchestrators each worker process keeps warm, LRU evicted
+    ORCHESTRATOR_POOL_SIZE: int = 4
+    # max URLs accepted by a single /url/archive/batch request
+    ARCHIVE_BATCH_MAX_URLS: int = 500
+    # sheet results are inserted in one transaction every N rows or T seconds
+    SHEET_WRITE_BUFFER_ROWS: int = 50
+    SHEET_WRITE_BUFFER_SECONDS: int = 30
+    # how long a worker process reuses a group's settings without a new query
+    GROUP_SNAPSHOT_TTL_SECONDS: int = 300
+    # queues whose tasks are sent round robin between their authors (see
+    # app/shared/fair_queue.py) with the depth each celery queue is kept at,
+    # and the credit in URLs each author gets per round
+    FAIR_QUEUES: dict[str, int] = {"low_priority": 20, "sheet_low_priority": 2}
+    FAIR_QUEUE_QUANTUM: int = 10
+    FAIR_QUEUE_DISPATCH_SECONDS: int = 2
+    # low priority tasks waiting in the broker for longer than this are moved
+    # to the front of the high priority queue, at most N per queue every
+    # minute (see app/shared/priority_aging.py), 0 to never promote them
+    PRIORITY_AGING_SECONDS: int = 30 * 60
+    PRIORITY_AGING_MAX_PER_RUN: int = 5
+    # a sheet run holds a lease on its sheet while queued, and a shorter one
+    # renewed every TASK_HEARTBEAT_INTERVAL_SECONDS while running; the cron
+    # and manual triggers do not send another run of a leased sheet
+    SHEET_LEASE_QUEUED_SECONDS: int = 6 * 60 * 60
+    SHEET_LEASE_SECONDS: int = 10 * 60
+    # a sheet run that stopped early resumes from its checkpoint if the next
+    # run starts within this many seconds, otherwise it starts over
+    SHEET_CHECKPOINT_MAX_AGE_SECONDS: int = 2 * 24 * 60 * 60
+    # sharded sheets (see max_sheet_fan_out) get at least this many rows/shard
+    SHEET_SHARD_MIN_ROWS: int = 25
+    # per URL host limits shared by all workers, subdomains included, as JSON
+    # eg: {"x.com": {"per_minute": 30, "burst": 5, "max_concurrency": 3}}
+    DOMAIN_LIMITS: dict[str, DomainLimit] = {}
+    # countdown for tasks requeued while their domain is at max_concurrency
+    DOMAIN_LIMIT_RETRY_SECONDS: int = 30
+    # domains worker timings are labeled with, on top of the DOMAIN_LIMITS
+    # ones, any other domain is labeled "other" to keep the cardinality low
+    METRIC_DOMAINS: Set[str] = {
+        "x.com",
+        "twitter.com",
+        "facebook.com",
+        "instagram.com",
+        "youtube.com",
+        "tiktok.com",
+        "t.me",
+        "telegram.org",
+        "vk.com",
+        "reddit.com",
+        "bsky.app",
+    }
+    # identical /url/archive requests are coalesced into one task while it
+    # is queued or runs: the lock is held for QUEUED_SECONDS until the task
+    # starts, then for LOCK_SECONDS, which must outlive a create_archive_task
+    # and its retry, at the longest URL_TIME_LIMIT_CEILING_SECONDS +
+    # ADAPTIVE_TIME_LIMIT_GRACE_SECONDS
+    ARCHIVE_SINGLEFLIGHT_QUEUED_SECONDS: int = 6 * 60 * 60
+    ARCHIVE_SINGLEFLIGHT_LOCK_SECONDS: int = 105 * 60
+    # per URL host and per sheet time limits learned from recent durations:
+    # soft = p99 x FACTOR within [FLOOR, CEILING], hard = soft + GRACE, only
+    # once MIN_SAMPLES of the last WINDOW durations are known
+    ADAPTIVE_TIME_LIMITS: bool = True
+    ADAPTIVE_TIME_LIMIT_WINDOW: int = 500
+    ADAPTIVE_TIME_LIMIT_MIN_SAMPLES: int = 20
+    ADAPTIVE_TIME_LIMIT_FACTOR: float = 3.0
+    ADAPTIVE_TIME_LIMIT_GRACE_SECONDS: int = 5 * 60
+    # durations of hosts and sheets not archived for this long are forgotten
+    ADAPTIVE_TIME_LIMIT_TTL_SECONDS: int = 14 * 24 * 60 * 60
+    URL_TIME_LIMIT_FLOOR_SECONDS: int = 5 * 60
+    URL_TIME_LIMIT_CEILING_SECONDS: int = 45 * 60
+    SHEET_TIME_LIMIT_FLOOR_SECONDS: int = 30 * 60
+    SHEET_TIME_LIMIT_CEILING_SECONDS: int = 6 * 60 * 60
+    # URLs that failed are not archived again for this long, by failure class
+    # (see app/shared/failures.py), classes not listed are never remembered
+    NEGATIVE_CACHE_TTL_SECONDS: dict[str, int] = {
+        "invalid_url": 7 * 24 * 60 * 60,
+        "not_found": 6 * 60 * 60,
+        "removed": 24 * 60 * 60,
+        "unsupported": 24 * 60 * 60,
+        "client_error": 60 * 60,
+        "nothing_archived": 60 * 60,
+        "rate_limited": 10 * 60,
+    }
+    # running tasks refresh a heartbeat every INTERVAL, the web requeues those
+    # whose heartbeat is older than DEAD as their worker is gone, 0 to disable
+    TASK_HEARTBEAT_INTERVAL_SECONDS: int = 30
+    TASK_HEARTBEAT_DEAD_SECONDS: int = 5 * 60
+
     # cronjobs
     CRON_ARCHIVE_SHEETS: bool = False
     CRON_DELETE_STALE_SHEETS: bool = False
     DELETE_STALE_SHEETS_DAYS: int = 14
     CRON_DELETE_SCHEDULED_ARCHIVES: bool = False
     DELETE_SCHEDULED_ARCHIVES_CHECK_EVERY_N_DAYS: int = 7
+    CRON_REQUEUE_ORPHANED_TASKS: bool = True
 
     # observability
     REPEAT_COUNT_METRICS_SECONDS: int = 30
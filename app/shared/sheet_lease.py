@@ -0,0 +1,167 @@
+"""
+One run of a sheet at a time: a run holds a Redis lease on its sheet id with
+its task id from the moment it is sent, through the time it waits in the
+queue, until it ends. The cron and /sheet/{id}/archive do not send another
+run of a leased sheet, they report the task id of the active one instead.
+
+While the task runs it renews a short lease, so one that stopped being renewed
+(eg: its worker died and the task was never redelivered) frees the sheet
+within SHEET_LEASE_SECONDS. A task resumed under the same id (redelivered,
+requeued) takes its lease back. Redis errors are logged and let the run go
+ahead, as before there were leases.
+"""
+
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Iterator
+
+import redis
+from app.shared.log import logger
+from app.shared.task_messaging import get_redis
+
+
+PREFIX = "sheet-lease"
+
+# takes the lease if it is free or already held by ARGV[1]
+_CLAIM = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return {0, holder}
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return {1, ARGV[1]}
+"""
+
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(sheet_id: str) -> str:
+    return f"{PREFIX}:{sheet_id}"
+
+
+class Lease:
+    # handle of a lease held by a running task, see SheetLeases.holding
+    def __init__(self):
+        self.keep_seconds = None
+
+    def keep(self, seconds: int) -> None:
+        """
+        Keeps the lease for `seconds` once the task ends instead of releasing
+        it, for runs that continue elsewhere under the same lease: a requeue
+        or the shards of the sheet.
+        """
+        self.keep_seconds = seconds
+
+
+class SheetLeases:
+    def __init__(self, Redis: redis.Redis):
+        self.Redis = Redis
+
+    def claim(
+        self, sheet_id: str, task_id: str, ttl_seconds: int
+    ) -> tuple[bool, str]:
+        """
+        Leases the sheet to `task_id` for `ttl_seconds` unless another task
+        holds it. Returns (claimed, task id holding the lease).
+        """
+        try:
+            claimed, holder = self.Redis.register_script(_CLAIM)(
+                keys=[lease_key(sheet_id)], args=[task_id, int(ttl_seconds)]
+            )
+        except Exception as e:
+            logger.warning(f"Could not lease sheet {sheet_id}: {e}")
+            return True, task_id
+        if isinstance(holder, bytes):
+            holder = holder.decode()
+        return bool(claimed), holder
+
+    def send_once(
+        self, sheet_id: str, send: Callable[[str], str], ttl_seconds: int
+    ) -> tuple[str, bool]:
+        """
+        Calls `send` with a new task id, which must send the sheet task with
+        it and return its id, unless a run of the sheet is active. Returns
+        (task id, sent), the task id of the active run when nothing was sent.
+        """
+        candidate_id = str(uuid.uuid4())
+        claimed, holder = self.claim(sheet_id, candidate_id, ttl_seconds)
+        if not claimed:
+            logger.info(f"Sheet {sheet_id} already has an active run {holder}")
+            return holder, False
+        try:
+            task_id = send(candidate_id)
+        except BaseException:
+            self.release(sheet_id, candidate_id)
+            raise
+        return task_id, True
+
+    def release(self, sheet_id: str, task_id: str) -> None:
+        # only ever releases the lease of `task_id`
+        try:
+            self.Redis.register_script(_RELEASE)(
+                keys=[lease_key(sheet_id)], args=[task_id]
+            )
+        except Exception as e:
+            logger.warning(f"Could not release lease of sheet {sheet_id}: {e}")
+
+    @contextmanager
+    def holding(
+        self,
+        sheet_id: str,
+        task_id: str,
+        ttl_seconds: int,
+        interval_seconds: float,
+    ) -> Iterator[Lease]:
+        """
+        Renews the lease of `task_id` every `interval_seconds` for the
+        duration of the block, and releases it after unless Lease.keep was
+        called.
+        """
+        lease = Lease()
+        if interval_seconds <= 0:
+            interval_seconds = ttl_seconds / 3
+        stop = threading.Event()
+        renewer = threading.Thread(
+            target=self._renew,
+            args=(sheet_id, task_id, ttl_seconds, interval_seconds, stop),
+            name=f"sheet-lease-{sheet_id}",
+            daemon=True,
+        )
+        renewer.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            renewer.join()
+            if lease.keep_seconds:
+                self.claim(sheet_id, task_id, lease.keep_seconds)
+            else:
+                self.release(sheet_id, task_id)
+
+    def _renew(
+        self,
+        sheet_id: str,
+        task_id: str,
+        ttl_seconds: int,
+        interval_seconds: float,
+        stop: threading.Event,
+    ) -> None:
+        while not stop.wait(interval_seconds):
+            claimed, holder = self.claim(sheet_id, task_id, ttl_seconds)
+            if not claimed:
+                logger.warning(
+                    f"Lease of sheet {sheet_id} taken by {holder} while "
+                    f"{task_id} runs"
+                )
+
+
+@lru_cache
+def get_sheet_leases() -> SheetLeases:
+    return SheetLeases(get_redis())
@@ -0,0 +1,106 @@
+"""
+Live progress of sheet tasks: the worker appends one event per archived row
+to a Redis Stream named after the sheet task id, and the web streams those
+events to clients as Server-Sent Events, see app/web/routers/task.py.
+
+Events are "start", "row", "sharded" and "done". Each carries a JSON payload.
+"done" is always the last event of a stream. The stream is capped and
+expires, and a subscriber arriving late first gets every event still in it.
+
+The archived/failed counters of a sheet task are kept in one Redis hash next
+to its stream, which its shards increment too, so every "row" event carries
+the totals of the whole sheet.
+"""
+
+import json
+import time
+
+import redis
+from app.shared.log import logger
+from app.shared.settings import get_settings
+
+
+DONE = "done"
+
+
+def stream_key(task_id: str) -> str:
+    return f"{get_settings().REDIS_SHEET_PROGRESS_PREFIX}:{task_id}"
+
+
+def counters_key(task_id: str) -> str:
+    return f"{stream_key(task_id)}:counters"
+
+
+class SheetProgress:
+    """
+    Publishes the progress of one sheet task, or of one shard of it into the
+    stream of the sheet task it belongs to. Never raises: progress is stopped
+    for the rest of the task on the first Redis error.
+    """
+
+    def __init__(
+        self,
+        Redis: redis.Redis,
+        task_id: str,
+        sheet_id: str,
+        shard_id: str | None = None,
+    ):
+        self.Redis = Redis
+        self.key = stream_key(task_id)
+        self.counters_key = counters_key(task_id)
+        self.sheet_id = sheet_id
+        self.shard_id = shard_id
+        self.started_at = time.time()
+        self.enabled = True
+
+    def start(self) -> None:
+        self.publish("start")
+
+    def row(self, url: str | None, success: bool) -> None:
+        if not self.enabled:
+            return
+        try:
+            pipeline = self.Redis.pipeline(transaction=True)
+            pipeline.hsetnx(self.counters_key, "started_at", self.started_at)
+            pipeline.hincrby(self.counters_key, "archived", int(success))
+            pipeline.hincrby(self.counters_key, "failed", int(not success))
+            pipeline.hget(self.counters_key, "started_at")
+            pipeline.expire(
+                self.counters_key, get_settings().SHEET_PROGRESS_TTL_SECONDS
+            )
+            _, archived, failed, started_at, _ = pipeline.execute()
+        except Exception as e:
+            self.disable(e)
+            return
+        minutes = max(time.time() - float(started_at), 1) / 60
+        self.publish(
+            "row",
+            url=url,
+            archived=archived,
+            failed=failed,
+            rows_per_minute=round((archived + failed) / minutes, 2),
+        )
+
+    def publish(self, event: str, **data) -> None:
+        if not self.enabled:
+            return
+        data["sheet_id"] = self.sheet_id
+        if self.shard_id:
+            data["shard"] = self.shard_id
+        settings = get_settings()
+        try:
+            pipeline = self.Redis.pipeline(transaction=False)
+            pipeline.xadd(
+                self.key,
+                {"event": event, "data": json.dumps(data, default=str)},
+                maxlen=settings.SHEET_PROGRESS_MAXLEN,
+                approximate=True,
+            )
+            pipeline.expire(self.key, settings.SHEET_PROGRESS_TTL_SECONDS)
+            pipeline.execute()
+        except Exception as e:
+            self.disable(e)
+
+    def disable(self, error: Exception) -> None:
+        logger.warning(f"Sheet progress disabled for {self.key}: {error}")
+        self.enabled = False
@@ -0,0 +1,111 @@
+"""
+Coalesces concurrent archive requests of the same URL for the same group into
+a single create_archive_task: the first request becomes the leader and holds a
+Redis lock with its task id, requests arriving while the lock is held become
+followers of that leader and are resolved by it once it finishes.
+
+Both joining and finishing are single Lua scripts, so a follower can never be
+registered after its leader has already collected the followers list. A leader
+only ever releases its own lock, and the lock expires on its own if the worker
+running the leader dies and the task is never redelivered.
+
+The lock is first taken for as long as the leader may wait in the queues, and
+shortened to the length of a run once the leader starts (see refresh). The
+followers list always expires with the lock, never before it.
+"""
+
+import hashlib
+
+import redis
+
+
+LOCK_PREFIX = "singleflight:lock"
+FOLLOWERS_PREFIX = "singleflight:followers"
+
+_JOIN = """
+local leader = redis.call('GET', KEYS[1])
+if not leader then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return {1, ARGV[1]}
+end
+local followers = ARGV[4] .. ':' .. leader
+redis.call('RPUSH', followers, ARGV[2])
+local ttl = redis.call('TTL', KEYS[1])
+redis.call('EXPIRE', followers, ttl > 0 and ttl or ARGV[3])
+return {0, leader}
+"""
+
+_REFRESH = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', ARGV[3] .. ':' .. ARGV[1], ARGV[2])
+return 1
+"""
+
+_FINISH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+local followers = ARGV[2] .. ':' .. ARGV[1]
+local pending = redis.call('LRANGE', followers, 0, -1)
+redis.call('DEL', followers)
+return pending
+"""
+
+
+def lock_key(group_id: str, url: str) -> str:
+    url_hash = hashlib.sha256(url.encode()).hexdigest()
+    return f"{LOCK_PREFIX}:{group_id}:{url_hash}"
+
+
+def join(
+    Redis: redis.Redis,
+    group_id: str,
+    url: str,
+    candidate_id: str,
+    follower_json: str,
+    ttl_seconds: int,
+) -> tuple[bool, str]:
+    """
+    Becomes the leader for (group_id, url) with `candidate_id` as its task id
+    if there is none, otherwise registers `follower_json` with the current
+    leader. Returns (is_leader, leader task id).
+    """
+    is_leader, leader_id = Redis.register_script(_JOIN)(
+        keys=[lock_key(group_id, url)],
+        args=[candidate_id, follower_json, ttl_seconds, FOLLOWERS_PREFIX],
+    )
+    if isinstance(leader_id, bytes):
+        leader_id = leader_id.decode()
+    return bool(is_leader), leader_id
+
+
+def refresh(
+    Redis: redis.Redis, group_id: str, url: str, leader_id: str, ttl: int
+) -> bool:
+    """
+    Sets the lock of `leader_id` and its followers to expire in `ttl`
+    seconds, when the leader starts running. Returns False if the lock is
+    not held by `leader_id`, which is then not a singleflight leader.
+    """
+    return bool(
+        Redis.register_script(_REFRESH)(
+            keys=[lock_key(group_id, url)],
+            args=[leader_id, ttl, FOLLOWERS_PREFIX],
+        )
+    )
+
+
+def finish(
+    Redis: redis.Redis, group_id: str, url: str, leader_id: str
+) -> list[str]:
+    """
+    Releases the lock if `leader_id` still holds it and returns the JSON of
+    every follower that joined it, which the caller must now resolve.
+    """
+    pending = Redis.register_script(_FINISH)(
+        keys=[lock_key(group_id, url)], args=[leader_id, FOLLOWERS_PREFIX]
+    )
+    return [p.decode() if isinstance(p, bytes) else p for p in pending]
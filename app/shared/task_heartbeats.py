@@ -0,0 +1,156 @@
+"""
+Fast recovery of tasks whose worker died: while a task runs, a background
+thread in the worker refreshes its heartbeat in Redis, and a cronjob in the
+web process puts the broker message of any task whose heartbeat stopped back
+in its queue.
+
+That is what the broker's visibility_timeout does for unacknowledged messages,
+but it has to outlive the longest sheet task (12h). A heartbeat stops within
+TASK_HEARTBEAT_DEAD_SECONDS of the worker dying, whatever the task time limit.
+
+Tasks that end, fail or are rejected by a surviving worker remove their
+heartbeat or no longer have an unacknowledged message, so only tasks lost
+with their worker are requeued.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+
+from celery import Celery
+
+import redis
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
+
+
+HEARTBEATS = "task-heartbeats"
+DETAILS = "task-heartbeats:details"
+
+# claims a heartbeat that is still dead, so only one web process handles it
+_CLAIM = """
+local beat = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not beat or tonumber(beat) > tonumber(ARGV[2]) then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+local details = redis.call('HGET', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+return details or ''
+"""
+
+
+class TaskHeartbeats:
+    """
+    Registry of the heartbeats of running tasks: a sorted set of task ids by
+    last beat, and a hash with what is needed to requeue each of them. Redis
+    errors are logged and never fail the task or the cronjob.
+    """
+
+    def __init__(self, Redis: redis.Redis, interval_seconds: float):
+        self.Redis = Redis
+        self.interval = interval_seconds
+
+    @contextmanager
+    def beating(self, task) -> Iterator[None]:
+        """
+        Keeps the heartbeat of the bound celery `task` alive for the duration
+        of the block. No-op for tasks without a broker delivery tag, eg: when
+        called eagerly.
+        """
+        task_id = task.request.id
+        delivery_tag = (task.request.properties or {}).get("delivery_tag")
+        if not (self.interval > 0 and isinstance(delivery_tag, str)):
+            yield
+            return
+        details = json.dumps({"tag": delivery_tag, "name": task.name})
+        try:
+            self.Redis.hset(DETAILS, task_id, details)
+        except Exception as e:
+            logger.warning(f"Could not register heartbeat of {task_id}: {e}")
+        stop = threading.Event()
+        beater = threading.Thread(
+            target=self._beat,
+            args=(task_id, stop),
+            name=f"heartbeat-{task_id}",
+            daemon=True,
+        )
+        beater.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            beater.join()
+            self._forget(task_id)
+
+    def claim_dead(self, dead_seconds: float) -> list[tuple[str, dict]]:
+        """
+        Removes and returns the (task id, details) of every heartbeat older
+        than `dead_seconds`.
+        """
+        cutoff = time.time() - dead_seconds
+        claim = self.Redis.register_script(_CLAIM)
+        dead = []
+        for task_id in self.Redis.zrangebyscore(HEARTBEATS, 0, cutoff):
+            task_id = (
+                task_id.decode() if isinstance(task_id, bytes) else task_id
+            )
+            details = claim(keys=[HEARTBEATS, DETAILS], args=[task_id, cutoff])
+            if details is None:
+                # beat again since, or claimed by another web process
+                continue
+            dead.append((task_id, json.loads(details) if details else {}))
+        return dead
+
+    def requeue_dead(self, celery: Celery, dead_seconds: float) -> list[dict]:
+        """
+        Puts the unacknowledged broker message of every task with a dead
+        heartbeat back in its queue, returns the requeued tasks.
+        """
+        dead = self.claim_dead(dead_seconds)
+        if not dead:
+            return []
+        requeued = []
+        with celery.connection_for_write() as connection:
+            qos = connection.default_channel.qos
+            for task_id, details in dead:
+                tag = details.get("tag")
+                # acknowledged or already requeued by the worker itself
+                if not tag or not self.Redis.hexists(qos.unacked_key, tag):
+                    continue
+                qos.restore_by_tag(tag)
+                logger.warning(
+                    f"[HEARTBEAT] requeued orphaned {details.get('name')} "
+                    f"{task_id}, no heartbeat for over {dead_seconds}s"
+                )
+                requeued.append({"id": task_id, "name": details.get("name")})
+        return requeued
+
+    def _beat(self, task_id: str, stop: threading.Event) -> None:
+        while True:
+            try:
+                self.Redis.zadd(HEARTBEATS, {task_id: time.time()})
+            except Exception as e:
+                logger.warning(f"Could not refresh heartbeat of {task_id}: {e}")
+            if stop.wait(self.interval):
+                return
+
+    def _forget(self, task_id: str) -> None:
+        try:
+            pipeline = self.Redis.pipeline(transaction=False)
+            pipeline.zrem(HEARTBEATS, task_id)
+            pipeline.hdel(DETAILS, task_id)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Could not remove heartbeat of {task_id}: {e}")
+
+
+@lru_cache
+def get_task_heartbeats() -> TaskHeartbeats:
+    return TaskHeartbeats(
+        get_redis(), get_settings().TASK_HEARTBEAT_INTERVAL_SECONDS
+    )
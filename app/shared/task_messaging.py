@@ -1,11 +1,72 @@
+import time
+import weakref
 from functools import lru_cache
 
 from celery import Celery
+from celery.signals import before_task_publish
 
 import redis
+import redis.asyncio
 from app.shared.settings import get_settings
 
 
+# sheet tasks and URL batches can run for hours, they go to their own queues
+# consumed by a separate worker pool so they never take every slot from
+# single URL archives
+SHEET_TASKS = frozenset(
+    {
+        "create_sheet_task",
+        "create_sheet_shard_task",
+        "merge_sheet_shards_task",
+        "create_archive_batch_task",
+    }
+)
+SHEET_QUEUE_PREFIX = "sheet_"
+# kombu's redis transport keeps a list per priority step of a queue
+_PRIORITY_SEP = "\x06\x16"
+_PRIORITY_STEPS = (0, 3, 6, 9)
+
+# every client from get_redis, see reset_redis_clients
+_REDIS_CLIENTS: weakref.WeakSet = weakref.WeakSet()
+
+
+def queue_name(priority: str, sheet: bool = False) -> str:
+    return f"{SHEET_QUEUE_PREFIX if sheet else ''}{priority}_priority"
+
+
+def queue_options(
+    priority: str, sheet: bool = False, group_id: str = None, share: int = 0
+) -> dict:
+    """
+    apply_async routing options for a task of the given priority. Tasks of a
+    group with a share also get the lane and weight of the group in the fair
+    queues, see app/shared/fair_queue.py.
+    """
+    options = {
+        "priority": 0 if priority == "high" else 10,
+        "queue": queue_name(priority, sheet),
+    }
+    if group_id and share > 0:
+        options.update(lane=group_id, share=share)
+    return options
+
+
+def broker_queue_keys(queue: str) -> list[str]:
+    # the redis lists of a celery queue, from its highest priority step
+    return [
+        f"{queue}{_PRIORITY_SEP}{step}" if step else queue
+        for step in _PRIORITY_STEPS
+    ]
+
+
+@before_task_publish.connect
+def stamp_submitted_at(headers: dict = None, **kwargs) -> None:
+    # when the task entered the broker, for the wait age of its queue (see
+    # app/shared/priority_aging.py); kept by messages restored or promoted
+    if headers is not None:
+        headers.setdefault("submitted_at", time.time())
+
+
 @lru_cache
 def get_celery(name: str = "") -> Celery:
     return Celery(
@@ -19,8 +80,30 @@ def get_celery(name: str = "") -> Celery:
         },
         result_expires=86400,  # expire task results after 24 hours to prevent Redis memory buildup
         worker_cancel_long_running_tasks_on_connection_loss=True,
+        # only applies when a task is sent without an explicit queue
+        task_routes={
+            name: {"queue": queue_name("low", sheet=True)}
+            for name in SHEET_TASKS
+        },
     )
 
 
 def get_redis() -> redis.Redis:
-    return redis.Redis.from_url(get_settings().celery_broker_url)
+    client = redis.Redis.from_url(get_settings().celery_broker_url)
+    _REDIS_CLIENTS.add(client)
+    return client
+
+
+def reset_redis_clients() -> None:
+    """
+    Makes every client from get_redis open its own connections, for forked
+    worker children that would otherwise start with the sockets of their
+    parent. The parent's connections are dropped without being closed.
+    """
+    for client in list(_REDIS_CLIENTS):
+        client.connection_pool.reset()
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    # not cached: each client is bound to the event loop it is first used in
+    return redis.asyncio.Redis.from_url(get_settings().celery_broker_url)
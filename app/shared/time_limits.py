@@ -0,0 +1,167 @@
+"""
+Time limits learned from how long archiving actually takes: workers record the
+duration of every successful archive per URL host (and of every sheet run per
+sheet) into a capped Redis list, and the web process turns the p99 of those
+into the soft_time_limit/time_limit of the tasks it enqueues. Runs cut short
+by their soft time limit are recorded as at least that limit, otherwise a
+host that became slower would only ever record its runs that still fit, and
+its limit could never rise again.
+
+Hosts and sheets without enough history get no override, so the limits set on
+the task itself apply.
+"""
+
+import math
+import threading
+from functools import lru_cache
+from typing import NamedTuple
+
+from cachetools import TTLCache
+
+import redis
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
+from app.shared.utils.misc import url_host
+
+
+PREFIX = "durations"
+URL = "url"
+SHEET = "sheet"
+
+
+class TimeLimits(NamedTuple):
+    soft: int
+    hard: int
+    p99: float
+    samples: int
+
+    def task_options(self) -> dict:
+        # apply_async options overriding the limits set on the task
+        return {"soft_time_limit": self.soft, "time_limit": self.hard}
+
+
+def subject_key(kind: str, name: str) -> str:
+    return f"{PREFIX}:{kind}:{name}"
+
+
+def p99(durations: list[float]) -> float:
+    # nearest-rank percentile
+    ordered = sorted(durations)
+    return ordered[max(0, math.ceil(0.99 * len(ordered)) - 1)]
+
+
+def compute_limits(kind: str, durations: list[float]) -> TimeLimits | None:
+    settings = get_settings()
+    if len(durations) < max(1, settings.ADAPTIVE_TIME_LIMIT_MIN_SAMPLES):
+        return None
+    floor, ceiling = {
+        URL: (
+            settings.URL_TIME_LIMIT_FLOOR_SECONDS,
+            settings.URL_TIME_LIMIT_CEILING_SECONDS,
+        ),
+        SHEET: (
+            settings.SHEET_TIME_LIMIT_FLOOR_SECONDS,
+            settings.SHEET_TIME_LIMIT_CEILING_SECONDS,
+        ),
+    }[kind]
+    slowest = p99(durations)
+    soft = math.ceil(slowest * settings.ADAPTIVE_TIME_LIMIT_FACTOR)
+    soft = min(max(soft, floor), ceiling)
+    return TimeLimits(
+        soft=soft,
+        hard=soft + settings.ADAPTIVE_TIME_LIMIT_GRACE_SECONDS,
+        p99=slowest,
+        samples=len(durations),
+    )
+
+
+class AdaptiveTimeLimits:
+    """
+    Records durations and computes the limits for URLs and sheets. Computed
+    limits are cached for `cache_seconds` so enqueueing does not read the
+    whole window from Redis every time. Redis errors are logged and mean no
+    override, they never fail the caller.
+    """
+
+    def __init__(self, Redis: redis.Redis, cache_seconds: int = 60):
+        self.Redis = Redis
+        self.cache = TTLCache(maxsize=4096, ttl=cache_seconds)
+        self.lock = threading.Lock()
+
+    def record_url(self, url: str, seconds: float) -> None:
+        if host := url_host(url):
+            self._record(subject_key(URL, host), seconds)
+
+    def record_sheet(self, sheet_id: str, seconds: float) -> None:
+        self._record(subject_key(SHEET, sheet_id), seconds)
+
+    def record_url_timeout(
+        self, url: str, seconds: float, limit: float | None
+    ) -> None:
+        # a run stopped by its soft time limit took at least that long
+        self.record_url(url, max(seconds, limit or 0))
+
+    def record_sheet_timeout(
+        self, sheet_id: str, seconds: float, limit: float | None
+    ) -> None:
+        self.record_sheet(sheet_id, max(seconds, limit or 0))
+
+    def for_url(self, url: str) -> dict:
+        # apply_async options for a task archiving `url`, {} for no override
+        host = url_host(url)
+        if not host:
+            return {}
+        return self._task_options(URL, host)
+
+    def for_sheet(self, sheet_id: str) -> dict:
+        return self._task_options(SHEET, sheet_id)
+
+    def learned(self) -> dict[str, dict[str, TimeLimits | None]]:
+        """
+        Every host and sheet with recorded durations, mapped to its limits or
+        to None while it does not have enough samples yet.
+        """
+        learned = {URL: {}, SHEET: {}}
+        for key in self.Redis.scan_iter(match=f"{PREFIX}:*", count=500):
+            key = key.decode() if isinstance(key, bytes) else key
+            _, kind, name = key.split(":", 2)
+            if kind in learned:
+                learned[kind][name] = compute_limits(kind, self._durations(key))
+        return learned
+
+    def _record(self, key: str, seconds: float) -> None:
+        settings = get_settings()
+        try:
+            pipeline = self.Redis.pipeline(transaction=False)
+            pipeline.lpush(key, round(seconds, 3))
+            pipeline.ltrim(key, 0, settings.ADAPTIVE_TIME_LIMIT_WINDOW - 1)
+            pipeline.expire(key, settings.ADAPTIVE_TIME_LIMIT_TTL_SECONDS)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Could not record duration for {key}: {e}")
+
+    def _durations(self, key: str) -> list[float]:
+        return [float(d) for d in self.Redis.lrange(key, 0, -1)]
+
+    def _task_options(self, kind: str, name: str) -> dict:
+        if not get_settings().ADAPTIVE_TIME_LIMITS:
+            return {}
+        key = subject_key(kind, name)
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        try:
+            limits = compute_limits(kind, self._durations(key))
+        except Exception as e:
+            logger.warning(f"Could not compute time limits for {key}: {e}")
+            return {}
+        options = limits.task_options() if limits else {}
+        with self.lock:
+            self.cache[key] = options
+        return options
+
+
+@lru_cache
+def get_adaptive_time_limits() -> AdaptiveTimeLimits:
+    return AdaptiveTimeLimits(get_redis())
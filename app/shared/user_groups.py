@@ -55,6 +55,18 @@ class GroupPermissions(BaseModel):
     max_monthly_urls: int = 0
     max_monthly_mbs: int = 0
     priority: str = "low"
+    # weight of the group in the low priority fair queues (FAIR_QUEUES):
+    # under saturation its tasks get share / (the shares of the other busy
+    # groups + 1 for all the groups without one) of the workers, and capacity
+    # it leaves idle goes to the others. 0 to share a lane with every group
+    # without a share
+    share: int = 0
+    # /url/archive returns a readable archive of the same URL created within
+    # this many minutes instead of archiving it again, 0 disables it
+    reuse_within_minutes: int = 0
+    # large sheets are split into up to this many row-range tasks that run
+    # in parallel, 1 archives every sheet in a single task
+    max_sheet_fan_out: int = 1
 
     @classmethod
     @field_validator(
@@ -84,6 +96,13 @@ class GroupPermissions(BaseModel):
                 )
         return v
 
+    @field_validator("share")
+    @classmethod
+    def validate_share(cls, v):
+        if v < 0:
+            raise ValueError("share should be 0 or a positive integer.")
+        return v
+
     @classmethod
     @field_validator("priority", mode="before")
     def validate_priority(cls, v):
@@ -1,3 +1,4 @@
+import urllib.parse
 from typing import List
 
 from auto_archiver.core import Media, Metadata
@@ -22,6 +23,12 @@ def fnv1a_hash_mod(s: str, modulo: int) -> int:
     ) % modulo
 
 
+def url_host(url: str) -> str:
+    # lowercase host of `url` without a leading "www.", "" if it has none
+    host = (urllib.parse.urlsplit(url.strip()).hostname or "").lower()
+    return host.removeprefix("www.")
+
+
 def convert_if_media(media):
     if isinstance(media, Media):
         return media
@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.shared.db import database
+from app.shared.db.database import (
+    configure_engine,
+    make_engine,
+    task_db,
+    unit_of_work,
+)
+from app.shared.task_messaging import get_redis, reset_redis_clients
+
+
+def test_unit_of_work_shares_one_session(test_db):
+    with unit_of_work():
+        with task_db() as first, task_db() as second:
+            assert first is second
+        with unit_of_work(), task_db() as nested:
+            assert nested is first
+
+    with task_db() as outside, task_db() as other:
+        assert outside is not first and outside is not other
+
+
+def test_task_db_rolls_back_on_errors(test_db):
+    with unit_of_work():
+        with pytest.raises(OperationalError):
+            with task_db() as session:
+                session.execute(text("SELECT * FROM missing_table"))
+        # still usable by the rest of the task
+        with task_db() as again:
+            assert again is session
+            assert again.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_unit_of_work_closes_the_session(test_db):
+    with patch.object(database, "get_db") as m_get_db:
+        session = m_get_db.return_value.__enter__.return_value
+
+        @unit_of_work()
+        def task():
+            with task_db() as db:
+                return db
+
+        assert task() is session
+        m_get_db.return_value.__exit__.assert_called_once()
+    assert database._TASK_SESSION.get() is None
+
+
+def test_configure_engine(get_settings):
+    make_engine.cache_clear()
+    engine = make_engine(get_settings.DATABASE_PATH)
+    try:
+        with patch.object(engine, "dispose") as m_dispose:
+            configure_engine(pool_size=1, max_overflow=2)
+        # connections inherited from a parent process are not closed
+        m_dispose.assert_called_once_with(close=False)
+        resized = make_engine(get_settings.DATABASE_PATH)
+        assert resized is not engine
+        assert resized.pool.size() == 1
+        assert resized.pool._max_overflow == 2
+    finally:
+        configure_engine(pool_size=15, max_overflow=20)
+
+
+def test_reset_redis_clients():
+    client = get_redis()
+    client.connection_pool = MagicMock()
+
+    reset_redis_clients()
+    client.connection_pool.reset.assert_called_once()
@@ -1,5 +1,8 @@
 from datetime import datetime
 
+import pytest
+from sqlalchemy import exc
+
 from app.shared import schemas
 from app.shared.db import models, worker_crud
 
@@ -125,3 +128,32 @@ def test_create_task(db_session):
     assert len(nt.tags) == 0
     assert len(nt.urls) == 0
     assert nt.created_at is not None
+
+
+def test_store_archived_urls(db_session):
+    def make_archive(i):
+        return schemas.ArchiveCreate(
+            id=f"archive-batch-{i}",
+            url=f"https://example-{i}.com",
+            result={},
+            author_id="rick@example.com",
+            group_id="spaceship",
+            tags=["tag-101"],
+            urls=[models.ArchiveUrl(url=f"https://example-{i}.com/0", key="0")],
+        )
+
+    stored = worker_crud.store_archived_urls(
+        db_session, [make_archive(i) for i in range(3)]
+    )
+    assert [a.id for a in stored] == [f"archive-batch-{i}" for i in range(3)]
+    assert db_session.query(models.Archive).count() == 3
+    assert db_session.query(models.ArchiveUrl).count() == 3
+    # the shared tag is only created once
+    assert db_session.query(models.Tag).count() == 1
+
+    # a duplicate id rolls back the whole batch
+    with pytest.raises(exc.IntegrityError):
+        worker_crud.store_archived_urls(
+            db_session, [make_archive(3), make_archive(0)]
+        )
+    assert db_session.query(models.Archive).count() == 3
@@ -0,0 +1,81 @@
+import pytest
+import requests
+from celery.exceptions import SoftTimeLimitExceeded
+from sqlalchemy import exc as sqlalchemy_exc
+
+import redis
+from app.shared import failures
+from app.shared.failures import PermanentFailure, classify, failure_kind
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+@pytest.mark.parametrize(
+    "exception, failure_class",
+    [
+        (PermanentFailure("gone", failures.REMOVED), failures.REMOVED),
+        (SystemExit(1), failures.CONFIG),
+        (SoftTimeLimitExceeded(), failures.TIMEOUT),
+        (requests.ReadTimeout("read"), failures.TIMEOUT),
+        (redis.exceptions.ConnectionError("down"), failures.NETWORK),
+        (requests.ConnectionError("reset"), failures.NETWORK),
+        (ConnectionResetError("reset"), failures.NETWORK),
+        (
+            sqlalchemy_exc.OperationalError("x", {}, "database is locked"),
+            failures.DATABASE,
+        ),
+        (
+            sqlalchemy_exc.IntegrityError("x", {}, "UNIQUE constraint"),
+            failures.INTEGRITY,
+        ),
+        (http_error(404), failures.NOT_FOUND),
+        (http_error(410), failures.REMOVED),
+        (http_error(403), failures.CLIENT_ERROR),
+        (http_error(429), failures.RATE_LIMITED),
+        (http_error(503), failures.SERVER_ERROR),
+        (
+            ValueError("Invalid URL scheme for url ftp://x"),
+            failures.INVALID_URL,
+        ),
+        (
+            Exception("ERROR: Unsupported URL: https://x.org"),
+            failures.UNSUPPORTED,
+        ),
+        (
+            Exception("This video has been removed by the user"),
+            failures.REMOVED,
+        ),
+        (Exception("HTTP Error 404: Not Found"), failures.NOT_FOUND),
+        (Exception("Too Many Requests"), failures.RATE_LIMITED),
+        (Exception("something else"), failures.UNKNOWN),
+        # the URL in the message is not taken into account
+        (
+            AssertionError("UNABLE TO archive: https://x.org/404/timeout"),
+            failures.UNKNOWN,
+        ),
+    ],
+)
+def test_classify(exception, failure_class):
+    assert classify(exception) == failure_class
+
+
+def test_classify_follows_cause():
+    try:
+        try:
+            raise SystemExit(1)
+        except SystemExit as e:
+            raise AssertionError("UNABLE TO archive") from e
+    except AssertionError as e:
+        assert classify(e) == failures.CONFIG
+
+
+def test_failure_kind():
+    assert failure_kind(failures.NOT_FOUND) == failures.PERMANENT
+    assert failure_kind(failures.CONFIG) == failures.PERMANENT
+    assert failure_kind(failures.NETWORK) == failures.TRANSIENT
+    assert failure_kind(failures.UNKNOWN) == failures.TRANSIENT
+    assert failure_kind("new-class") == failures.TRANSIENT
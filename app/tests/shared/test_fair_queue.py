@@ -0,0 +1,372 @@
+import functools
+import json
+from collections import Counter, defaultdict
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.shared import fair_queue
+from app.shared.fair_queue import SHARED_LANE, FairQueue, user_key
+
+
+class FakeRedis:
+    # the lists, sets, hashes and scripts FairQueue uses, in memory
+    def __init__(self):
+        self.lists = defaultdict(list)
+        self.sets = defaultdict(set)
+        self.hashes = defaultdict(dict)
+        self.values = {}
+
+    def register_script(self, script):
+        def run(keys, args):
+            if script == fair_queue._PUSH:
+                self.lists[keys[0]].append(args[1])
+                for member, (active, ring) in (
+                    (args[0], keys[1:3]),
+                    (args[2], keys[3:5]),
+                ):
+                    if member not in self.sets[active]:
+                        self.sets[active].add(member)
+                        self.lists[ring].append(member)
+                self.hashes[keys[5]][args[2]] = args[3]
+                return 1
+            if script == fair_queue._RETIRE:
+                if self.lists[keys[0]]:
+                    return 0
+                self.sets[keys[1]].discard(args[0])
+                self.lists[keys[2]].remove(args[0])
+                self.hashes[keys[3]].pop(args[0], None)
+                return 1
+            if self.values.get(keys[0]) == args[0]:
+                del self.values[keys[0]]
+
+        return run
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def llen(self, key):
+        return len(self.lists[key])
+
+    def lrange(self, key, start, end):
+        return list(self.lists[key])
+
+    def lindex(self, key, index):
+        values = self.lists[key]
+        return values[index] if values else None
+
+    def lpop(self, key):
+        return self.lists[key].pop(0)
+
+    def lpush(self, key, value):
+        self.lists[key].insert(0, value)
+
+    def hgetall(self, key):
+        return dict(self.hashes[key])
+
+    def hset(self, key, mapping):
+        self.hashes[key].update(mapping)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.results = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.results.append(getattr(self.redis, name)(*args, **kwargs))
+
+        return call
+
+    def execute(self):
+        return self.results
+
+
+@pytest.fixture
+def celery():
+    celery = MagicMock()
+    celery.sent = []
+
+    def signature(name, args):
+        signature = MagicMock()
+        signature.apply_async.side_effect = lambda **options: (
+            celery.sent.append((name, args, options))
+            or MagicMock(id=options["task_id"] or "direct-id")
+        )
+        return signature
+
+    celery.signature.side_effect = signature
+    return celery
+
+
+def low(**options):
+    return {"priority": 10, "queue": "low_priority", **options}
+
+
+def test_other_queues_are_sent_directly(celery):
+    queue = FairQueue(FakeRedis(), {"low_priority": 5}, quantum=1)
+
+    task_id = queue.submit(
+        celery, "create_archive_task", ["{}"], "rick", queue="high_priority"
+    )
+    assert task_id == "direct-id"
+    assert celery.sent == [
+        (
+            "create_archive_task",
+            ["{}"],
+            {"task_id": None, "queue": "high_priority"},
+        )
+    ]
+    # tasks without an author have no sub-queue
+    queue.submit(celery, "create_archive_task", ["{}"], None, **low())
+    assert len(celery.sent) == 2
+
+
+def test_redis_errors_send_directly(celery):
+    m_redis = MagicMock()
+    m_redis.register_script.side_effect = ConnectionError("down")
+    queue = FairQueue(m_redis, {"low_priority": 5}, quantum=1)
+
+    task_id = queue.submit(
+        celery, "create_archive_task", ["{}"], "rick", task_id="t1", **low()
+    )
+    assert task_id == "t1"
+    assert celery.sent == [
+        ("create_archive_task", ["{}"], low(task_id="t1")),
+    ]
+
+
+def test_dispatch_round_robin(celery):
+    redis = FakeRedis()
+    queue = FairQueue(redis, {"low_priority": 4}, quantum=1)
+    # rick bulk submits before morty and summer submit one each
+    for i in range(6):
+        queue.submit(celery, "task", [i], "rick", task_id=f"rick-{i}", **low())
+    queue.submit(celery, "task", [0], "morty", task_id="morty-0", **low())
+    queue.submit(celery, "task", [0], "summer", task_id="summer-0", **low())
+    assert celery.sent == []
+    assert queue.pending() == {
+        "low_priority": {"lanes": 1, "users": 3, "tasks": 8}
+    }
+
+    dispatched = queue.dispatch(celery)
+
+    assert [t["id"] for t in dispatched] == [
+        "rick-0",
+        "morty-0",
+        "summer-0",
+        "rick-1",
+    ]
+    assert celery.sent[1] == ("task", [0], low(task_id="morty-0"))
+    assert dispatched[1]["author_id"] == "morty"
+    assert dispatched[1]["wait_seconds"] >= 0
+    # morty and summer have nothing left
+    assert queue.pending() == {
+        "low_priority": {"lanes": 1, "users": 1, "tasks": 4}
+    }
+    assert redis.values.get(fair_queue.DISPATCHER_LOCK) is None
+
+
+def test_dispatch_keeps_the_celery_queue_at_target_depth(celery):
+    redis = FakeRedis()
+    queue = FairQueue(redis, {"low_priority": 4}, quantum=1)
+    for i in range(6):
+        queue.submit(celery, "task", [i], "rick", task_id=f"rick-{i}", **low())
+    redis.lists["low_priority"] = ["waiting"] * 2
+    redis.lists["low_priority\x06\x169"] = ["waiting"]
+
+    assert [t["id"] for t in queue.dispatch(celery)] == ["rick-0"]
+    redis.lists["low_priority\x06\x169"] = []
+    assert [t["id"] for t in queue.dispatch(celery)] == ["rick-1", "rick-2"]
+
+
+def test_dispatch_resumes_the_round(celery):
+    queue = FairQueue(FakeRedis(), {"low_priority": 1}, quantum=1)
+    for user in ("rick", "morty"):
+        for i in range(2):
+            queue.submit(
+                celery, "task", [i], user, task_id=f"{user}-{i}", **low()
+            )
+
+    order = [t["id"] for _ in range(4) for t in queue.dispatch(celery)]
+    assert order == ["rick-0", "morty-0", "rick-1", "morty-1"]
+
+
+def test_dispatch_weighs_batches_by_cost(celery):
+    queue = FairQueue(FakeRedis(), {"low_priority": 100}, quantum=10)
+    queue.submit(celery, "batch", [], "rick", task_id="batch", cost=30, **low())
+    for i in range(5):
+        queue.submit(
+            celery, "task", [i], "morty", task_id=f"morty-{i}", **low()
+        )
+
+    order = [t["id"] for t in queue.dispatch(celery)]
+    # rick's 30 URLs take 3 rounds of credit, morty's tasks fit in the first
+    assert order == [f"morty-{i}" for i in range(5)] + ["batch"]
+
+
+def test_dispatch_is_fair_under_load(celery):
+    # one user floods the queue, the others wait at most a round each
+    queue = FairQueue(FakeRedis(), {"low_priority": 3}, quantum=1)
+    for i in range(100):
+        queue.submit(
+            celery, "task", [i], "flood", task_id=f"flood-{i}", **low()
+        )
+    for user in ("a", "b"):
+        for i in range(5):
+            queue.submit(
+                celery, "task", [i], user, task_id=f"{user}-{i}", **low()
+            )
+
+    order = [t["author_id"] for _ in range(10) for t in queue.dispatch(celery)]
+    assert Counter(order[:15]) == {"flood": 5, "a": 5, "b": 5}
+
+
+def test_dispatch_puts_unsent_tasks_back(celery):
+    redis = FakeRedis()
+    queue = FairQueue(redis, {"low_priority": 5}, quantum=1)
+    queue.submit(celery, "task", [0], "rick", task_id="rick-0", **low())
+    celery.signature.side_effect = ConnectionError("broker down")
+
+    with pytest.raises(ConnectionError):
+        queue.dispatch(celery)
+    entries = redis.lists[user_key("low_priority", SHARED_LANE, "rick")]
+    assert [json.loads(e)["task_id"] for e in entries] == ["rick-0"]
+    assert redis.values.get(fair_queue.DISPATCHER_LOCK) is None
+
+
+def test_only_one_dispatcher(celery):
+    redis = FakeRedis()
+    queue = FairQueue(redis, {"low_priority": 5}, quantum=1)
+    queue.submit(celery, "task", [0], "rick", **low())
+    redis.set(fair_queue.DISPATCHER_LOCK, "other-web-process")
+
+    assert queue.dispatch(celery) == []
+    assert celery.sent == []
+
+
+def test_lanes_are_weighted(celery):
+    queue = FairQueue(FakeRedis(), {"low_priority": 8}, quantum=1)
+    for i in range(20):
+        queue.submit(
+            celery,
+            "task",
+            [i],
+            "partner-user",
+            task_id=f"partner-{i}",
+            **low(lane="partner", share=3),
+        )
+    for user in ("rick", "morty"):
+        for i in range(20):
+            queue.submit(
+                celery, "task", [i], user, task_id=f"{user}-{i}", **low()
+            )
+    # the lane options are never sent to celery
+    assert all("lane" not in options for _, _, options in celery.sent)
+
+    dispatched = queue.dispatch(celery)
+
+    assert Counter(t["lane"] for t in dispatched) == {
+        "partner": 6,
+        SHARED_LANE: 2,
+    }
+    # users of the shared lane still take turns
+    assert [t["author_id"] for t in dispatched if t["lane"] == SHARED_LANE] == [
+        "rick",
+        "morty",
+    ]
+    assert all("lane" not in options for _, _, options in celery.sent)
+
+
+def simulate(queue: FairQueue, redis: FakeRedis, submitted: dict, ticks: int):
+    """
+    Runs `ticks` seconds of 4 worker slots consuming low_priority, each task
+    taking 3 seconds, with the dispatcher topping up the queue every second.
+    `submitted` maps each tick to the (lane, share, author) of the tasks
+    submitted then. Returns the tick and lane of every completed task.
+    """
+
+    def apply_async(lane, task_id, queue, **options):
+        redis.lists[queue].append(lane)
+        return MagicMock(id=task_id)
+
+    celery = MagicMock()
+    celery.signature.side_effect = lambda name, args: MagicMock(
+        apply_async=functools.partial(apply_async, args[0])
+    )
+    slots = [None] * 4
+    completed = []
+    for tick in range(ticks):
+        for lane, share, author in submitted.get(tick, []):
+            queue.submit(
+                celery,
+                "task",
+                [lane],
+                author,
+                **low(lane=lane, share=share),
+            )
+        for slot, running in enumerate(slots):
+            if running and running[1] <= tick:
+                completed.append((tick, running[0]))
+                slots[slot] = None
+            if slots[slot] is None and redis.lists["low_priority"]:
+                lane = redis.lists["low_priority"].pop(0)
+                slots[slot] = (lane or SHARED_LANE, tick + 3)
+        queue.dispatch(celery)
+    return completed
+
+
+def test_share_is_kept_under_saturation():
+    redis = FakeRedis()
+    queue = FairQueue(redis, {"low_priority": 2}, quantum=1)
+    # a partner group with a share of 3 and two other groups each submit far
+    # more than the workers can archive, the others only from tick 100
+    submitted = {
+        0: [("partner", 3, "p@example.com")] * 1000,
+        100: [(None, 0, "rick@example.com")] * 200
+        + [(None, 0, "morty@example.com")] * 200,
+    }
+
+    completed = simulate(queue, redis, submitted, ticks=400)
+
+    def lane_shares(start: int, end: int) -> dict:
+        lanes = Counter(lane for tick, lane in completed if start <= tick < end)
+        return {lane: n / sum(lanes.values()) for lane, n in lanes.items()}
+
+    # alone, the partner group borrows the capacity the others leave idle
+    assert lane_shares(10, 100) == {"partner": 1}
+    # under saturation it keeps 3 / (3 + 1) of the workers
+    shares = lane_shares(120, 400)
+    assert shares["partner"] == pytest.approx(0.75, abs=0.03)
+    assert shares[SHARED_LANE] == pytest.approx(0.25, abs=0.03)
+    # throughput is the same, 4 slots finishing a task every 3 ticks
+    assert len([t for t, _ in completed if 120 <= t < 400]) == pytest.approx(
+        (400 - 120) * 4 / 3, abs=4
+    )
+
+
+def test_max_wait_seconds(celery):
+    redis = FakeRedis()
+    queue = FairQueue(redis, {"low_priority": 1}, quantum=1)
+    assert queue.max_wait_seconds() == {"low_priority": 0}
+
+    queue.submit(celery, "task", [0], "rick", task_id="rick-0", **low())
+    queue.submit(celery, "task", [0], "morty", task_id="morty-0", **low())
+    key = user_key("low_priority", SHARED_LANE, "rick")
+    entry = json.loads(redis.lists[key][0])
+    redis.lists[key][0] = json.dumps({**entry, "submitted_at": 1000})
+
+    assert queue.max_wait_seconds()["low_priority"] > 1000
+    # dispatched tasks no longer count
+    queue.dispatch(celery)
+    assert queue.max_wait_seconds()["low_priority"] < 5
@@ -0,0 +1,93 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from auto_archiver.core import Metadata
+
+from app.shared.negative_cache import NegativeCache, cache_key, normalize_url
+
+
+@pytest.mark.parametrize(
+    "url, normalized",
+    [
+        ("https://x.com/user/status/1", "https://x.com/user/status/1"),
+        ("HTTPS://WWW.X.com/user/status/1/", "https://x.com/user/status/1"),
+        ("https://x.com:443/a#fragment", "https://x.com/a"),
+        ("https://x.com:8080/a", "https://x.com:8080/a"),
+        (
+            "https://youtube.com/watch?v=1&utm_source=x&si=abc&feature=share",
+            "https://youtube.com/watch?v=1",
+        ),
+        ("https://x.com/a?b=2&a=1", "https://x.com/a?a=1&b=2"),
+        ("  https://x.com/a  ", "https://x.com/a"),
+    ],
+)
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+def test_cache_key():
+    assert cache_key("https://www.x.com/a/") == cache_key("https://x.com/a")
+    assert cache_key("https://x.com/a") != cache_key("https://x.com/b")
+    assert cache_key("https://x.com/a").startswith("negative-cache:")
+
+
+def test_record():
+    m_redis = MagicMock()
+    cache = NegativeCache(m_redis)
+
+    assert cache.record("https://x.com/a", "removed", "deleted post")
+    key, entry = m_redis.set.call_args.args
+    assert key == cache_key("https://x.com/a")
+    assert json.loads(entry)["failure_class"] == "removed"
+    assert json.loads(entry)["error"] == "deleted post"
+    assert m_redis.set.call_args.kwargs == {"ex": 24 * 60 * 60}
+
+    # transient failures are not remembered
+    m_redis.reset_mock()
+    assert not cache.record("https://x.com/a", "network", "reset")
+    assert not cache.record("", "removed", "no url")
+    m_redis.set.assert_not_called()
+
+
+def test_get():
+    m_redis = MagicMock()
+    m_redis.pipeline.return_value.execute.return_value = [
+        json.dumps({"failure_class": "not_found", "error": "404"}),
+        120,
+    ]
+
+    assert NegativeCache(m_redis).get("https://x.com/a") == {
+        "failure_class": "not_found",
+        "error": "404",
+        "retry_after": 120,
+    }
+
+    m_redis.pipeline.return_value.execute.return_value = [None, -2]
+    assert NegativeCache(m_redis).get("https://x.com/a") is None
+
+
+def test_redis_errors_let_everything_through():
+    m_redis = MagicMock()
+    m_redis.pipeline.side_effect = Exception("down")
+    m_redis.set.side_effect = Exception("down")
+    m_redis.delete.side_effect = Exception("down")
+    cache = NegativeCache(m_redis)
+
+    assert cache.get("https://x.com/a") is None
+    assert not cache.record("https://x.com/a", "removed")
+    cache.forget("https://x.com/a")
+
+
+def test_gate():
+    cache = NegativeCache(MagicMock())
+    cache.get = MagicMock(
+        side_effect=[None, {"failure_class": "removed"}, None]
+    )
+    items = [Metadata().set_url(f"https://x.com/{i}") for i in range(3)]
+    suppressed = []
+
+    passed = [i.get_url() for i in cache.gate(items, suppressed)]
+
+    assert passed == ["https://x.com/0", "https://x.com/2"]
+    assert suppressed == [{"failure_class": "removed"}]
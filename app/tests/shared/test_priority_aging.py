@@ -0,0 +1,141 @@
+import json
+import time
+from collections import defaultdict
+from unittest.mock import MagicMock
+
+from app.shared import priority_aging
+from app.shared.priority_aging import PriorityAging
+from app.shared.task_messaging import stamp_submitted_at
+
+
+class FakeRedis:
+    # kombu's priority lists, pushed to the left and popped from the right
+    def __init__(self):
+        self.lists = defaultdict(list)
+
+    def register_script(self, script):
+        assert script == priority_aging._PROMOTE
+
+        def run(keys, args):
+            source, target = keys
+            if not self.lists[source] or self.lists[source][-1] != args[0]:
+                return 0
+            self.lists[source].pop()
+            self.lists[target].append(args[1])
+            return 1
+
+        return run
+
+    def lindex(self, key, index):
+        values = self.lists[key]
+        return values[index] if values else None
+
+    def pipeline(self, transaction=True):
+        pipeline = MagicMock()
+        results = []
+        pipeline.lindex.side_effect = lambda *args: results.append(
+            self.lindex(*args)
+        )
+        pipeline.execute.side_effect = lambda: results
+        return pipeline
+
+
+def message(task_id, waited, queue="low_priority", priority=10):
+    headers = {"id": task_id}
+    if waited is not None:
+        headers["submitted_at"] = time.time() - waited
+    return json.dumps(
+        {
+            "body": "",
+            "headers": headers,
+            "properties": {
+                "priority": priority,
+                "delivery_info": {"exchange": "", "routing_key": queue},
+            },
+        }
+    )
+
+
+def send(redis, key, *messages):
+    for m in messages:
+        redis.lists[key].insert(0, m)
+
+
+LOW = "low_priority\x06\x169"
+
+
+def test_stamp_submitted_at():
+    headers = {}
+    stamp_submitted_at(headers=headers, body=None)
+    assert time.time() - headers["submitted_at"] < 5
+    # restored and promoted messages keep their stamp
+    headers = {"submitted_at": 1}
+    stamp_submitted_at(headers=headers)
+    assert headers == {"submitted_at": 1}
+
+
+def test_max_wait_seconds():
+    redis = FakeRedis()
+    aging = PriorityAging(redis)
+    assert aging.max_wait_seconds("low_priority") == 0
+
+    send(redis, LOW, message("old", 600), message("new", 10))
+    send(redis, "low_priority", message("step-0", 60))
+    assert 600 <= aging.max_wait_seconds("low_priority") < 605
+    assert aging.max_wait_seconds("high_priority") == 0
+
+
+def test_promote_aged_tasks():
+    redis = FakeRedis()
+    aging = PriorityAging(redis)
+    send(redis, LOW, message("a", 900), message("b", 800), message("c", 10))
+    send(redis, "high_priority", message("h", 5, "high_priority", 0))
+
+    assert aging.promote("low_priority", "high_priority", 300, 5) == [
+        "a",
+        "b",
+    ]
+    assert [json.loads(m)["headers"]["id"] for m in redis.lists[LOW]] == ["c"]
+    # promoted tasks are next in line, ahead of the high priority backlog
+    promoted = [json.loads(m) for m in redis.lists["high_priority"]]
+    assert [m["headers"]["id"] for m in promoted] == ["h", "a", "b"]
+    assert promoted[2]["headers"]["promoted_from"] == "low_priority"
+    assert promoted[2]["properties"]["priority"] == 0
+    assert (
+        promoted[2]["properties"]["delivery_info"]["routing_key"]
+        == "high_priority"
+    )
+    # waits still count from when they were first sent
+    assert aging.max_wait_seconds("high_priority") >= 800
+
+
+def test_promote_is_bounded():
+    redis = FakeRedis()
+    aging = PriorityAging(redis)
+    send(redis, LOW, *[message(f"t{i}", 900 - i) for i in range(10)])
+
+    assert aging.promote("low_priority", "high_priority", 300, 3) == [
+        "t0",
+        "t1",
+        "t2",
+    ]
+    assert len(redis.lists[LOW]) == 7
+
+
+def test_unstamped_tasks_are_not_promoted():
+    redis = FakeRedis()
+    aging = PriorityAging(redis)
+    send(redis, LOW, message("before-deploy", None), message("a", 900))
+
+    assert aging.promote("low_priority", "high_priority", 300, 5) == []
+    assert aging.max_wait_seconds("low_priority") == 0
+
+
+def test_promote_aged_fails_open():
+    m_redis = MagicMock()
+    m_redis.register_script.side_effect = ConnectionError("down")
+
+    assert PriorityAging(m_redis).promote_aged(300, 5) == {
+        "low_priority": [],
+        "sheet_low_priority": [],
+    }
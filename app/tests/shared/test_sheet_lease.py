@@ -0,0 +1,85 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.shared.sheet_lease import SheetLeases, lease_key
+
+
+class FakeRedis:
+    # evaluates the claim and release scripts on a dict
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def register_script(self, script):
+        def run(keys, args):
+            holder = self.values.get(keys[0])
+            if "DEL" in script:
+                if holder == args[0]:
+                    self.values.pop(keys[0])
+                    return 1
+                return 0
+            if holder and holder != args[0]:
+                return [0, holder.encode()]
+            self.values[keys[0]] = args[0]
+            self.ttls[keys[0]] = args[1]
+            return [1, args[0].encode()]
+
+        return run
+
+
+@pytest.fixture
+def leases():
+    return SheetLeases(FakeRedis())
+
+
+def test_claim(leases):
+    assert leases.claim("sheet", "first", 60) == (True, "first")
+    assert leases.claim("sheet", "second", 60) == (False, "first")
+    # the holder renews its own lease
+    assert leases.claim("sheet", "first", 600) == (True, "first")
+    assert leases.Redis.ttls[lease_key("sheet")] == 600
+
+    leases.release("sheet", "second")
+    assert leases.claim("sheet", "second", 60) == (False, "first")
+    leases.release("sheet", "first")
+    assert leases.claim("sheet", "second", 60) == (True, "second")
+
+
+def test_redis_errors_fail_open():
+    leases = SheetLeases(MagicMock())
+    leases.Redis.register_script.side_effect = ConnectionError("down")
+
+    assert leases.claim("sheet", "task", 60) == (True, "task")
+    leases.release("sheet", "task")
+
+
+def test_send_once(leases):
+    send = MagicMock(side_effect=lambda task_id: task_id)
+
+    task_id, sent = leases.send_once("sheet", send, 60)
+    assert sent
+    send.assert_called_once_with(task_id)
+    assert leases.Redis.values[lease_key("sheet")] == task_id
+
+    assert leases.send_once("sheet", send, 60) == (task_id, False)
+    send.assert_called_once()
+
+
+def test_send_once_releases_when_sending_fails(leases):
+    with pytest.raises(ConnectionError):
+        leases.send_once("sheet", MagicMock(side_effect=ConnectionError), 60)
+    assert lease_key("sheet") not in leases.Redis.values
+
+
+def test_holding(leases):
+    leases.claim("sheet", "task", 60)
+    with leases.holding("sheet", "task", 600, 0.01):
+        while leases.Redis.ttls[lease_key("sheet")] != 600:
+            pass
+    assert lease_key("sheet") not in leases.Redis.values
+
+    with leases.holding("sheet", "task", 600, 60) as lease:
+        lease.keep(3600)
+    assert leases.Redis.values[lease_key("sheet")] == "task"
+    assert leases.Redis.ttls[lease_key("sheet")] == 3600
@@ -0,0 +1,144 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from app.shared import sheet_progress
+from app.shared.sheet_progress import SheetProgress
+
+
+def published(m_redis) -> list[tuple[str, dict]]:
+    pipeline = m_redis.pipeline.return_value
+    return [
+        (c.args[1]["event"], json.loads(c.args[1]["data"]))
+        for c in pipeline.xadd.call_args_list
+    ]
+
+
+def counting_redis() -> MagicMock:
+    # a pipeline that keeps the counters hash in a dict
+    m_redis = MagicMock()
+    pipeline = m_redis.pipeline.return_value
+    counters, results = {}, []
+
+    def hsetnx(key, field, value):
+        results.append(counters.setdefault((key, field), value) == value)
+
+    def hincrby(key, field, amount):
+        counters[(key, field)] = counters.get((key, field), 0) + amount
+        results.append(counters[(key, field)])
+
+    def execute():
+        done = list(results)
+        results.clear()
+        return done
+
+    pipeline.hsetnx.side_effect = hsetnx
+    pipeline.hincrby.side_effect = hincrby
+    pipeline.hget.side_effect = lambda key, f: results.append(counters[key, f])
+    pipeline.expire.side_effect = lambda *a: results.append(True)
+    pipeline.execute.side_effect = execute
+    return m_redis
+
+
+def test_stream_key():
+    assert sheet_progress.stream_key("task-id") == "sheet-progress:task-id"
+    assert (
+        sheet_progress.counters_key("task-id")
+        == "sheet-progress:task-id:counters"
+    )
+
+
+def test_publishes_rows():
+    m_redis = counting_redis()
+    with patch("app.shared.sheet_progress.time.time") as m_time:
+        m_time.return_value = 0
+        progress = SheetProgress(m_redis, "task-id", "sheet-id")
+        progress.start()
+        m_time.return_value = 30
+        progress.row("https://example.com/1", True)
+        m_time.return_value = 60
+        progress.row(None, False)
+        progress.publish(sheet_progress.DONE, success=True)
+
+    pipeline = m_redis.pipeline.return_value
+    assert pipeline.xadd.call_args.args[0] == "sheet-progress:task-id"
+    assert pipeline.xadd.call_args.kwargs == {
+        "maxlen": 1000,
+        "approximate": True,
+    }
+    pipeline.expire.assert_any_call(
+        "sheet-progress:task-id:counters", 24 * 60 * 60
+    )
+    pipeline.expire.assert_called_with("sheet-progress:task-id", 24 * 60 * 60)
+    assert pipeline.execute.call_count == 6
+    assert published(m_redis) == [
+        ("start", {"sheet_id": "sheet-id"}),
+        (
+            "row",
+            {
+                "sheet_id": "sheet-id",
+                "url": "https://example.com/1",
+                "archived": 1,
+                "failed": 0,
+                "rows_per_minute": 2.0,
+            },
+        ),
+        (
+            "row",
+            {
+                "sheet_id": "sheet-id",
+                "url": None,
+                "archived": 1,
+                "failed": 1,
+                "rows_per_minute": 2.0,
+            },
+        ),
+        ("done", {"sheet_id": "sheet-id", "success": True}),
+    ]
+
+
+def test_shard_progress_goes_to_sheet_stream():
+    m_redis = MagicMock()
+    SheetProgress(m_redis, "sheet-task-id", "sheet-id", "shard-id").start()
+
+    pipeline = m_redis.pipeline.return_value
+    assert pipeline.xadd.call_args.args[0] == "sheet-progress:sheet-task-id"
+    assert published(m_redis) == [
+        ("start", {"sheet_id": "sheet-id", "shard": "shard-id"})
+    ]
+
+
+def test_shards_publish_the_sheet_totals():
+    m_redis = counting_redis()
+    shards = [
+        SheetProgress(m_redis, "sheet-task-id", "sheet-id", shard_id)
+        for shard_id in ("shard-1", "shard-2")
+    ]
+
+    shards[0].row("https://example.com/1", True)
+    shards[1].row("https://example.com/2", True)
+    shards[1].row("https://example.com/3", False)
+    shards[0].row("https://example.com/4", True)
+
+    rows = [data for event, data in published(m_redis) if event == "row"]
+    assert [(r["shard"], r["archived"], r["failed"]) for r in rows] == [
+        ("shard-1", 1, 0),
+        ("shard-2", 2, 0),
+        ("shard-2", 2, 1),
+        ("shard-1", 3, 1),
+    ]
+    hincrby = m_redis.pipeline.return_value.hincrby
+    assert {c.args[0] for c in hincrby.call_args_list} == {
+        "sheet-progress:sheet-task-id:counters"
+    }
+
+
+def test_redis_error_disables_progress():
+    m_redis = MagicMock()
+    m_redis.pipeline.return_value.execute.side_effect = Exception("down")
+    progress = SheetProgress(m_redis, "task-id", "sheet-id")
+
+    progress.start()
+    progress.row("https://example.com", True)
+
+    assert not progress.enabled
+    assert m_redis.pipeline.return_value.execute.call_count == 1
@@ -0,0 +1,68 @@
+from unittest.mock import MagicMock
+
+from app.shared import singleflight
+
+
+def test_lock_key():
+    key = singleflight.lock_key("spaceship", "https://example.com")
+    assert key.startswith("singleflight:lock:spaceship:")
+    assert key == singleflight.lock_key("spaceship", "https://example.com")
+    assert key != singleflight.lock_key("default", "https://example.com")
+    assert key != singleflight.lock_key("spaceship", "https://example.com/1")
+
+
+def test_join_as_leader():
+    m_redis = MagicMock()
+    m_redis.register_script.return_value.return_value = [1, b"leader-id"]
+
+    assert singleflight.join(
+        m_redis, "spaceship", "https://example.com", "leader-id", "{}", 60
+    ) == (True, "leader-id")
+    m_redis.register_script.assert_called_once_with(singleflight._JOIN)
+    m_redis.register_script.return_value.assert_called_once_with(
+        keys=[singleflight.lock_key("spaceship", "https://example.com")],
+        args=["leader-id", "{}", 60, singleflight.FOLLOWERS_PREFIX],
+    )
+
+
+def test_join_as_follower():
+    m_redis = MagicMock()
+    m_redis.register_script.return_value.return_value = [0, b"leader-id"]
+
+    assert singleflight.join(
+        m_redis, "spaceship", "https://example.com", "other-id", "{}", 60
+    ) == (False, "leader-id")
+
+
+def test_finish():
+    m_redis = MagicMock()
+    m_redis.register_script.return_value.return_value = [b'{"id": "f1"}']
+
+    followers = singleflight.finish(
+        m_redis, "spaceship", "https://example.com", "leader-id"
+    )
+    assert followers == ['{"id": "f1"}']
+    m_redis.register_script.assert_called_once_with(singleflight._FINISH)
+    m_redis.register_script.return_value.assert_called_once_with(
+        keys=[singleflight.lock_key("spaceship", "https://example.com")],
+        args=["leader-id", singleflight.FOLLOWERS_PREFIX],
+    )
+
+
+def test_refresh():
+    m_redis = MagicMock()
+    m_redis.register_script.return_value.return_value = 1
+
+    assert singleflight.refresh(
+        m_redis, "spaceship", "https://example.com", "leader-id", 600
+    )
+    m_redis.register_script.assert_called_once_with(singleflight._REFRESH)
+    m_redis.register_script.return_value.assert_called_once_with(
+        keys=[singleflight.lock_key("spaceship", "https://example.com")],
+        args=["leader-id", 600, singleflight.FOLLOWERS_PREFIX],
+    )
+    # the lock is not held by that task
+    m_redis.register_script.return_value.return_value = 0
+    assert not singleflight.refresh(
+        m_redis, "spaceship", "https://example.com", "other-id", 600
+    )
@@ -0,0 +1,112 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.shared import task_heartbeats
+from app.shared.task_heartbeats import DETAILS, HEARTBEATS, TaskHeartbeats
+
+
+@pytest.fixture()
+def m_redis():
+    return MagicMock()
+
+
+def bound_task(delivery_tag="tag-1"):
+    task = MagicMock()
+    task.name = "create_sheet_task"
+    task.request.id = "task-1"
+    task.request.properties = {"delivery_tag": delivery_tag}
+    return task
+
+
+def test_beating(m_redis):
+    heartbeats = TaskHeartbeats(m_redis, interval_seconds=0.01)
+
+    with heartbeats.beating(bound_task()):
+        m_redis.hset.assert_called_once_with(
+            DETAILS,
+            "task-1",
+            json.dumps({"tag": "tag-1", "name": "create_sheet_task"}),
+        )
+        m_redis.reset_mock()
+        time.sleep(0.05)
+        # refreshed while the block runs
+        assert m_redis.zadd.call_count >= 2
+        key, beats = m_redis.zadd.call_args[0]
+        assert key == HEARTBEATS and list(beats) == ["task-1"]
+
+    # removed once it ends
+    m_redis.pipeline.return_value.zrem.assert_called_once_with(
+        HEARTBEATS, "task-1"
+    )
+    m_redis.pipeline.return_value.hdel.assert_called_once_with(
+        DETAILS, "task-1"
+    )
+
+
+def test_beating_without_broker_message(m_redis):
+    heartbeats = TaskHeartbeats(m_redis, interval_seconds=0.01)
+    with heartbeats.beating(bound_task(delivery_tag=None)):
+        pass
+    with TaskHeartbeats(m_redis, interval_seconds=0).beating(bound_task()):
+        pass
+    assert not m_redis.method_calls
+
+
+def test_beating_survives_redis_errors(m_redis):
+    m_redis.hset.side_effect = Exception("down")
+    m_redis.zadd.side_effect = Exception("down")
+    m_redis.pipeline.side_effect = Exception("down")
+    heartbeats = TaskHeartbeats(m_redis, interval_seconds=0.01)
+
+    with heartbeats.beating(bound_task()):
+        pass
+
+
+def test_claim_dead(m_redis):
+    m_redis.zrangebyscore.return_value = [
+        b"dead",
+        b"alive-again",
+        b"no-details",
+    ]
+    claim = m_redis.register_script.return_value
+    claim.side_effect = [json.dumps({"tag": "tag-1", "name": "n"}), None, ""]
+
+    dead = TaskHeartbeats(m_redis, 30).claim_dead(300)
+
+    m_redis.register_script.assert_called_once_with(task_heartbeats._CLAIM)
+    assert dead == [("dead", {"tag": "tag-1", "name": "n"}), ("no-details", {})]
+    assert claim.call_args_list[0].kwargs["keys"] == [HEARTBEATS, DETAILS]
+    assert claim.call_args_list[0].kwargs["args"][0] == "dead"
+
+
+def test_requeue_dead(m_redis):
+    heartbeats = TaskHeartbeats(m_redis, 30)
+    heartbeats.claim_dead = MagicMock(
+        return_value=[
+            ("lost", {"tag": "tag-1", "name": "create_sheet_task"}),
+            ("acked", {"tag": "tag-2", "name": "create_archive_task"}),
+            ("unknown", {}),
+        ]
+    )
+    m_celery = MagicMock()
+    qos = m_celery.connection_for_write.return_value.__enter__.return_value.default_channel.qos
+    qos.unacked_key = "unacked"
+    m_redis.hexists.side_effect = lambda key, tag: tag == "tag-1"
+
+    requeued = heartbeats.requeue_dead(m_celery, 300)
+
+    heartbeats.claim_dead.assert_called_once_with(300)
+    assert requeued == [{"id": "lost", "name": "create_sheet_task"}]
+    qos.restore_by_tag.assert_called_once_with("tag-1")
+
+
+def test_requeue_dead_nothing_to_do(m_redis):
+    heartbeats = TaskHeartbeats(m_redis, 30)
+    m_redis.zrangebyscore.return_value = []
+    m_celery = MagicMock()
+
+    assert heartbeats.requeue_dead(m_celery, 300) == []
+    m_celery.connection_for_write.assert_not_called()
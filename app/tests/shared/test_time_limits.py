@@ -0,0 +1,122 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.shared import time_limits
+from app.shared.time_limits import AdaptiveTimeLimits, TimeLimits
+
+
+def test_p99():
+    assert time_limits.p99([5.0]) == 5.0
+    assert time_limits.p99(list(range(1, 101))) == 99
+    assert time_limits.p99([3, 1, 2] * 10) == 3
+
+
+@pytest.mark.parametrize(
+    "kind,durations,expected",
+    [
+        # p99 x 3 within [5min, 45min], hard = soft + 5min
+        ("url", [100] * 20, TimeLimits(300, 600, 100, 20)),
+        ("url", [200] * 19 + [250], TimeLimits(750, 1050, 250, 20)),
+        ("url", [1] * 30, TimeLimits(300, 600, 1, 30)),
+        ("url", [3600] * 20, TimeLimits(2700, 3000, 3600, 20)),
+        ("sheet", [60] * 20, TimeLimits(1800, 2100, 60, 20)),
+        ("sheet", [3 * 3600] * 20, TimeLimits(21600, 21900, 10800, 20)),
+        ("url", [100] * 19, None),
+    ],
+)
+def test_compute_limits(kind, durations, expected):
+    assert time_limits.compute_limits(kind, durations) == expected
+
+
+def test_record():
+    m_redis = MagicMock()
+    limits = AdaptiveTimeLimits(m_redis)
+
+    limits.record_url("https://www.X.com/status/1", 12.34567)
+    limits.record_url("not a url", 1)
+    limits.record_sheet("sheet-id", 600)
+
+    pipeline = m_redis.pipeline.return_value
+    assert [c.args for c in pipeline.lpush.call_args_list] == [
+        ("durations:url:x.com", 12.346),
+        ("durations:sheet:sheet-id", 600),
+    ]
+    pipeline.ltrim.assert_called_with("durations:sheet:sheet-id", 0, 499)
+    assert pipeline.expire.call_args.args[1] == 14 * 24 * 60 * 60
+
+
+def test_record_timeout():
+    m_redis = MagicMock()
+    limits = AdaptiveTimeLimits(m_redis)
+
+    # stopped by its soft time limit, the run counts as at least the limit
+    limits.record_url_timeout("https://x.com/1", 299.5, 300)
+    limits.record_url_timeout("https://x.com/2", 310, 300)
+    limits.record_sheet_timeout("sheet-id", 10, None)
+
+    pipeline = m_redis.pipeline.return_value
+    assert [c.args for c in pipeline.lpush.call_args_list] == [
+        ("durations:url:x.com", 300),
+        ("durations:url:x.com", 310),
+        ("durations:sheet:sheet-id", 10),
+    ]
+
+
+def test_timeouts_raise_the_limit():
+    # a host that became slower than its limit: every run is stopped by it
+    durations = [100] * 20
+    limits = time_limits.compute_limits("url", durations)
+    assert limits.soft == 300
+    durations = [limits.soft] + durations[:-1]
+    assert time_limits.compute_limits("url", durations).soft == 900
+
+
+def test_for_url_is_cached():
+    m_redis = MagicMock()
+    m_redis.lrange.return_value = [b"100"] * 20
+    limits = AdaptiveTimeLimits(m_redis)
+
+    expected = {"soft_time_limit": 300, "time_limit": 600}
+    assert limits.for_url("https://x.com/1") == expected
+    assert limits.for_url("https://mobile.x.com/2") == expected
+    assert limits.for_url("https://x.com/3") == expected
+    assert m_redis.lrange.call_count == 2
+    m_redis.lrange.assert_called_with("durations:url:mobile.x.com", 0, -1)
+
+    assert limits.for_url("") == {}
+
+
+def test_too_few_samples_redis_down_or_disabled():
+    m_redis = MagicMock()
+    m_redis.lrange.return_value = [b"100"] * 5
+    assert AdaptiveTimeLimits(m_redis).for_sheet("sheet-id") == {}
+
+    m_redis.lrange.side_effect = Exception("down")
+    assert AdaptiveTimeLimits(m_redis).for_sheet("sheet-id") == {}
+
+    with patch("app.shared.time_limits.get_settings") as m_settings:
+        m_settings.return_value.ADAPTIVE_TIME_LIMITS = False
+        assert AdaptiveTimeLimits(MagicMock()).for_url("https://x.com") == {}
+
+
+def test_learned():
+    m_redis = MagicMock()
+    m_redis.scan_iter.return_value = [
+        b"durations:url:x.com",
+        b"durations:url:example.com",
+        b"durations:sheet:sheet-id",
+    ]
+    m_redis.lrange.side_effect = lambda key, *_: {
+        "durations:url:x.com": [b"100"] * 20,
+        "durations:url:example.com": [b"100"],
+        "durations:sheet:sheet-id": [b"60"] * 20,
+    }[key]
+
+    assert AdaptiveTimeLimits(m_redis).learned() == {
+        "url": {
+            "x.com": TimeLimits(300, 600, 100, 20),
+            "example.com": None,
+        },
+        "sheet": {"sheet-id": TimeLimits(1800, 2100, 60, 20)},
+    }
@@ -1,4 +1,4 @@
-from app.shared.utils.misc import fnv1a_hash_mod, get_all_urls
+from app.shared.utils.misc import fnv1a_hash_mod, get_all_urls, url_host
 
 
 def test_fnv1a_hash_mod():
@@ -31,6 +31,12 @@ def test_fnv1a_hash_mod():
     assert fnv1a_hash_mod("test", 1) == 0
 
 
+def test_url_host():
+    assert url_host("https://WWW.X.com/a?b=c") == "x.com"
+    assert url_host(" http://mobile.x.com:8080/ ") == "mobile.x.com"
+    assert url_host("not a url") == ""
+
+
 def test_get_all_urls(db_session):
     from auto_archiver.core import Media, Metadata
 
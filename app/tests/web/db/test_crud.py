@@ -595,6 +595,16 @@ def test_upsert_user_groups(db_session):
     test_broken_yaml(db_session)
 
 
+@patch("app.web.db.crud.get_redis")
+def test_upsert_user_groups_bumps_config_version(m_redis, db_session):
+    crud.upsert_user_groups(db_session)
+    m_redis.return_value.incr.assert_called_once_with("group-config-version")
+
+    # redis being down does not break reloading the config
+    m_redis.return_value.incr.side_effect = Exception("redis is down")
+    crud.upsert_user_groups(db_session)
+
+
 def test_create_sheet(db_session):
     assert db_session.query(models.Sheet).count() == 0
 
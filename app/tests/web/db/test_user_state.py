@@ -691,6 +691,33 @@ def test_has_quota_max_monthly_urls(db_session):
                 assert us.has_quota_max_monthly_urls("") == expected
 
 
+def test_has_quota_max_monthly_urls_for_a_batch(db_session):
+    us = UserState(db_session, email="test@example.com")
+    permissions = {"group1": GroupInfo(max_monthly_urls=100)}
+
+    with (
+        patch.object(
+            UserState,
+            "permissions",
+            new_callable=PropertyMock,
+            return_value=permissions,
+        ),
+        patch.object(
+            us.db,
+            "query",
+            return_value=MagicMock(
+                filter=MagicMock(
+                    return_value=MagicMock(count=MagicMock(return_value=99))
+                )
+            ),
+        ),
+    ):
+        assert us.has_quota_max_monthly_urls("group1", 1)
+        # one URL left, a batch of 2 would go over the quota
+        assert not us.has_quota_max_monthly_urls("group1", 2)
+        assert not us.has_quota_max_monthly_urls("group1", 500)
+
+
 def test_has_quota_max_monthly_mbs(db_session):
     us = UserState(db_session, email="test@example.com")
 
@@ -811,6 +838,9 @@ def test_priority_group(user_state):
             models.Group(id="group1", permissions={"priority": "high"}),
             models.Group(id="group2", permissions={"priority": "medium"}),
             models.Group(id="group3", permissions={"priority": "low"}),
+            models.Group(
+                id="partner", permissions={"priority": "low", "share": 3}
+            ),
         ],
     ):
         assert user_state.priority_group(
@@ -825,3 +855,24 @@ def test_priority_group(user_state):
         assert user_state.priority_group(
             "group4"
         ) == convert_priority_to_queue_dict("low")
+
+        # sheet tasks keep the group priority, on their own queues
+        assert user_state.priority_group("group1") == {
+            "priority": 0,
+            "queue": "high_priority",
+        }
+        assert user_state.priority_group("group1", sheet=True) == {
+            "priority": 0,
+            "queue": "sheet_high_priority",
+        }
+        assert user_state.priority_group("group3", sheet=True) == {
+            "priority": 10,
+            "queue": "sheet_low_priority",
+        }
+        # groups with a share get their own lane in the fair queues
+        assert user_state.priority_group("partner", sheet=True) == {
+            "priority": 10,
+            "queue": "sheet_low_priority",
+            "lane": "partner",
+            "share": 3,
+        }
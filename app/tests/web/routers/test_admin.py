@@ -0,0 +1,38 @@
+from http import HTTPStatus
+from unittest.mock import patch
+
+from app.shared.time_limits import TimeLimits
+
+
+def test_time_limits_no_auth(client, test_no_auth):
+    test_no_auth(client.get, "/admin/time-limits")
+
+
+def test_time_limits_user_is_not_enough(client_with_auth):
+    response = client_with_auth.get("/admin/time-limits")
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+@patch("app.web.routers.admin.get_adaptive_time_limits")
+def test_time_limits(m_limits, client_with_token):
+    m_limits.return_value.learned.return_value = {
+        "url": {
+            "x.com": TimeLimits(300, 600, 100.5, 20),
+            "example.com": None,
+        },
+        "sheet": {},
+    }
+
+    response = client_with_token.get("/admin/time-limits")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "enabled": True,
+        "min_samples": 20,
+        "factor": 3.0,
+        "urls": {
+            "example.com": None,
+            "x.com": {"soft": 300, "hard": 600, "p99": 100.5, "samples": 20},
+        },
+        "sheets": {},
+    }
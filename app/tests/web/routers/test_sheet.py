@@ -1,12 +1,13 @@
 from datetime import datetime
 from http import HTTPStatus
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
 from fastapi.testclient import TestClient
 
 from app.shared.constants import STATUS_PENDING
 from app.shared.db import models
 from app.shared.schemas import TaskResult
+from app.shared.sheet_lease import SheetLeases
 from app.web.db.user_state import UserState
 from app.web.security import get_user_state
 
@@ -244,9 +245,69 @@ class TestArchiveUserSheetEndpoint:
         m_celery.signature.assert_called_once()
         # Verify it was queued as high priority
         m_signature.apply_async.assert_called_once_with(
-            priority=0, queue="high_priority"
+            task_id=ANY, priority=0, queue="sheet_high_priority"
         )
 
+    @patch("app.web.routers.sheet.get_adaptive_time_limits")
+    @patch("app.web.routers.sheet.celery", return_value=MagicMock())
+    def test_learned_time_limits(
+        self, m_celery, m_limits, client_with_token, db_session
+    ):
+        db_session.add(
+            models.Sheet(
+                id="rick-sheet-id",
+                name="Rick's Sheet",
+                author_id="rick@example.com",
+                group_id="spaceship",
+                frequency="hourly",
+            )
+        )
+        db_session.commit()
+        m_limits.return_value.for_sheet.return_value = {
+            "soft_time_limit": 1800,
+            "time_limit": 2100,
+        }
+        m_celery.signature.return_value.apply_async.return_value = TaskResult(
+            id="token-taskid", status=STATUS_PENDING, result=""
+        )
+
+        r = client_with_token.post("/sheet/rick-sheet-id/archive")
+
+        assert r.status_code == HTTPStatus.CREATED
+        m_limits.return_value.for_sheet.assert_called_once_with("rick-sheet-id")
+        m_celery.signature.return_value.apply_async.assert_called_once_with(
+            task_id=ANY,
+            priority=0,
+            queue="sheet_high_priority",
+            soft_time_limit=1800,
+            time_limit=2100,
+        )
+
+    @patch("app.web.routers.sheet.get_sheet_leases")
+    @patch("app.web.routers.sheet.celery", return_value=MagicMock())
+    def test_active_run_is_reported(
+        self, m_celery, m_leases, client_with_token, db_session
+    ):
+        db_session.add(
+            models.Sheet(
+                id="rick-sheet-id",
+                name="Rick's Sheet",
+                author_id="rick@example.com",
+                group_id="spaceship",
+                frequency="hourly",
+            )
+        )
+        db_session.commit()
+        m_leases.return_value = SheetLeases(MagicMock())
+        claim = m_leases.return_value.Redis.register_script.return_value
+        claim.return_value = [0, b"running-taskid"]
+
+        r = client_with_token.post("/sheet/rick-sheet-id/archive")
+
+        assert r.status_code == HTTPStatus.OK
+        assert r.json() == {"id": "running-taskid", "coalesced": True}
+        m_celery.signature.return_value.apply_async.assert_not_called()
+
     @patch("app.web.routers.sheet.celery", return_value=MagicMock())
     def test_token_auth_uses_sheet_owner_as_author(
         self, m_celery, client_with_token, db_session
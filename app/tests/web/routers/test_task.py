@@ -1,7 +1,10 @@
 from http import HTTPStatus
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+
+import pytest
 
 from app.shared.constants import STATUS_FAILURE, STATUS_PENDING, STATUS_SUCCESS
+from app.shared.db import models
 
 
 def test_endpoint_task_status_no_auth(client, test_no_auth):
@@ -23,6 +26,44 @@ def test_get_status_success(mock_async_result, client_with_auth):
     }
 
 
+@patch("app.web.routers.task.AsyncResult")
+def test_get_status_resolves_archive_result(
+    mock_async_result, client_with_auth, db_session
+):
+    db_session.add(
+        models.Archive(
+            id="archive-id",
+            url="https://example.com",
+            result={"status": "success", "media": []},
+            public=True,
+            author_id="rick@example.com",
+        )
+    )
+    db_session.commit()
+    ref = {
+        "archive_id": "archive-id",
+        "status": STATUS_SUCCESS,
+        "url": "https://example.com",
+    }
+    mock_async_result.return_value.status = STATUS_SUCCESS
+    mock_async_result.return_value.result = ref
+
+    response = client_with_auth.get("/task/archive-id")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "id": "archive-id",
+        "status": STATUS_SUCCESS,
+        "result": {"status": "success", "media": []},
+    }
+
+    # the archive is gone, the reference is all there is left to return
+    db_session.get(models.Archive, "archive-id").deleted = True
+    db_session.commit()
+    response = client_with_auth.get("/task/archive-id")
+    assert response.json()["result"] == ref
+
+
 @patch("app.web.routers.task.AsyncResult")
 def test_get_status_failure(mock_async_result, client_with_auth):
     mock_async_result.return_value.status = STATUS_FAILURE
@@ -51,3 +92,84 @@ def test_get_status_pending(mock_async_result, client_with_auth):
         "status": STATUS_PENDING,
         "result": None,
     }
+
+
+class TestStreamProgress:
+    @pytest.fixture()
+    def m_redis(self):
+        with patch("app.web.routers.task.get_async_redis") as m:
+            yield m.return_value
+
+    @staticmethod
+    def entry(entry_id: str, event: str, data: str):
+        return (entry_id.encode(), {b"event": event.encode(), b"data": data})
+
+    def test_no_auth(self, client, test_no_auth):
+        test_no_auth(client.get, "/task/test-task-id/progress")
+
+    def test_replays_until_done(self, m_redis, client_with_auth):
+        key = b"sheet-progress:test-task-id"
+        m_redis.xread = AsyncMock(
+            side_effect=[
+                [
+                    (
+                        key,
+                        [
+                            self.entry("1-0", "start", b"{}"),
+                            self.entry("2-0", "row", b'{"archived": 1}'),
+                        ],
+                    )
+                ],
+                [],
+                [(key, [self.entry("3-0", "done", b'{"success": true}')])],
+            ]
+        )
+        m_redis.exists = AsyncMock(return_value=1)
+        m_redis.aclose = AsyncMock()
+
+        response = client_with_auth.get("/task/test-task-id/progress")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text == (
+            "id: 1-0\nevent: start\ndata: {}\n\n"
+            'id: 2-0\nevent: row\ndata: {"archived": 1}\n\n'
+            ": keep-alive\n\n"
+            'id: 3-0\nevent: done\ndata: {"success": true}\n\n'
+        )
+        cursors = [c.args[0] for c in m_redis.xread.call_args_list]
+        assert cursors == [
+            {"sheet-progress:test-task-id": "0"},
+            {"sheet-progress:test-task-id": "2-0"},
+            {"sheet-progress:test-task-id": "2-0"},
+        ]
+        m_redis.aclose.assert_awaited_once()
+
+    def test_resumes_from_last_event_id(self, m_redis, client_with_auth):
+        m_redis.xread = AsyncMock(
+            return_value=[(b"key", [self.entry("9-0", "done", b"{}")])]
+        )
+        m_redis.aclose = AsyncMock()
+
+        response = client_with_auth.get(
+            "/task/test-task-id/progress", headers={"Last-Event-ID": "8-0"}
+        )
+
+        assert response.text == "id: 9-0\nevent: done\ndata: {}\n\n"
+        assert m_redis.xread.call_args.args[0] == {
+            "sheet-progress:test-task-id": "8-0"
+        }
+
+    @patch("app.web.routers.task.AsyncResult")
+    def test_ends_for_finished_task_without_progress(
+        self, m_async_result, m_redis, client_with_auth
+    ):
+        m_redis.xread = AsyncMock(return_value=[])
+        m_redis.exists = AsyncMock(return_value=0)
+        m_redis.aclose = AsyncMock()
+        m_async_result.return_value.ready.side_effect = [False, True]
+
+        response = client_with_auth.get("/task/test-task-id/progress")
+
+        assert response.text == ": keep-alive\n\n"
+        assert m_redis.xread.call_count == 2
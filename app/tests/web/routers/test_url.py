@@ -2,11 +2,19 @@ import json
 from http import HTTPStatus
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 from app.shared import schemas
 from app.shared.constants import STATUS_PENDING
-from app.shared.db import worker_crud
+from app.shared.db import models, worker_crud
 from app.shared.schemas import ArchiveCreate, TaskResult
 from app.web.config import ALLOW_ANY_EMAIL
+from app.web.utils.metrics import (
+    ARCHIVE_REUSE,
+    ARCHIVE_REUSE_SECONDS_SAVED,
+    NEGATIVE_CACHE_BYPASSED,
+    NEGATIVE_CACHE_SUPPRESSED,
+)
 
 
 def test_archive_url_unauthenticated(client, test_no_auth):
@@ -64,6 +72,7 @@ def test_archive_url(m_celery, m2, client_with_auth):
         "sheet_id": None,
         "store_until": None,
         "urls": None,
+        "source_archive_id": None,
     }
     m_user_state.has_quota_max_monthly_urls.assert_called_once()
     m_user_state.has_quota_max_monthly_mbs.assert_called_once()
@@ -106,7 +115,7 @@ def test_archive_url(m_celery, m2, client_with_auth):
     assert (
         response.json()["detail"] == "User has reached their monthly URL quota."
     )
-    m_user_state.has_quota_max_monthly_urls.assert_called_with("spaceship")
+    m_user_state.has_quota_max_monthly_urls.assert_called_with("spaceship", 1)
 
     # user is over monthly MB quota
     m_user_state.has_quota_max_monthly_urls.return_value = True
@@ -153,6 +162,77 @@ def test_archive_url_quotas(m1, client_with_auth):
     m_user_state.has_quota_max_monthly_mbs.assert_called_once()
 
 
+@patch("app.web.routers.url.get_adaptive_time_limits")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_learned_time_limits(m_celery, m_limits, client_with_token):
+    m_limits.return_value.for_url.return_value = {
+        "soft_time_limit": 300,
+        "time_limit": 600,
+    }
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="123-456-789", status=STATUS_PENDING, result=""
+    )
+
+    response = client_with_token.post(
+        "/url/archive", json={"url": "https://example.com/fast"}
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    m_limits.return_value.for_url.assert_called_once_with(
+        "https://example.com/fast"
+    )
+    apply_kwargs = m_celery.signature.return_value.apply_async.call_args[1]
+    assert apply_kwargs["soft_time_limit"] == 300
+    assert apply_kwargs["time_limit"] == 600
+
+
+@patch("app.web.routers.url.get_negative_cache")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_recently_failed(m_celery, m_cache, client_with_token):
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="123-456-789", status=STATUS_PENDING, result=""
+    )
+    m_cache.return_value.get.return_value = {
+        "failure_class": "removed",
+        "error": "This post has been removed",
+        "retry_after": 3600,
+    }
+
+    def counted(metric, **labels):
+        return metric.labels(**labels)._value.get()  # type: ignore[attr-defined]
+
+    suppressed = counted(
+        NEGATIVE_CACHE_SUPPRESSED, source="url", failure_class="removed"
+    )
+    bypassed = counted(NEGATIVE_CACHE_BYPASSED, source="url")
+
+    response = client_with_token.post(
+        "/url/archive", json={"url": "https://example.com/deleted"}
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert "(removed)" in response.json()["detail"]
+    assert "force=true" in response.json()["detail"]
+    assert response.headers["Retry-After"] == "3600"
+    m_cache.return_value.get.assert_called_once_with(
+        "https://example.com/deleted"
+    )
+    m_celery.signature.assert_not_called()
+
+    response = client_with_token.post(
+        "/url/archive?force=true", json={"url": "https://example.com/deleted"}
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    m_celery.signature.assert_called_once()
+
+    assert (
+        counted(
+            NEGATIVE_CACHE_SUPPRESSED, source="url", failure_class="removed"
+        )
+        == suppressed + 1
+    )
+    assert counted(NEGATIVE_CACHE_BYPASSED, source="url") == bypassed + 1
+
+
 @patch("app.web.routers.url.celery", return_value=MagicMock())
 def test_archive_url_with_api_token(m_celery, client_with_token):
     m_signature = MagicMock()
@@ -181,6 +261,7 @@ def test_archive_url_with_api_token(m_celery, client_with_token):
         "sheet_id": None,
         "store_until": None,
         "urls": None,
+        "source_archive_id": None,
     }
 
     # missing id should use ALLOW_ANY_EMAIL
@@ -201,7 +282,447 @@ def test_archive_url_with_api_token(m_celery, client_with_token):
         "sheet_id": None,
         "store_until": None,
         "urls": None,
+        "source_archive_id": None,
+    }
+
+
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_reuse(m_celery, client_with_auth, db_session):
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="123-456-789", status=STATUS_PENDING, result=""
+    )
+    group = db_session.get(models.Group, "spaceship")
+    group.permissions = {**group.permissions, "reuse_within_minutes": 10}
+    db_session.commit()
+    result = {"status": "success", "metadata": {"archive_duration_seconds": 42}}
+    worker_crud.store_archived_url(
+        db_session,
+        ArchiveCreate(
+            id="recent-archive",
+            url="https://example.com/viral",
+            result=result,
+            author_id="rick@example.com",
+            group_id="spaceship",
+            urls=[models.ArchiveUrl(url="https://cdn.example.com/0", key="0")],
+        ),
+    )
+
+    def reused(outcome):
+        return ARCHIVE_REUSE.labels(outcome=outcome)._value.get()  # type: ignore[attr-defined]
+
+    before = {o: reused(o) for o in ("miss", "returned", "cloned")}
+    before_saved = ARCHIVE_REUSE_SECONDS_SAVED._value.get()  # type: ignore[attr-defined]
+
+    # same request: the recent archive is returned
+    response = client_with_auth.post(
+        "/url/archive",
+        json={"url": "https://example.com/viral", "group_id": "spaceship"},
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json() == {"id": "recent-archive"}
+    m_celery.backend.store_result.assert_called_with(
+        "recent-archive",
+        {
+            "archive_id": "recent-archive",
+            "status": "SUCCESS",
+            "url": "https://example.com/viral",
+        },
+        "SUCCESS",
+    )
+
+    # different visibility: the archive is cloned
+    response = client_with_auth.post(
+        "/url/archive",
+        json={
+            "url": "https://example.com/viral",
+            "group_id": "spaceship",
+            "public": True,
+        },
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    clone_id = response.json()["id"]
+    assert clone_id != "recent-archive"
+    clone = db_session.get(models.Archive, clone_id)
+    assert clone.public is True
+    assert clone.result == result
+    assert [u.url for u in clone.urls] == ["https://cdn.example.com/0"]
+    m_celery.signature.assert_not_called()
+
+    # other URLs are archived
+    response = client_with_auth.post(
+        "/url/archive",
+        json={"url": "https://example.com/other", "group_id": "spaceship"},
+    )
+    assert response.json() == {"id": "123-456-789"}
+    m_celery.signature.assert_called_once()
+
+    assert reused("returned") - before["returned"] == 1
+    assert reused("cloned") - before["cloned"] == 1
+    assert reused("miss") - before["miss"] == 1
+    saved = ARCHIVE_REUSE_SECONDS_SAVED._value.get()  # type: ignore[attr-defined]
+    assert saved - before_saved == 84
+
+    # groups without the permission never look for recent archives
+    response = client_with_auth.post(
+        "/url/archive",
+        json={
+            "url": "https://example.com/viral",
+            "group_id": "interdimensional",
+        },
+    )
+    assert response.json() == {"id": "123-456-789"}
+    assert reused("miss") - before["miss"] == 1
+
+
+@pytest.mark.parametrize(
+    "result", [{"status": "nothing archived"}, {"status": "no archiver"}, None]
+)
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_does_not_reuse_failures(
+    m_celery, result, client_with_auth, db_session
+):
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="123-456-789", status=STATUS_PENDING, result=""
+    )
+    group = db_session.get(models.Group, "spaceship")
+    group.permissions = {**group.permissions, "reuse_within_minutes": 10}
+    db_session.commit()
+    worker_crud.store_archived_url(
+        db_session,
+        ArchiveCreate(
+            id="failed-archive",
+            url="https://example.com/broken",
+            result=result,
+            author_id="rick@example.com",
+            group_id="spaceship",
+            urls=[],
+        ),
+    )
+
+    response = client_with_auth.post(
+        "/url/archive",
+        json={"url": "https://example.com/broken", "group_id": "spaceship"},
+    )
+    # archived again instead of returning the failed archive
+    assert response.json() == {"id": "123-456-789"}
+    m_celery.signature.assert_called_once()
+    m_celery.backend.store_result.assert_not_called()
+
+
+@patch("app.web.routers.url.singleflight.join")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_singleflight(m_celery, m_join, client_with_token):
+    m_apply = m_celery.signature.return_value.apply_async
+    m_apply.return_value = TaskResult(
+        id="leader-id", status=STATUS_PENDING, result=""
+    )
+    request = {"url": "https://example.com/viral", "author_id": "a@b.com"}
+
+    # the first request leads, its task is sent with the reserved id
+    m_join.side_effect = lambda _, g, u, candidate_id, *a: (True, candidate_id)
+    response = client_with_token.post("/url/archive", json=request)
+    assert response.json() == {"id": "leader-id"}
+    group_id, url, leader_id, follower_json, _ = m_join.call_args[0][1:]
+    assert (group_id, url) == ("default", "https://example.com/viral")
+    assert m_apply.call_args.kwargs["task_id"] == leader_id
+    assert json.loads(follower_json)["id"] == leader_id
+
+    # identical requests while it runs follow it, no new task
+    m_join.side_effect = lambda _, g, u, candidate_id, *a: (False, "leader-id")
+    response = client_with_token.post("/url/archive", json=request)
+    assert response.status_code == HTTPStatus.CREATED
+    follower_id = response.json()["id"]
+    assert follower_id not in ("leader-id", leader_id)
+    assert json.loads(m_join.call_args[0][4]) == {
+        **json.loads(follower_json),
+        "id": follower_id,
     }
+    m_apply.assert_called_once()
+
+    # without redis requests are not coalesced
+    m_join.side_effect = Exception("redis is down")
+    response = client_with_token.post("/url/archive", json=request)
+    assert response.json() == {"id": "leader-id"}
+    assert m_apply.call_count == 2
+    assert m_apply.call_args.kwargs["task_id"] is None
+
+
+@patch("app.web.routers.url.singleflight.finish")
+@patch("app.web.routers.url.singleflight.join")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_singleflight_send_failure(
+    m_celery, m_join, m_finish, client_with_token
+):
+    m_celery.signature.return_value.apply_async.side_effect = ConnectionError(
+        "broker down"
+    )
+    m_join.side_effect = lambda _, g, u, candidate_id, *a: (True, candidate_id)
+    m_finish.return_value = ['{"id": "follower-id"}']
+
+    with pytest.raises(ConnectionError):
+        client_with_token.post(
+            "/url/archive", json={"url": "https://example.com/viral"}
+        )
+
+    # the lock is released and whoever joined in the meantime fails
+    leader_id = m_join.call_args[0][3]
+    assert m_finish.call_args[0][1:] == (
+        "default",
+        "https://example.com/viral",
+        leader_id,
+    )
+    m_celery.backend.mark_as_failure.assert_called_once()
+    assert m_celery.backend.mark_as_failure.call_args[0][0] == "follower-id"
+
+
+def test_archive_url_batch_unauthenticated(client, test_no_auth):
+    test_no_auth(client.post, "/url/archive/batch")
+
+
+@patch("app.web.routers.url.UserState")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_batch(m_celery, m2, client_with_auth):
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="batch-123", status=STATUS_PENDING, result=""
+    )
+    m_user_state = MagicMock()
+    m2.return_value = m_user_state
+
+    urls = ["https://example.com/1", "https://example.com/2"]
+    response = client_with_auth.post(
+        "/url/archive/batch",
+        json={"archives": [{"url": u, "group_id": "spaceship"} for u in urls]},
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    j = response.json()
+    assert j["id"] == "batch-123"
+    assert [t["url"] for t in j["tasks"]] == urls
+    assert len({t["id"] for t in j["tasks"]}) == 2
+
+    called_val = m_celery.signature.call_args
+    assert called_val[0][0] == "create_archive_batch_task"
+    sent = [json.loads(a) for a in called_val[1]["args"][0]]
+    assert [a["id"] for a in sent] == [t["id"] for t in j["tasks"]]
+    assert {a["author_id"] for a in sent} == {"rick@example.com"}
+    # permissions are checked once for the whole batch
+    m_user_state.in_group.assert_called_once_with("spaceship")
+    m_user_state.has_quota_max_monthly_urls.assert_called_once_with(
+        "spaceship", 2
+    )
+    m_user_state.priority_group.assert_called_once_with("spaceship", sheet=True)
+
+    # empty batch
+    response = client_with_auth.post(
+        "/url/archive/batch", json={"archives": []}
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    # mixed groups
+    response = client_with_auth.post(
+        "/url/archive/batch",
+        json={
+            "archives": [
+                {"url": urls[0], "group_id": "spaceship"},
+                {"url": urls[1], "group_id": "default"},
+            ]
+        },
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert (
+        response.json()["detail"]
+        == "All URLs in a batch must belong to the same group."
+    )
+
+    # one invalid url rejects the batch
+    response = client_with_auth.post(
+        "/url/archive/batch",
+        json={"archives": [{"url": urls[0]}, {"url": "example.com"}]},
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json()["detail"] == "Invalid URL received."
+
+    # not in group
+    m_user_state.in_group.return_value = False
+    response = client_with_auth.post(
+        "/url/archive/batch",
+        json={"archives": [{"url": urls[0], "group_id": "new-group"}]},
+    )
+    assert response.status_code == HTTPStatus.FORBIDDEN
+    assert m_celery.signature.call_count == 1
+
+
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_batch_with_api_token(m_celery, client_with_token):
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="batch-123", status=STATUS_PENDING, result=""
+    )
+    response = client_with_token.post(
+        "/url/archive/batch",
+        json={
+            "archives": [
+                {"url": "https://example.com/1", "author_id": "a@example.com"},
+                {"url": "https://example.com/2"},
+            ]
+        },
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    sent = [json.loads(a) for a in m_celery.signature.call_args[1]["args"][0]]
+    assert [a["author_id"] for a in sent] == ["a@example.com", ALLOW_ANY_EMAIL]
+    # batches go to the queues of the sheet worker pool
+    assert m_celery.signature.return_value.apply_async.call_args[1] == {
+        "task_id": None,
+        "priority": 0,
+        "queue": "sheet_high_priority",
+    }
+
+
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_batch_over_quota(m_celery, client_with_auth):
+    m_celery.signature.return_value.apply_async.return_value = TaskResult(
+        id="batch-123", status=STATUS_PENDING, result=""
+    )
+    # animated-characters allows 2 URLs a month
+    urls = [f"https://example.com/{i}" for i in range(3)]
+    response = client_with_auth.post(
+        "/url/archive/batch",
+        json={
+            "archives": [
+                {"url": u, "group_id": "animated-characters"} for u in urls
+            ]
+        },
+    )
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert (
+        response.json()["detail"]
+        == "A batch of 3 URLs exceeds the user's monthly URL quota."
+    )
+    m_celery.signature.assert_not_called()
+
+    response = client_with_auth.post(
+        "/url/archive/batch",
+        json={
+            "archives": [
+                {"url": u, "group_id": "animated-characters"} for u in urls[:2]
+            ]
+        },
+    )
+    assert response.status_code == HTTPStatus.CREATED
+
+
+@patch("app.web.routers.url.get_adaptive_time_limits")
+@patch("app.web.routers.url.singleflight.join")
+@patch("app.web.routers.url.reuse_recent_archive")
+@patch("app.web.routers.url.get_negative_cache")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_batch_filters_urls(
+    m_celery, m_cache, m_reuse, m_join, m_limits, client_with_token
+):
+    m_apply = m_celery.signature.return_value.apply_async
+    m_apply.return_value = TaskResult(
+        id="batch-123", status=STATUS_PENDING, result=""
+    )
+    urls = [f"https://example.com/{name}" for name in ("deleted", "recent")]
+    urls += ["https://example.com/viral", "https://example.com/new"]
+    m_cache.return_value.get.side_effect = lambda url: (
+        {"failure_class": "removed", "error": "gone", "retry_after": 60}
+        if url == urls[0]
+        else None
+    )
+    m_reuse.side_effect = lambda e, archive, db: (
+        "reused-id" if archive.url == urls[1] else None
+    )
+    m_join.side_effect = lambda _, g, url, candidate_id, *a: (
+        (False, "other-task") if url == urls[2] else (True, candidate_id)
+    )
+    m_limits.return_value.for_url.return_value = {
+        "soft_time_limit": 300,
+        "time_limit": 600,
+    }
+
+    response = client_with_token.post(
+        "/url/archive/batch",
+        json={"archives": [{"url": u} for u in urls]},
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    j = response.json()
+    assert j["id"] == "batch-123"
+    assert [t["url"] for t in j["tasks"]] == urls
+    failed_id, reused_id, follower_id, leader_id = [t["id"] for t in j["tasks"]]
+    assert reused_id == "reused-id"
+    assert m_join.call_args_list[0][0][3] == follower_id
+    assert m_join.call_args_list[1][0][3] == leader_id
+
+    # the recently failed url fails right away
+    m_celery.backend.mark_as_failure.assert_called_once()
+    assert m_celery.backend.mark_as_failure.call_args[0][0] == failed_id
+    # only the new url is archived, with its reserved id and learned limits
+    sent = [json.loads(a) for a in m_celery.signature.call_args[1]["args"][0]]
+    assert [(a["id"], a["url"]) for a in sent] == [(leader_id, urls[3])]
+    assert m_apply.call_args[1]["soft_time_limit"] == 300
+    assert m_apply.call_args[1]["time_limit"] == 600
+
+    # forced, the failed url is archived too, limits are added up
+    response = client_with_token.post(
+        "/url/archive/batch?force=true",
+        json={"archives": [{"url": urls[0]}, {"url": urls[3]}]},
+    )
+    sent = [json.loads(a) for a in m_celery.signature.call_args[1]["args"][0]]
+    assert [a["url"] for a in sent] == [urls[0], urls[3]]
+    assert m_apply.call_args[1]["soft_time_limit"] == 600
+    assert m_apply.call_args[1]["time_limit"] == 900
+
+    # nothing left to archive, no batch is sent
+    response = client_with_token.post(
+        "/url/archive/batch",
+        json={"archives": [{"url": urls[1]}, {"url": urls[2]}]},
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()["id"] is None
+    assert [t["url"] for t in response.json()["tasks"]] == urls[1:3]
+    assert m_apply.call_count == 2
+
+
+@patch("app.web.routers.url.singleflight.finish")
+@patch("app.web.routers.url.singleflight.join")
+@patch("app.web.routers.url.celery", return_value=MagicMock())
+def test_archive_url_batch_send_failure(
+    m_celery, m_join, m_finish, client_with_token
+):
+    m_celery.signature.return_value.apply_async.side_effect = ConnectionError(
+        "broker down"
+    )
+    m_join.side_effect = lambda _, g, u, candidate_id, *a: (True, candidate_id)
+    m_finish.return_value = ['{"id": "follower-id"}']
+
+    with pytest.raises(ConnectionError):
+        client_with_token.post(
+            "/url/archive/batch",
+            json={"archives": [{"url": "https://example.com/viral"}]},
+        )
+
+    leader_id = m_join.call_args[0][3]
+    assert m_finish.call_args[0][1:] == (
+        "default",
+        "https://example.com/viral",
+        leader_id,
+    )
+    assert m_celery.backend.mark_as_failure.call_args[0][0] == "follower-id"
+
+
+@patch("app.web.routers.url.get_settings")
+def test_archive_url_batch_too_large(m_settings, client_with_token):
+    m_settings.return_value.ARCHIVE_BATCH_MAX_URLS = 1
+    response = client_with_token.post(
+        "/url/archive/batch",
+        json={
+            "archives": [
+                {"url": "https://example.com/1"},
+                {"url": "https://example.com/2"},
+            ]
+        },
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json()["detail"] == "A batch can have at most 1 URLs."
 
 
 def test_search_by_url_unauthenticated(client, test_no_auth):
@@ -85,3 +85,144 @@ def test_referer_counter_via_middleware(client_with_token):
         'referer_total{referer="https://referer-test.example"} 1.0'
         in metrics.text
     )
+
+
+def test_record_worker_metric():
+    from app.web.utils.metrics import (
+        ORCHESTRATOR_POOL_EVENTS,
+        ORCHESTRATOR_SETUP_SECONDS,
+        record_worker_metric,
+    )
+
+    hits = ORCHESTRATOR_POOL_EVENTS.labels(event="hit")
+    before_hits = hits._value.get()  # type: ignore[attr-defined]
+    before_setup = ORCHESTRATOR_SETUP_SECONDS._value.get()  # type: ignore[attr-defined]
+
+    record_worker_metric(
+        {"metric": "orchestrator_pool_events", "labels": {"event": "hit"}}
+    )
+    record_worker_metric(
+        {"metric": "orchestrator_setup_seconds", "value": 2.5, "labels": {}}
+    )
+    # unknown metrics are ignored
+    record_worker_metric({"metric": "does_not_exist", "value": 1})
+
+    assert hits._value.get() == before_hits + 1  # type: ignore[attr-defined]
+    assert ORCHESTRATOR_SETUP_SECONDS._value.get() == before_setup + 2.5  # type: ignore[attr-defined]
+
+
+def test_record_worker_phase_timing():
+    from app.web.utils.metrics import TASK_PHASE_SECONDS, record_worker_metric
+
+    labels = {
+        "task": "create_archive_task",
+        "phase": "feed",
+        "group": "spaceship",
+        "queue": "high_priority",
+        "domain": "x.com",
+    }
+    histogram = TASK_PHASE_SECONDS.labels(**labels)
+    before = histogram._sum.get()  # type: ignore[attr-defined]
+
+    record_worker_metric(
+        {"metric": "task_phase_seconds", "value": 12.5, "labels": labels}
+    )
+    assert histogram._sum.get() == before + 12.5  # type: ignore[attr-defined]
+
+    # a batch of samples, each with several values
+    record_worker_metric(
+        {
+            "batch": [
+                {
+                    "metric": "task_phase_seconds",
+                    "labels": labels,
+                    "values": [1, 2],
+                },
+                {"metric": "does_not_exist", "values": [1]},
+            ]
+        }
+    )
+    assert histogram._sum.get() == before + 15.5  # type: ignore[attr-defined]
+
+
+def test_observe_fair_queue_wait_cardinality_cap():
+    import app.web.utils.metrics as m
+
+    def wait_sum(user: str) -> float:
+        histogram = m.FAIR_QUEUE_WAIT_SECONDS.labels(
+            queue="low_priority", user=user
+        )
+        return histogram._sum.get()  # type: ignore[attr-defined]
+
+    original_users = m._fair_queue_users.copy()
+    try:
+        m._fair_queue_users.clear()
+        m.observe_fair_queue_wait("low_priority", "rick@example.com", 3)
+        assert wait_sum("rick@example.com") == 3
+
+        m._fair_queue_users.update(
+            f"user-{i}" for i in range(m._FAIR_QUEUE_MAX_USERS)
+        )
+        before_other = wait_sum("other")
+        m.observe_fair_queue_wait("low_priority", "morty@example.com", 5)
+        assert wait_sum("other") == before_other + 5
+        # users already labeled keep their label
+        m.observe_fair_queue_wait("low_priority", "rick@example.com", 1)
+        assert wait_sum("rick@example.com") == 4
+    finally:
+        m._fair_queue_users.clear()
+        m._fair_queue_users.update(original_users)
+
+
+def test_record_worker_exceptions():
+    import app.web.utils.metrics as m
+
+    def value_for(fingerprint: str) -> float:
+        return m.WORKER_EXCEPTION.labels(
+            type="ValueError", task="create_sheet_task", fingerprint=fingerprint
+        )._value.get()  # type: ignore[attr-defined]
+
+    original_seen = m._worker_exception_fingerprints.copy()
+    try:
+        m._worker_exception_fingerprints.clear()
+        before = value_for("abc")
+        m.record_worker_exceptions(
+            {
+                "task": "create_sheet_task",
+                "exceptions": [
+                    {"type": "ValueError", "fingerprint": "abc", "count": 40}
+                ],
+            }
+        )
+        assert value_for("abc") == before + 40
+
+        # once the cap is reached new fingerprints are counted as "other"
+        for i in range(m._WORKER_EXCEPTION_MAX_FINGERPRINTS):
+            m._worker_exception_fingerprints.add(f"fingerprint-{i}")
+        before_other = value_for("other")
+        m.record_worker_exceptions(
+            {
+                "task": "create_sheet_task",
+                "exceptions": [
+                    {"type": "ValueError", "fingerprint": "new", "count": 2}
+                ],
+            }
+        )
+        assert value_for("other") == before_other + 2
+        assert value_for("abc") == before + 40
+
+        # single exceptions from older workers
+        before_unknown = value_for("unknown")
+        m._worker_exception_fingerprints.add("unknown")
+        m.record_worker_exceptions(
+            {
+                "task": "create_sheet_task",
+                "type": "ValueError",
+                "exception": "boom",
+                "traceback": "...",
+            }
+        )
+        assert value_for("unknown") == before_unknown + 1
+    finally:
+        m._worker_exception_fingerprints.clear()
+        m._worker_exception_fingerprints.update(original_seen)
@@ -0,0 +1,144 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from auto_archiver.core import Metadata
+
+from app.shared.settings import DomainLimit
+from app.worker import domain_limiter
+from app.worker.domain_limiter import DomainLimiter
+
+
+@pytest.fixture()
+def m_redis():
+    with patch("app.worker.domain_limiter.Redis") as m:
+        yield m
+
+
+@pytest.fixture()
+def m_publish():
+    with patch("app.worker.domain_limiter.publish_metric") as m:
+        yield m
+
+
+@pytest.fixture()
+def limiter():
+    return DomainLimiter(
+        {
+            "x.com": DomainLimit(per_minute=30, burst=5, max_concurrency=2),
+            "www.Example.com": DomainLimit(max_concurrency=1),
+        },
+        retry_seconds=30,
+        lease_seconds=600,
+    )
+
+
+def test_domain_for(limiter):
+    assert limiter.domain_for("https://x.com/user/status/1") == "x.com"
+    assert limiter.domain_for("https://mobile.x.com/user") == "x.com"
+    assert limiter.domain_for("https://example.com") == "example.com"
+    assert limiter.domain_for("https://notx.com/user") is None
+    assert limiter.domain_for("https://x.com.evil.org") is None
+    assert limiter.domain_for("") is None
+
+
+def test_unlimited_domain_skips_redis(limiter, m_redis):
+    assert limiter.acquire("https://example.org", "task-id") == 0
+    limiter.release("https://example.org", "task-id")
+    m_redis.register_script.assert_not_called()
+
+
+def test_acquire_allowed(limiter, m_redis, m_publish):
+    m_redis.register_script.return_value.return_value = [
+        1,
+        b"ok",
+        b"0",
+        b"4",
+        1,
+    ]
+
+    assert limiter.acquire("https://x.com/1", "task-id") == 0
+    m_redis.register_script.assert_called_once_with(domain_limiter._ACQUIRE)
+    m_redis.register_script.return_value.assert_called_once_with(
+        keys=["domain-limit:bucket:x.com", "domain-limit:slots:x.com"],
+        args=[0.5, 5, 2, "task-id", 600, 30],
+    )
+    m_publish.assert_any_call("domain_limiter_tokens", 4.0, domain="x.com")
+    m_publish.assert_any_call("domain_limiter_in_flight", 1, domain="x.com")
+
+
+def test_acquire_leases_for_the_task_time_limit(limiter, m_redis, m_publish):
+    m_redis.register_script.return_value.return_value = [
+        1,
+        b"ok",
+        b"0",
+        b"4",
+        1,
+    ]
+
+    assert limiter.acquire("https://x.com/1", "task-id", 3900) == 0
+    args = m_redis.register_script.return_value.call_args.kwargs["args"]
+    assert args[4] == 3900
+
+
+def test_acquire_throttled(limiter, m_redis, m_publish):
+    m_redis.register_script.return_value.return_value = [
+        0,
+        b"rate",
+        b"1.5",
+        b"0.25",
+        2,
+    ]
+    assert limiter.acquire("https://x.com/1", "task-id") == 1.5
+    m_publish.assert_called_with(
+        "domain_limiter_throttled", domain="x.com", reason="rate"
+    )
+
+    # never asks to retry right away
+    m_redis.register_script.return_value.return_value = [
+        0,
+        b"rate",
+        b"0.01",
+        b"0.99",
+        0,
+    ]
+    assert limiter.acquire("https://x.com/1", "task-id") == 1
+
+
+def test_redis_unavailable_lets_everything_through(limiter, m_redis):
+    m_redis.register_script.return_value.side_effect = Exception("down")
+    assert limiter.acquire("https://x.com/1", "task-id") == 0
+    limiter.release("https://x.com/1", "task-id")
+
+
+def test_release(limiter, m_redis, m_publish):
+    m_redis.register_script.return_value.return_value = 0
+    limiter.release("https://example.com/1", "task-id")
+    m_redis.register_script.assert_called_once_with(domain_limiter._RELEASE)
+    m_redis.register_script.return_value.assert_called_once_with(
+        keys=["domain-limit:slots:example.com"], args=["task-id"]
+    )
+    m_publish.assert_called_once_with(
+        "domain_limiter_in_flight", 0, domain="example.com"
+    )
+
+
+def test_gate_stops_at_the_first_throttled_item(limiter):
+    items = iter([Metadata().set_url(f"https://x.com/{i}") for i in range(4)])
+    limiter.acquire = MagicMock(side_effect=[0, 12.0, 0])
+    limiter.release = MagicMock()
+    deferred = []
+
+    passed = []
+    for item in limiter.gate(items, "task-id", deferred):
+        # the slot is held while the item is being archived
+        assert limiter.release.call_count == len(passed)
+        passed.append(item.get_url())
+
+    assert passed == ["https://x.com/0"]
+    assert deferred == [12.0]
+    assert limiter.release.call_count == 1
+    # the rows after the throttled one are not read
+    assert [i.get_url() for i in items] == [
+        "https://x.com/2",
+        "https://x.com/3",
+    ]
@@ -0,0 +1,84 @@
+import json
+import traceback
+from unittest.mock import patch
+
+from app.worker import exception_summary
+from app.worker.exception_summary import ExceptionSummary, fingerprint
+
+
+def fail_row(url: str) -> tuple[Exception, str]:
+    try:
+        raise ValueError(f"could not archive {url} after 3 attempts")
+    except ValueError as e:
+        return e, traceback.format_exc()
+
+
+def test_fingerprint():
+    first, first_tb = fail_row("https://example.com/1")
+    second, second_tb = fail_row("https://example.org/2")
+    # same bug on other rows, and once the code moved to other lines
+    assert fingerprint(first, first_tb) == fingerprint(second, second_tb)
+    assert fingerprint(first, first_tb) == fingerprint(
+        first, first_tb.replace("line ", "line 1")
+    )
+    assert fingerprint(first, first_tb) != fingerprint(KeyError("x"), first_tb)
+    # without a traceback the message is used, its variable parts masked
+    assert fingerprint(first) == fingerprint(second)
+    assert fingerprint(first) != fingerprint(ValueError("another error"))
+
+
+def published(m_redis) -> list[dict]:
+    return [json.loads(call.args[1]) for call in m_redis.publish.call_args_list]
+
+
+def test_summary_counts_by_fingerprint():
+    exceptions = ExceptionSummary("create_sheet_task")
+    with patch.object(exception_summary, "Redis") as m_redis:
+        for i in range(100):
+            exceptions.add(*fail_row(f"https://example.com/{i}"))
+        exceptions.add(KeyError("missing"))
+        m_redis.publish.assert_not_called()
+
+        exceptions.publish()
+        exceptions.publish()
+
+    # one message, nothing more to publish the second time
+    [message] = published(m_redis)
+    assert message["task"] == "create_sheet_task"
+    assert [(e["type"], e["count"]) for e in message["exceptions"]] == [
+        ("ValueError", 100),
+        ("KeyError", 1),
+    ]
+    example = message["exceptions"][0]
+    assert example["exception"] == (
+        "could not archive https://example.com/0 after 3 attempts"
+    )
+    assert "fail_row" in example["traceback"]
+
+
+def test_summary_publishes_at_intervals():
+    exceptions = ExceptionSummary("create_sheet_task", interval_seconds=60)
+    with (
+        patch.object(exception_summary, "Redis") as m_redis,
+        patch.object(exception_summary.time, "monotonic") as m_monotonic,
+    ):
+        m_monotonic.return_value = exceptions._published_at + 30
+        exceptions.add(*fail_row("https://example.com/1"))
+        m_monotonic.return_value += 30
+        exceptions.add(*fail_row("https://example.com/2"))
+        exceptions.add(*fail_row("https://example.com/3"))
+
+    assert [
+        [e["count"] for e in m["exceptions"]] for m in published(m_redis)
+    ] == [[2]]
+    assert sum(e["count"] for e in exceptions.exceptions.values()) == 1
+
+
+def test_summary_publish_errors_are_logged():
+    exceptions = ExceptionSummary("create_sheet_task")
+    exceptions.add(KeyError("missing"))
+    with patch.object(exception_summary, "Redis") as m_redis:
+        m_redis.publish.side_effect = ConnectionError("down")
+        exceptions.publish()
+    # never raised into the task, the counts are not sent twice
+    assert exceptions.exceptions == {}
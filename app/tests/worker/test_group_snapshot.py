@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from app.shared.db import models
+from app.worker.group_snapshot import GroupSnapshot, GroupSnapshotCache
+
+
+@pytest.fixture()
+def m_redis():
+    with patch("app.worker.group_snapshot.Redis") as m:
+        m.get.return_value = b"1"
+        yield m
+
+
+@pytest.fixture()
+def m_get_group():
+    with patch("app.worker.group_snapshot.worker_crud.get_group") as m:
+        m.side_effect = lambda _, group_id: models.Group(
+            id=group_id,
+            orchestrator="orchestrator.yaml",
+            orchestrator_sheet="orchestrator-sheet.yaml",
+            permissions={"max_archive_lifespan_months": 6, "priority": "high"},
+        )
+        yield m
+
+
+def test_snapshot_from_group():
+    snapshot = GroupSnapshot.from_group(
+        models.Group(
+            id="spaceship",
+            orchestrator="a.yaml",
+            service_account_email="sa@example.com",
+            permissions={"max_archive_lifespan_months": 6},
+        )
+    )
+    assert snapshot.orchestrator == "a.yaml"
+    assert snapshot.orchestrator_sheet is None
+    assert snapshot.service_account_email == "sa@example.com"
+    assert snapshot.priority == "low"
+    with pytest.raises(TypeError):
+        snapshot.permissions["priority"] = "high"
+
+    store_until = snapshot.store_until()
+    expected = datetime.now() + timedelta(days=180)
+    assert abs((store_until - expected).total_seconds()) < 5
+
+
+def test_snapshot_store_until():
+    never = GroupSnapshot(
+        "g", None, None, None, {"max_archive_lifespan_months": -1}
+    )
+    assert never.store_until() is None
+
+    no_permissions = GroupSnapshot("g", None, None, None, {})
+    with pytest.raises(AssertionError, match="Group g has no permissions."):
+        no_permissions.store_until()
+
+
+def test_cache_loads_once(m_redis, m_get_group):
+    cache = GroupSnapshotCache(ttl_seconds=60)
+    first = cache.get("spaceship")
+    second = cache.get("spaceship")
+
+    assert first is second
+    assert first.priority == "high"
+    assert m_get_group.call_count == 1
+    cache.get("interdimensional")
+    assert m_get_group.call_count == 2
+    assert len(cache) == 2
+
+
+def test_cache_invalidated_by_config_version(m_redis, m_get_group):
+    cache = GroupSnapshotCache(ttl_seconds=60)
+    cache.get("spaceship")
+
+    m_redis.get.return_value = b"2"
+    cache.get("spaceship")
+    assert m_get_group.call_count == 2
+
+    # redis being unavailable keeps serving the cached snapshot
+    m_redis.get.side_effect = Exception("redis is down")
+    cache.get("spaceship")
+    assert m_get_group.call_count == 2
+
+
+def test_cache_ttl(m_redis, m_get_group):
+    cache = GroupSnapshotCache(ttl_seconds=0.05)
+    cache.get("spaceship")
+    time.sleep(0.1)
+    cache.get("spaceship")
+    assert m_get_group.call_count == 2
+
+
+def test_cache_missing_group(m_redis):
+    with patch(
+        "app.worker.group_snapshot.worker_crud.get_group", return_value=None
+    ):
+        with pytest.raises(AssertionError, match="Group nope not found."):
+            GroupSnapshotCache(ttl_seconds=60).get("nope")
@@ -0,0 +1,100 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.worker import memory_watchdog
+
+
+@pytest.fixture()
+def m_publish():
+    with patch("app.worker.memory_watchdog.publish_metric") as m:
+        yield m
+
+
+def test_child_max_rss_kb():
+    used_kb = memory_watchdog.child_max_rss_kb()
+    assert used_kb is None or used_kb > 1024
+
+    with patch("app.worker.memory_watchdog.mem_rss", return_value=0):
+        assert memory_watchdog.child_max_rss_kb() is None
+    with patch("app.worker.memory_watchdog.mem_rss", side_effect=ImportError()):
+        assert memory_watchdog.child_max_rss_kb() is None
+
+
+@patch("app.worker.memory_watchdog.socket.gethostname", return_value="host")
+def test_child_label(m_hostname):
+    with patch(
+        "app.worker.memory_watchdog.current_process",
+        return_value=MagicMock(index=3),
+    ):
+        assert memory_watchdog.child_label() == "host:3"
+    with patch(
+        "app.worker.memory_watchdog.current_process",
+        return_value=MagicMock(spec=[]),
+    ):
+        assert memory_watchdog.child_label() == "host:main"
+
+
+@patch("app.worker.memory_watchdog.child_label", return_value="host:0")
+@patch("app.worker.memory_watchdog.child_max_rss_kb")
+def test_check_child_rss(m_rss, m_label, m_publish):
+    # thresholds are in KB, as worker_max_memory_per_child
+    m_rss.return_value = 500 * 1024
+    assert not memory_watchdog.check_child_rss(1024 * 1024, "prefork")
+    m_publish.assert_called_once_with(
+        "worker_child_rss_bytes", 500 * 2**20, child="host:0"
+    )
+
+    m_publish.reset_mock()
+    m_rss.return_value = 1025 * 1024
+    assert memory_watchdog.check_child_rss(1024 * 1024, "prefork")
+    assert m_publish.call_args_list[-1].args == ("worker_child_recycles",)
+
+    # None never recycles, but still reports
+    m_publish.reset_mock()
+    assert not memory_watchdog.check_child_rss(None, "prefork")
+    m_publish.assert_called_once()
+
+    m_rss.return_value = None
+    m_publish.reset_mock()
+    assert not memory_watchdog.check_child_rss(1024 * 1024, "prefork")
+    m_publish.assert_not_called()
+
+
+@patch("app.worker.memory_watchdog.child_label", return_value="host:0")
+@patch("app.worker.memory_watchdog.mem_rss")
+def test_check_child_rss_uses_the_peak(m_mem_rss, m_label, m_publish):
+    # billiard recycles on the peak RSS, a child whose memory went back down
+    # after a large task is still replaced and counted
+    from app.worker.main import celery
+
+    threshold = celery.conf.worker_max_memory_per_child
+    m_mem_rss.return_value = threshold + 1
+    assert memory_watchdog.check_child_rss(threshold, "prefork")
+    assert m_publish.call_args_list[-1].args == ("worker_child_recycles",)
+
+
+@pytest.mark.parametrize("pool", ["threads", "gevent"])
+@patch("app.worker.memory_watchdog.logger")
+@patch("app.worker.memory_watchdog.child_label", return_value="host:main")
+@patch("app.worker.memory_watchdog.child_max_rss_kb", return_value=2048 * 1024)
+def test_check_child_rss_without_children(
+    m_rss, m_label, m_logger, m_publish, pool
+):
+    # nothing is recycled, so nothing is counted as such, and the peak never
+    # goes down, so the limit not being enforced is only logged once
+    with patch.object(memory_watchdog, "_unenforced_warned", False):
+        for _ in range(3):
+            assert not memory_watchdog.check_child_rss(1024 * 1024, pool)
+
+    m_logger.warning.assert_called_once()
+    assert pool in m_logger.warning.call_args.args[0]
+    assert [c.args[0] for c in m_publish.call_args_list] == [
+        "worker_child_rss_bytes"
+    ] * 3
+
+
+def test_recycling_is_configured_on_the_worker():
+    from app.worker.main import celery
+
+    assert celery.conf.worker_max_memory_per_child == 1536 * 1024
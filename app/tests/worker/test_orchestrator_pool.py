@@ -0,0 +1,192 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from auto_archiver.modules.cli_feeder.cli_feeder import CLIFeeder
+
+from app.worker.orchestrator_pool import OrchestratorPool, SharedLogger
+
+
+@pytest.fixture(autouse=True)
+def m_publish():
+    with patch("app.worker.orchestrator_pool.publish_metric") as m:
+        yield m
+
+
+@pytest.fixture()
+def m_orchestrator():
+    with patch("app.worker.orchestrator_pool.ArchivingOrchestrator") as m:
+        m.side_effect = lambda: MagicMock(setup_finished=True)
+        yield m
+
+
+def make_config(tmp_path, name="orchestration.yaml"):
+    config = tmp_path / name
+    config.write_text("steps: {}")
+    return ["--config", str(config), "--logging.enabled=false"]
+
+
+def events(m_publish):
+    return [
+        c.kwargs["event"]
+        for c in m_publish.call_args_list
+        if c.args[0] == "orchestrator_pool_events"
+    ]
+
+
+def test_miss_then_hit(tmp_path, m_orchestrator, m_publish):
+    pool = OrchestratorPool(2)
+    args = make_config(tmp_path)
+
+    first = pool.acquire(args, ["https://example.com/1"])
+    first.setup.assert_called_once_with(args)
+    pool.release(first, healthy=True)
+
+    second = pool.acquire(args, ["https://example.com/2"])
+    assert second is first
+    assert m_orchestrator.call_count == 1
+    assert events(m_publish) == ["miss", "hit"]
+    assert any(
+        c.args[0] == "orchestrator_setup_seconds"
+        for c in m_publish.call_args_list
+    )
+
+
+def test_reset_sets_url_on_cli_feeders(tmp_path, m_orchestrator):
+    pool = OrchestratorPool(1)
+    feeder = MagicMock(spec=CLIFeeder, config={"urls": ["https://old.com"]})
+    other = MagicMock(config={"sheet_id": "123"})
+    m_orchestrator.side_effect = lambda: MagicMock(
+        setup_finished=True, feeders=[feeder, other]
+    )
+
+    pool.acquire(make_config(tmp_path), ["https://new.com"])
+    assert feeder.config["urls"] == ["https://new.com"]
+    assert other.config == {"sheet_id": "123"}
+
+
+def test_cleanup_is_deferred_until_eviction(tmp_path, m_orchestrator):
+    real_cleanup = MagicMock()
+    m_orchestrator.side_effect = lambda: MagicMock(
+        setup_finished=True, cleanup=real_cleanup
+    )
+    pool = OrchestratorPool(1)
+    orchestrator = pool.acquire(make_config(tmp_path, "a.yaml"), ["https://a"])
+
+    # what feed() does once the feeders are exhausted must be a no-op
+    orchestrator.cleanup()
+    pool.release(orchestrator, healthy=True)
+    real_cleanup.assert_not_called()
+
+    # a different config evicts the least recently used entry
+    other = pool.acquire(make_config(tmp_path, "b.yaml"), ["https://b"])
+    pool.release(other, healthy=True)
+    real_cleanup.assert_called_once()
+    assert len(pool) == 1
+
+
+def test_lru_eviction(tmp_path, m_orchestrator, m_publish):
+    pool = OrchestratorPool(2)
+    a, b, c = (make_config(tmp_path, f"{n}.yaml") for n in "abc")
+    orchestrators = {}
+    for name, args in zip("abc", (a, b, c), strict=True):
+        orchestrators[name] = pool.acquire(args, ["https://x"])
+        pool.release(orchestrators[name], healthy=True)
+
+    assert len(pool) == 2
+    assert events(m_publish).count("evicted") == 1
+    # "a" was the least recently used so it needs a new setup
+    assert pool.acquire(a, ["https://x"]) is not orchestrators["a"]
+    assert pool.acquire(c, ["https://x"]) is orchestrators["c"]
+
+
+def test_unhealthy_release_is_discarded(tmp_path, m_orchestrator, m_publish):
+    pool = OrchestratorPool(2)
+    args = make_config(tmp_path)
+    orchestrator = pool.acquire(args, ["https://x"])
+    pool.release(orchestrator, healthy=False)
+
+    assert len(pool) == 0
+    assert "discarded" in events(m_publish)
+    assert pool.acquire(args, ["https://x"]) is not orchestrator
+
+
+def test_unhealthy_entry_is_replaced(tmp_path, m_orchestrator, m_publish):
+    pool = OrchestratorPool(2)
+    args = make_config(tmp_path)
+    orchestrator = pool.acquire(args, ["https://x"])
+    pool.release(orchestrator, healthy=True)
+
+    orchestrator.setup_finished = False
+    assert pool.acquire(args, ["https://x"]) is not orchestrator
+    assert "unhealthy" in events(m_publish)
+
+
+def test_config_change_misses(tmp_path, m_orchestrator):
+    pool = OrchestratorPool(2)
+    args = make_config(tmp_path)
+    orchestrator = pool.acquire(args, ["https://x"])
+    pool.release(orchestrator, healthy=True)
+
+    config = tmp_path / "orchestration.yaml"
+    mtime = config.stat().st_mtime
+    os.utime(config, (mtime + 10, mtime + 10))
+    assert pool.acquire(args, ["https://x"]) is not orchestrator
+
+
+def test_setup_failure_is_not_pooled(tmp_path, m_orchestrator):
+    pool = OrchestratorPool(2)
+    m_orchestrator.side_effect = None
+    m_orchestrator.return_value.setup.side_effect = SystemExit(1)
+
+    with pytest.raises(SystemExit):
+        pool.acquire(make_config(tmp_path), ["https://x"])
+    m_orchestrator.return_value.cleanup.assert_called_once()
+    assert len(pool) == 0
+
+
+def test_release_none_and_clear(tmp_path, m_orchestrator):
+    pool = OrchestratorPool(2)
+    pool.release(None, healthy=True)
+    pool.release(pool.acquire(make_config(tmp_path), ["https://x"]), True)
+    assert len(pool) == 1
+    pool.clear()
+    assert len(pool) == 0
+
+
+def test_shared_logger(tmp_path, m_orchestrator):
+    def setup(orchestrator):
+        def add_logger(args):
+            if orchestrator.logger_id is None:
+                orchestrator.logger_id = 7
+
+        return add_logger
+
+    def make():
+        orchestrator = MagicMock(setup_finished=True)
+        orchestrator.setup.side_effect = setup(orchestrator)
+        return orchestrator
+
+    m_orchestrator.side_effect = make
+    shared_logger = SharedLogger()
+    pool = OrchestratorPool(2, shared_logger)
+
+    first = pool.acquire(make_config(tmp_path, "a.yaml"), ["https://a"])
+    second = pool.acquire(make_config(tmp_path, "b.yaml"), ["https://b"])
+    assert shared_logger.logger_id == 7
+    assert first.logger_id == second.logger_id == 7
+
+
+def test_concurrent_tasks_with_same_config(tmp_path, m_orchestrator, m_publish):
+    pool = OrchestratorPool(2)
+    args = make_config(tmp_path)
+    first = pool.acquire(args, ["https://x"])
+    second = pool.acquire(args, ["https://y"])
+    assert first is not second
+
+    pool.release(first, healthy=True)
+    pool.release(second, healthy=True)
+    # only one stays warm per config, the other is cleaned up
+    assert len(pool) == 1
+    assert events(m_publish).count("evicted") == 1
+    assert pool.acquire(args, ["https://z"]) is second
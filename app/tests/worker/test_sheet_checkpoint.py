@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from auto_archiver.core import Metadata
+
+from app.shared.db import models
+from app.worker.sheet_checkpoint import SheetCheckpoint
+
+
+def make_item(title: str, row: int) -> Metadata:
+    gw = MagicMock()
+    gw.wks.title = title
+    item = Metadata().set_url(f"https://example.com/{title}/{row}")
+    item.set_context("gsheet", {"row": row, "worksheet": gw})
+    return item
+
+
+def stored(db_session) -> models.SheetCheckpoint | None:
+    db_session.expire_all()
+    return db_session.get(models.SheetCheckpoint, "sheet-1")
+
+
+def test_load_without_checkpoint(db_session):
+    checkpoint = SheetCheckpoint.load("sheet-1", "task-1", 3600)
+    assert checkpoint.run_id == "task-1"
+    assert checkpoint.runs == 1 and not checkpoint.resumed
+
+
+def test_gate_saves_progress(db_session):
+    checkpoint = SheetCheckpoint("sheet-1", "task-1")
+    items = [make_item("A", 2), make_item("A", 3), make_item("B", 2)]
+    stats = {"archived": 0, "failed": 0, "errors": []}
+    gated = checkpoint.gate(items, [], lambda: dict(stats), every_rows=2)
+
+    assert next(gated).get_url() == "https://example.com/A/2"
+    stats["archived"] = 1
+    next(gated)
+    # saved every 2 rows, not on every row
+    assert checkpoint.rows == {"A": 2}
+    assert stored(db_session) is None
+    stats["archived"] = 2
+    next(gated)
+    saved = stored(db_session)
+    assert saved.rows == {"A": 3}
+    assert saved.stats["archived"] == 2
+
+    assert list(gated) == []
+    checkpoint.save(stats)
+    saved = stored(db_session)
+    assert saved.rows == {"A": 3, "B": 2}
+    assert saved.finished_worksheets == ["A"]
+    assert saved.run_id == "task-1" and saved.runs == 1
+
+
+def test_gate_saves_after_some_time(db_session):
+    checkpoint = SheetCheckpoint("sheet-1", "task-1")
+    items = [make_item("A", 2), make_item("A", 3)]
+    gated = checkpoint.gate(items, [], lambda: {}, every_seconds=0)
+
+    next(gated)
+    next(gated)
+    assert stored(db_session).rows == {"A": 2}
+
+
+@pytest.mark.parametrize("skipped", ["deferred", "suppressed"])
+def test_gate_stops_at_skipped_rows(db_session, skipped):
+    checkpoint = SheetCheckpoint("sheet-1", "task-1")
+    deferred, suppressed = [], []
+
+    def feeder():
+        yield make_item("A", 2)
+        # row 3 is throttled or failed recently, it is not handed over
+        {"deferred": deferred, "suppressed": suppressed}[skipped].append(3)
+        yield make_item("A", 4)
+        yield make_item("A", 5)
+
+    gated = checkpoint.gate(feeder(), [deferred, suppressed], lambda: {})
+    assert [item.get_url() for item in gated] == [
+        "https://example.com/A/2",
+        "https://example.com/A/4",
+        "https://example.com/A/5",
+    ]
+    # a resume starts after row 2, so row 3 is picked up again
+    assert checkpoint.rows == {"A": 2}
+
+
+def test_resume_and_finish(db_session):
+    db_session.add(
+        models.SheetCheckpoint(
+            sheet_id="sheet-1",
+            run_id="first-task",
+            runs=1,
+            rows={"A": 7},
+            finished_worksheets=[],
+            stats={"archived": 3, "failed": 1, "errors": ["boom"]},
+        )
+    )
+    db_session.commit()
+
+    checkpoint = SheetCheckpoint.load("sheet-1", "second-task", 3600)
+    assert checkpoint.resumed
+    assert checkpoint.run_id == "first-task" and checkpoint.runs == 2
+    assert checkpoint.rows == {"A": 7}
+
+    stats = checkpoint.finish({"archived": 2, "failed": 0, "errors": []})
+    assert stats == {"archived": 5, "failed": 1, "errors": ["boom"]}
+    assert stored(db_session) is None
+
+
+def test_stale_checkpoint_is_dropped(db_session):
+    db_session.add(
+        models.SheetCheckpoint(
+            sheet_id="sheet-1",
+            run_id="old-task",
+            rows={"A": 7},
+            created_at=datetime.now() - timedelta(days=3),
+        )
+    )
+    db_session.commit()
+
+    checkpoint = SheetCheckpoint.load("sheet-1", "new-task", 3600)
+    assert not checkpoint.resumed and checkpoint.run_id == "new-task"
+    assert stored(db_session) is None
@@ -0,0 +1,167 @@
+from unittest.mock import MagicMock
+
+from app.worker import sheet_shards
+
+
+def make_gw(title, rows):
+    # rows: list of (url, status), the first row is the header
+    gw = MagicMock()
+    gw.wks.title = title
+    gw.count_rows.return_value = len(rows) + 1
+    gw.get_cell.side_effect = lambda row, col, fresh=False: rows[row - 2][
+        0 if col == "url" else 1
+    ]
+    return gw
+
+
+def make_orchestrator(pending: dict[str, list[int]], columns="BA"):
+    # worksheets with a URL in every row up to their last pending one, rows
+    # that are not pending already have a status, the header is row 1
+    worksheets = {}
+    for title, rows in pending.items():
+        last = max(rows, default=1)
+        worksheets[title] = {
+            "url": ["Link"]
+            + [f"https://example.com/{r}" for r in range(2, last + 1)],
+            "status": ["Archive status"]
+            + ["" if r in rows else "done" for r in range(2, last + 1)],
+        }
+    url_column, status_column = columns
+
+    def values_batch_get(ranges, params):
+        value_ranges = []
+        for a1 in ranges:
+            title, cells = a1.rsplit("!", 1)
+            sheet = worksheets[title.strip("'")]
+            if params["majorDimension"] == "ROWS":
+                header = {url_column: "Link", status_column: "Archive Status"}
+                values = [[header.get(c, "") for c in "AB"]]
+            elif cells.startswith(url_column):
+                values = [sheet["url"]]
+            else:
+                # the API leaves out trailing empty cells
+                statuses = list(sheet["status"])
+                while statuses and not statuses[-1]:
+                    statuses.pop()
+                values = [statuses]
+            value_ranges.append({"range": a1, "values": values})
+        return {"valueRanges": value_ranges}
+
+    spreadsheet = MagicMock()
+    spreadsheet.values_batch_get.side_effect = values_batch_get
+    feeder = MagicMock(
+        header=1,
+        columns={"url": "link", "status": "archive status"},
+    )
+    feeder.open_sheet.return_value = spreadsheet
+    feeder.enumerate_sheets.return_value = [
+        MagicMock(title=title) for title in worksheets
+    ]
+    feeder.should_process_sheet.return_value = True
+    return MagicMock(feeders=[feeder])
+
+
+def test_plan_shards_splits_pending_rows():
+    orchestrator = make_orchestrator(
+        {"Sheet1": list(range(2, 12)), "Sheet2": [5, 9]}
+    )
+
+    shards = sheet_shards.plan_shards(orchestrator, max_shards=3, min_rows=4)
+    assert shards == [
+        [("Sheet1", 2, 5)],
+        [("Sheet1", 6, 9)],
+        [("Sheet1", 10, 11), ("Sheet2", 5, 9)],
+    ]
+    # the feeder is not iterated, it reads every pending row again
+    feeder = orchestrator.feeders[0]
+    feeder.__iter__.assert_not_called()
+    # one read for the headers, one for the url and status columns
+    spreadsheet = feeder.open_sheet.return_value
+    assert spreadsheet.values_batch_get.call_count == 2
+    assert spreadsheet.values_batch_get.call_args.args[0] == [
+        "'Sheet1'!B:B",
+        "'Sheet1'!A:A",
+        "'Sheet2'!B:B",
+        "'Sheet2'!A:A",
+    ]
+
+
+def test_plan_shards_respects_min_rows_and_max_shards():
+    pending = {"Sheet1": list(range(2, 12))}
+    few = sheet_shards.plan_shards(make_orchestrator(pending), 10, 25)
+    assert few == [[("Sheet1", 2, 11)]]
+
+    many = sheet_shards.plan_shards(make_orchestrator(pending), 2, 1)
+    assert len(many) == 2
+
+    assert sheet_shards.plan_shards(make_orchestrator({}), 5, 1) == []
+
+
+def test_plan_shards_skips_worksheets():
+    orchestrator = make_orchestrator(
+        {"Sheet1": [2, 3, 8], "Done": [2], "Blocked": [2]}
+    )
+    feeder = orchestrator.feeders[0]
+    feeder.should_process_sheet.side_effect = lambda title: title != "Blocked"
+
+    # resumed after row 3 of Sheet1, with Done finished
+    shards = sheet_shards.plan_shards(
+        orchestrator, 5, 1, {"Sheet1": 3}, ["Done"]
+    )
+    assert shards == [[("Sheet1", 8, 8)]]
+
+    # worksheets without a status column are left out, as the feeder does
+    orchestrator = make_orchestrator({"Sheet1": [2]}, columns="BC")
+    assert sheet_shards.plan_shards(orchestrator, 5, 1) == []
+
+
+def test_restrict_to_rows():
+    feeder = MagicMock(spec=["_process_rows", "_set_context"])
+    orchestrator = MagicMock(feeders=[feeder])
+    rows = [
+        ("https://example.com/2", ""),
+        ("https://example.com/3", "done"),
+        ("", ""),
+        ("https://example.com/5", None),
+        ("https://example.com/6", ""),
+    ]
+
+    sheet_shards.restrict_to_rows(
+        orchestrator, [("Sheet1", 2, 5), ("Other", 2, 6)]
+    )
+    items = list(feeder._process_rows(make_gw("Sheet1", rows)))
+
+    assert [i.get_url() for i in items] == [
+        "https://example.com/2",
+        "https://example.com/5",
+    ]
+    assert [c.args[2] for c in feeder._set_context.call_args_list] == [2, 5]
+
+
+def test_resume_after():
+    feeder = MagicMock(spec=["_process_rows", "_set_context"], header=1)
+    orchestrator = MagicMock(feeders=[feeder])
+    rows = [(f"https://example.com/{row}", "") for row in range(2, 7)]
+
+    sheet_shards.resume_after(orchestrator, {"Sheet1": 4}, ["Done"])
+
+    resumed = list(feeder._process_rows(make_gw("Sheet1", rows)))
+    assert [i.get_url() for i in resumed] == [
+        "https://example.com/5",
+        "https://example.com/6",
+    ]
+    # other worksheets start over, finished ones are not read at all
+    assert len(list(feeder._process_rows(make_gw("Sheet2", rows)))) == 5
+    done = make_gw("Done", rows)
+    assert list(feeder._process_rows(done)) == []
+    done.get_cell.assert_not_called()
+
+
+def test_merge_stats():
+    assert sheet_shards.merge_stats(
+        [
+            {"archived": 2, "failed": 1, "errors": ["a"]},
+            {"archived": 3, "failed": 0, "errors": []},
+            {"archived": 0, "failed": 1, "errors": ["b"]},
+        ]
+    ) == {"archived": 5, "failed": 2, "errors": ["a", "b"]}
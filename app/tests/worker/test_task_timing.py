@@ -0,0 +1,94 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.worker import task_timing
+from app.worker.task_timing import PhaseTimer
+
+
+@pytest.fixture()
+def m_publish():
+    with patch("app.worker.task_timing.publish_metric_batch") as m:
+        yield m
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("https://x.com/user/status/1", "x.com"),
+        ("https://mobile.twitter.com/user", "twitter.com"),
+        ("https://www.youtube.com/watch?v=1", "youtube.com"),
+        ("https://example.com/page", "other"),
+        (None, "other"),
+    ],
+)
+def test_metric_domain(url, expected):
+    assert task_timing.metric_domain(url) == expected
+
+
+def test_phases(m_publish):
+    timer = PhaseTimer(
+        "create_archive_task",
+        "spaceship",
+        {"routing_key": "high_priority"},
+        "https://x.com/1",
+        interval_seconds=0,
+    )
+
+    with timer.phase(task_timing.SETUP):
+        pass
+    with pytest.raises(ValueError), timer.phase(task_timing.FEED):
+        raise ValueError()
+    timer.observe(task_timing.DB_INSERT, 2.5, "https://example.com")
+    timer.observe(task_timing.DB_INSERT, 1.5, "https://example.com")
+    m_publish.assert_not_called()
+    timer.done()
+
+    # every phase of the task in one message
+    m_publish.assert_called_once()
+    labels = {
+        "task": "create_archive_task",
+        "group": "spaceship",
+        "queue": "high_priority",
+        "domain": "x.com",
+    }
+    samples = m_publish.call_args.args[0]
+    assert [(s["metric"], s["labels"]) for s in samples] == [
+        ("task_phase_seconds", {**labels, "phase": "setup"}),
+        ("task_phase_seconds", {**labels, "phase": "feed"}),
+        (
+            "task_phase_seconds",
+            {**labels, "phase": "db_insert", "domain": "other"},
+        ),
+        ("task_phase_seconds", {**labels, "phase": "total"}),
+    ]
+    assert samples[2]["values"] == [2.5, 1.5]
+    assert timer.durations[task_timing.DB_INSERT] == 1.5
+    assert all(v >= 0 for s in samples for v in s["values"])
+    assert timer.pending == {}
+
+
+def test_publishes_every_interval(m_publish):
+    timer = PhaseTimer(
+        "create_sheet_task", "spaceship", None, interval_seconds=60
+    )
+
+    timer.observe(task_timing.FEED, 1)
+    m_publish.assert_not_called()
+
+    with patch("time.monotonic", return_value=time.monotonic() + 61):
+        timer.observe(task_timing.FEED, 2)
+    m_publish.assert_called_once()
+    assert m_publish.call_args.args[0][0]["values"] == [1, 2]
+
+    # nothing is sent twice
+    m_publish.reset_mock()
+    timer.publish()
+    m_publish.assert_called_once_with([])
+
+
+def test_unknown_queue(m_publish):
+    timer = PhaseTimer("create_sheet_task", "spaceship", None)
+    assert timer.labels["queue"] == "unknown"
+    assert timer.labels["domain"] == "other"
@@ -1,12 +1,57 @@
 from datetime import datetime
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 from auto_archiver.core import Media, Metadata
+from celery.exceptions import Ignore, Retry, SoftTimeLimitExceeded
 
-from app.shared import constants, schemas
+from app.shared import constants, failures, schemas
+from app.shared.constants import STATUS_FAILURE, STATUS_SUCCESS
 from app.shared.db import models
-from app.worker.main import create_archive_task, create_sheet_task
+from app.shared.settings import get_settings
+from app.worker import sheet_shards
+from app.worker.group_snapshot import GroupSnapshot
+from app.worker.main import (
+    DOMAIN_LIMITER,
+    ORCHESTRATOR_POOL,
+    create_archive_batch_task,
+    create_archive_task,
+    create_sheet_shard_task,
+    create_sheet_task,
+    fail_followers,
+    merge_sheet_shards_task,
+    remember_failed_url,
+    size_db_pool,
+)
+
+
+GROUP = GroupSnapshot(
+    id="interstellar",
+    orchestrator="orchestrator.yaml",
+    orchestrator_sheet="orchestrator-sheet.yaml",
+    service_account_email=None,
+    permissions={"max_archive_lifespan_months": -1},
+)
+
+
+@pytest.fixture(autouse=True)
+def m_group_snapshots():
+    with patch("app.worker.main.GROUP_SNAPSHOTS") as m:
+        m.get.return_value = GROUP
+        yield m
+
+
+@pytest.fixture(autouse=True)
+def m_singleflight_finish():
+    with patch("app.worker.main.singleflight.finish", return_value=[]) as m:
+        yield m
+
+
+@pytest.fixture(autouse=True)
+def clear_orchestrator_pool():
+    ORCHESTRATOR_POOL.clear()
+    yield
+    ORCHESTRATOR_POOL.clear()
 
 
 class TestCreateArchiveTask:
@@ -19,7 +64,7 @@ class TestCreateArchiveTask:
         group_id="interstellar",
     )
 
-    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
     @patch("app.worker.main.get_all_urls", return_value=[])
     @patch("app.worker.main.insert_result_into_db")
     @patch("app.worker.main.get_store_until", return_value=datetime.now())
@@ -45,21 +90,61 @@ class TestCreateArchiveTask:
         task = create_archive_task(self.archive.model_dump_json())
 
         m_args.assert_called_once()
-        m_store.assert_called_once_with("interstellar")
+        m_store.assert_called_once_with(GROUP)
         m_insert.assert_called_once()
         m_urls.assert_called_once()
         m_orchestrator.return_value.feed.assert_called_once()
         m_orchestrator.return_value.setup.assert_called_once()
 
-        assert task["status"] == "success"
-        assert task["metadata"]["url"] == self.URL
-        assert len(task["media"]) == 0
+        # only a reference is kept in the result backend
+        assert task == {
+            "archive_id": "this-just-in",
+            "status": "SUCCESS",
+            "url": self.URL,
+        }
+        stored = m_insert.call_args[0][0]
+        assert stored.result["status"] == "success"
+        assert stored.result["metadata"]["url"] == self.URL
+        assert len(stored.result["media"]) == 0
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.insert_result_into_db")
+    @patch("app.worker.main.get_store_until", return_value=datetime.now())
+    @patch(
+        "app.worker.main.get_orchestrator_args", return_value=["arg1", "arg2"]
+    )
+    @patch("celery.app.task.Task.request")
+    def test_reuses_pooled_orchestrator(
+        self, m_req, m_args, m_store, m_insert, m_urls, m_orchestrator
+    ):
+        m_req.id = "this-just-in"
+        m_orchestrator.return_value.feed.side_effect = lambda: iter(
+            [Metadata().set_url(self.URL).success()]
+        )
+
+        create_archive_task(self.archive.model_dump_json())
+        create_archive_task(self.archive.model_dump_json())
+
+        assert m_orchestrator.call_count == 1
+        m_orchestrator.return_value.setup.assert_called_once()
+        assert m_orchestrator.return_value.feed.call_count == 2
+        assert len(ORCHESTRATOR_POOL) == 1
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_failed_orchestrator_is_not_pooled(self, m_args, m_orchestrator):
+        m_orchestrator.return_value.feed.side_effect = Exception("boom")
+
+        with pytest.raises(Exception, match="boom"):
+            create_archive_task(self.archive.model_dump_json())
+        assert len(ORCHESTRATOR_POOL) == 0
 
     def test_raise_invalid(self):
         with pytest.raises(Exception) as _:
             create_archive_task(self.archive.model_dump_json())
 
-    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
     @patch("app.worker.main.get_orchestrator_args")
     def test_raise_db_error(self, m_args, m_orchestrator):
         m_orchestrator.return_value.feed.side_effect = Exception(
@@ -72,7 +157,7 @@ class TestCreateArchiveTask:
         m_args.assert_called_once()
         m_orchestrator.return_value.feed.assert_called_once()
 
-    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
     @patch("app.worker.main.insert_result_into_db", return_value=None)
     @patch("app.worker.main.get_orchestrator_args")
     def test_raise_empty_result(self, m_args, m_insert, m_orchestrator):
@@ -83,6 +168,435 @@ class TestCreateArchiveTask:
         assert str(e.value) == "UNABLE TO archive: https://example-live.com"
         m_orchestrator.return_value.feed.assert_called_once()
 
+    @patch("app.worker.main.publish_metric")
+    def test_permanent_failure_is_not_retried(self, m_publish):
+        archive = self.archive.model_copy(update={"url": "https://localhost/x"})
+
+        with patch.object(create_archive_task, "retry") as m_retry:
+            with pytest.raises(failures.PermanentFailure) as e:
+                create_archive_task(archive.model_dump_json())
+
+        m_retry.assert_not_called()
+        assert e.value.failure_class == failures.INVALID_URL
+        assert "Localhost URLs" in str(e.value)
+        m_publish.assert_any_call(
+            "task_failures",
+            kind=failures.PERMANENT,
+            retry="no",
+            task="create_archive_task",
+            failure_class=failures.INVALID_URL,
+        )
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_orchestrator_config_error_is_not_retried(
+        self, m_args, m_orchestrator
+    ):
+        m_orchestrator.return_value.setup.side_effect = SystemExit(1)
+
+        with patch.object(create_archive_task, "retry") as m_retry:
+            with pytest.raises(failures.PermanentFailure) as e:
+                create_archive_task(self.archive.model_dump_json())
+
+        m_retry.assert_not_called()
+        assert e.value.failure_class == failures.CONFIG
+        assert str(e.value) == f"UNABLE TO archive: {self.URL}"
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.publish_metric")
+    def test_transient_failure_is_retried(
+        self, m_publish, m_args, m_orchestrator
+    ):
+        m_orchestrator.return_value.feed.side_effect = ConnectionError("reset")
+
+        with patch.object(
+            create_archive_task, "retry", side_effect=Retry()
+        ) as m_retry:
+            with pytest.raises(Retry):
+                create_archive_task(self.archive.model_dump_json())
+
+        assert isinstance(m_retry.call_args.kwargs["exc"], ConnectionError)
+        assert m_publish.call_args_list[-1].args[0] == "task_failure_seconds"
+        assert m_publish.call_args_list[-1].kwargs == {
+            "kind": failures.TRANSIENT,
+            "retry": "no",
+            "task": "create_archive_task",
+            "failure_class": failures.NETWORK,
+        }
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args", return_value=["arg1"])
+    @patch("celery.app.task.Task.request")
+    def test_resolves_followers(
+        self, m_req, m_args, m_orchestrator, m_singleflight_finish, db_session
+    ):
+        m_req.id = "leader-id"
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URL).success()]
+        )
+        follower = self.archive.model_copy(
+            update={"id": "follower-id", "author_id": "morty@example.com"}
+        )
+        m_singleflight_finish.return_value = [follower.model_dump_json()]
+
+        with (
+            patch.object(create_archive_task, "_backend") as m_backend,
+            patch("app.worker.main.singleflight.refresh") as m_refresh,
+        ):
+            result = create_archive_task(self.archive.model_dump_json())
+
+        # once running, the lock only needs to outlive the task
+        assert m_refresh.call_args[0][1:] == (
+            "interstellar",
+            self.URL,
+            "leader-id",
+            get_settings().ARCHIVE_SINGLEFLIGHT_LOCK_SECONDS,
+        )
+
+        m_singleflight_finish.assert_called_once()
+        assert m_singleflight_finish.call_args[0][1:] == (
+            "interstellar",
+            self.URL,
+            "leader-id",
+        )
+        assert result["archive_id"] == "leader-id"
+        m_backend.mark_as_done.assert_called_once_with(
+            "follower-id",
+            {"archive_id": "follower-id", "status": "SUCCESS", "url": self.URL},
+        )
+        stored = db_session.get(models.Archive, "follower-id")
+        assert stored.source_archive_id == "leader-id"
+        assert stored.author_id == "morty@example.com"
+        assert (
+            stored.result == db_session.get(models.Archive, "leader-id").result
+        )
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.insert_result_into_db")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.task_timing.publish_metric_batch")
+    @patch("app.worker.main.TIME_LIMITS")
+    @patch("celery.app.task.Task.request")
+    def test_records_phase_timings(
+        self, m_req, m_time_limits, m_publish, m_args, m_insert, m_orchestrator
+    ):
+        m_req.id = "this-just-in"
+        m_req.delivery_info = {"routing_key": "high_priority"}
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URL).success()]
+        )
+
+        create_archive_task(self.archive.model_dump_json())
+
+        # all the phases of the task in one message
+        m_publish.assert_called_once()
+        samples = m_publish.call_args.args[0]
+        phases = [sample["labels"]["phase"] for sample in samples]
+        assert phases == [
+            "setup",
+            "feed",
+            "get_all_urls",
+            "serialize",
+            "db_insert",
+            "total",
+        ]
+        assert samples[-1]["labels"] == {
+            "phase": "total",
+            "task": "create_archive_task",
+            "group": "interstellar",
+            "queue": "high_priority",
+            "domain": "other",
+        }
+        # the archiving duration feeds the learned time limits of the host
+        feed_seconds = samples[1]["values"][0]
+        m_time_limits.record_url.assert_called_once_with(self.URL, feed_seconds)
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.TIME_LIMITS")
+    @patch("celery.app.task.Task.request")
+    def test_soft_time_limit_is_recorded(
+        self, m_req, m_time_limits, m_args, m_orchestrator
+    ):
+        m_req.id = "too-slow"
+        m_req.retries = 0
+        m_req.delivery_info = {}
+        m_req.timelimit = (1200, 900)
+        m_orchestrator.return_value.feed.side_effect = SoftTimeLimitExceeded()
+
+        with (
+            patch.object(create_archive_task, "retry", side_effect=Retry()),
+            pytest.raises(Retry),
+        ):
+            create_archive_task(self.archive.model_dump_json())
+
+        # at least the limit it ran under, so the learned limit can rise
+        m_time_limits.record_url.assert_not_called()
+        m_time_limits.record_url_timeout.assert_called_once()
+        url, _, limit = m_time_limits.record_url_timeout.call_args.args
+        assert (url, limit) == (self.URL, 900)
+
+        # sent without a learned limit, the task's own applies
+        m_req.timelimit = None
+        with (
+            patch.object(create_archive_task, "retry", side_effect=Retry()),
+            pytest.raises(Retry),
+        ):
+            create_archive_task(self.archive.model_dump_json())
+        assert m_time_limits.record_url_timeout.call_args.args[2] == 30 * 60
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.DOMAIN_LIMITER")
+    @patch("celery.app.task.Task.request")
+    def test_throttled_is_requeued(self, m_req, m_limiter, m_orchestrator):
+        m_req.id = "throttled-id"
+        m_req.args = [self.archive.model_dump_json()]
+        m_req.kwargs = {}
+        m_req.delivery_info = {"routing_key": "high_priority", "priority": 10}
+        m_req.timelimit = (600, 300)
+        m_limiter.acquire.return_value = 20.0
+
+        with (
+            patch.object(create_archive_task, "apply_async") as m_apply,
+            pytest.raises(Ignore),
+        ):
+            create_archive_task(self.archive.model_dump_json())
+
+        # the slot is leased for the hard time limit of the task
+        m_limiter.acquire.assert_called_once_with(self.URL, "throttled-id", 600)
+        m_orchestrator.assert_not_called()
+        m_limiter.release.assert_not_called()
+        kwargs = m_apply.call_args.kwargs
+        assert kwargs["task_id"] == "throttled-id"
+        assert kwargs["args"] == [self.archive.model_dump_json()]
+        assert kwargs["queue"] == "high_priority"
+        assert kwargs["priority"] == 10
+        assert kwargs["time_limit"] == 600
+        assert kwargs["soft_time_limit"] == 300
+        assert 20 <= kwargs["countdown"] <= 30
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.DOMAIN_LIMITER")
+    def test_domain_slot_released_on_failure(
+        self, m_limiter, m_args, m_orchestrator
+    ):
+        m_limiter.acquire.return_value = 0
+        m_orchestrator.return_value.feed.side_effect = Exception("boom")
+
+        with pytest.raises(Exception, match="boom"):
+            create_archive_task(self.archive.model_dump_json())
+        m_limiter.release.assert_called_once()
+        assert m_limiter.release.call_args[0][0] == self.URL
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.insert_result_into_db")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.NEGATIVE_CACHE")
+    @patch("celery.app.task.Task.request")
+    def test_nothing_archived_is_remembered(
+        self, m_req, m_cache, m_args, m_insert, m_urls, m_orchestrator
+    ):
+        m_req.id = "this-just-in"
+        nothing = Metadata().set_url(self.URL)
+        nothing.status = "nothing archived"
+        m_orchestrator.return_value.feed.return_value = iter([nothing])
+
+        create_archive_task(self.archive.model_dump_json())
+
+        m_cache.record.assert_called_once_with(
+            self.URL, failures.NOTHING_ARCHIVED, "nothing archived"
+        )
+        m_cache.forget.assert_not_called()
+
+    @patch("app.worker.main.NEGATIVE_CACHE")
+    def test_failed_url_is_remembered(self, m_cache):
+        remember_failed_url(
+            create_archive_task,
+            exception=failures.PermanentFailure("gone", failures.REMOVED),
+            args=[self.archive.model_dump_json()],
+        )
+        m_cache.record.assert_called_once_with(
+            self.URL, failures.REMOVED, "gone"
+        )
+
+    def test_leader_failure_fails_followers(self, m_singleflight_finish):
+        m_singleflight_finish.return_value = ['{"id": "follower-id"}']
+        error = Exception("boom")
+
+        with patch.object(create_archive_task, "_backend") as m_backend:
+            fail_followers(
+                create_archive_task,
+                task_id="leader-id",
+                exception=error,
+                args=[self.archive.model_dump_json()],
+            )
+
+        assert m_singleflight_finish.call_args[0][3] == "leader-id"
+        m_backend.mark_as_failure.assert_called_once_with("follower-id", error)
+
+
+class TestCreateArchiveBatchTask:
+    URLS = ["https://example-1.com", "https://example-2.com"]
+    archives = [
+        schemas.ArchiveCreate(
+            id=f"url-task-{i}",
+            url=url,
+            author_id="rick@example.com",
+            group_id="interstellar",
+        )
+        for i, url in enumerate(URLS)
+    ]
+
+    @pytest.fixture(autouse=True)
+    def m_backend(self):
+        with patch.object(create_archive_batch_task, "_backend") as m:
+            yield m
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.insert_result_into_db")
+    @patch("app.worker.main.get_store_until", return_value=datetime.now())
+    @patch(
+        "app.worker.main.get_orchestrator_args", return_value=["arg1", "arg2"]
+    )
+    def test_success_and_failure(
+        self, m_args, m_store, m_insert, m_urls, m_orchestrator, m_backend
+    ):
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URLS[0]).success(), None]
+        )
+
+        res = create_archive_batch_task(
+            [a.model_dump_json() for a in self.archives]
+        )
+
+        # one orchestrator setup, one feed and one group lookup for the batch
+        m_orchestrator.return_value.setup.assert_called_once()
+        m_orchestrator.return_value.feed.assert_called_once()
+        m_store.assert_called_once_with(GROUP)
+        m_insert.assert_called_once()
+        assert m_insert.call_args[0][0].id == "url-task-0"
+
+        assert res == {
+            "results": [
+                {
+                    "id": "url-task-0",
+                    "url": self.URLS[0],
+                    "status": STATUS_SUCCESS,
+                },
+                {
+                    "id": "url-task-1",
+                    "url": self.URLS[1],
+                    "status": STATUS_FAILURE,
+                    "error": f"UNABLE TO archive: {self.URLS[1]}",
+                },
+            ]
+        }
+        # every url gets its own task result for /task/{id} polling
+        assert m_backend.mark_as_started.call_count == 2
+        m_backend.mark_as_done.assert_called_once()
+        assert m_backend.mark_as_done.call_args[0][0] == "url-task-0"
+        m_backend.mark_as_failure.assert_called_once()
+        assert m_backend.mark_as_failure.call_args[0][0] == "url-task-1"
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.insert_result_into_db")
+    @patch("app.worker.main.get_store_until", return_value=None)
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_results_are_matched_by_url(
+        self, m_args, m_store, m_insert, m_urls, m_orchestrator, m_backend
+    ):
+        # the first url was left out of the feed
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URLS[1]).success()]
+        )
+
+        res = create_archive_batch_task(
+            [a.model_dump_json() for a in self.archives]
+        )
+
+        assert [(r["id"], r["status"]) for r in res["results"]] == [
+            ("url-task-0", STATUS_FAILURE),
+            ("url-task-1", STATUS_SUCCESS),
+        ]
+        assert m_insert.call_args[0][0].url == self.URLS[1]
+        assert m_backend.mark_as_done.call_args[0][0] == "url-task-1"
+        assert m_backend.mark_as_failure.call_args[0][0] == "url-task-0"
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.insert_result_into_db")
+    @patch("app.worker.main.get_store_until", return_value=None)
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_resolves_and_fails_followers(
+        self, m_args, m_store, m_insert, m_urls, m_orchestrator, m_backend
+    ):
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URLS[0]).success(), None]
+        )
+        followers = {
+            archive.url: archive.model_copy(update={"id": f"follower-{i}"})
+            for i, archive in enumerate(self.archives)
+        }
+
+        with (
+            patch("app.worker.main.singleflight.refresh") as m_refresh,
+            patch("app.worker.main.singleflight.finish") as m_finish,
+        ):
+            m_finish.side_effect = lambda _, g, url, leader_id: [
+                followers[url].model_dump_json()
+            ]
+            create_archive_batch_task(
+                [a.model_dump_json() for a in self.archives]
+            )
+
+        assert [c[0][3] for c in m_refresh.call_args_list] == [
+            "url-task-0",
+            "url-task-1",
+        ]
+        assert [c[0][3] for c in m_finish.call_args_list] == [
+            "url-task-0",
+            "url-task-1",
+        ]
+        assert [c[0][0] for c in m_backend.mark_as_done.call_args_list] == [
+            "url-task-0",
+            "follower-0",
+        ]
+        assert m_insert.call_args_list[1][0][0].source_archive_id == (
+            "url-task-0"
+        )
+        assert [c[0][0] for c in m_backend.mark_as_failure.call_args_list] == [
+            "url-task-1",
+            "follower-1",
+        ]
+
+    @patch("app.worker.orchestrator_pool.ArchivingOrchestrator")
+    @patch("app.worker.main.get_store_until", return_value=None)
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_unreached_urls_fail(
+        self, m_args, m_store, m_orchestrator, m_backend
+    ):
+        m_orchestrator.return_value.feed.side_effect = SystemExit(1)
+
+        res = create_archive_batch_task(
+            [a.model_dump_json() for a in self.archives]
+        )
+
+        assert [r["status"] for r in res["results"]] == [STATUS_FAILURE] * 2
+        assert m_backend.mark_as_failure.call_count == 2
+        assert len(ORCHESTRATOR_POOL) == 0
+
+    def test_mixed_groups(self):
+        other = self.archives[1].model_copy(update={"group_id": "other"})
+        with pytest.raises(AssertionError, match="same group"):
+            create_archive_batch_task(
+                [self.archives[0].model_dump_json(), other.model_dump_json()]
+            )
+
 
 class TestCreateSheetTask:
     URL = "https://example-live.com"
@@ -117,12 +631,10 @@ class TestCreateSheetTask:
 
         res = create_sheet_task(self.sheet.model_dump_json())
 
-        m_args.assert_called_once_with(
-            "interstellar", True, [constants.SHEET_ID, "123"]
-        )
+        m_args.assert_called_once_with(GROUP, True, [constants.SHEET_ID, "123"])
         m_orchestrator.return_value.setup.assert_called_once()
         m_orchestrator.return_value.feed.assert_called_once()
-        m_store.assert_called_with("interstellar")
+        m_store.assert_called_with(GROUP)
         assert m_store.call_count == 2
         assert m_uuid.call_count == 2
         assert isinstance(res, dict)
@@ -146,3 +658,414 @@ class TestCreateSheetTask:
         assert inserted.group_id == "interstellar"
         assert inserted.author_id == "rick@example.com"
         assert inserted.public is False
+
+    @patch("app.worker.main.publish_metric")
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.SHEET_LEASES")
+    @patch("celery.app.task.Task.request")
+    def test_skipped_while_another_run_is_active(
+        self, m_req, m_leases, m_orchestrator, m_publish
+    ):
+        m_req.id = "duplicate-task"
+        m_leases.claim.return_value = (False, "running-task")
+
+        res = create_sheet_task(self.sheet.model_dump_json())
+
+        m_leases.claim.assert_called_once_with("123", "duplicate-task", 600)
+        m_leases.holding.assert_not_called()
+        m_orchestrator.assert_not_called()
+        assert not res["success"]
+        assert res["active_task_id"] == "running-task"
+        m_publish.assert_called_once_with(
+            "sheet_runs_coalesced", source="worker"
+        )
+
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.SheetProgress")
+    @patch("celery.app.task.Task.request")
+    def test_publishes_progress(
+        self, m_req, m_progress, m_args, m_orchestrator, m_urls, db_session
+    ):
+        m_req.id = "sheet-task-id"
+        m_req.delivery_info = {}
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URL).success(), False]
+        )
+
+        res = create_sheet_task(self.sheet.model_dump_json())
+
+        assert m_progress.call_args.args[1:] == ("sheet-task-id", "123")
+        progress = m_progress.return_value
+        progress.start.assert_called_once()
+        # archived rows are reported once they are stored
+        assert [c.args for c in progress.row.call_args_list] == [
+            (None, False),
+            (self.URL, True),
+        ]
+        progress.publish.assert_called_once_with(
+            "done", success=True, stats=res["stats"]
+        )
+
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_store_until", return_value=datetime.now())
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_soft_time_limit_flushes_pending_rows(
+        self, m_args, m_store, m_orchestrator, m_urls, db_session
+    ):
+        def feed():
+            yield Metadata().set_url(self.URL).success()
+            raise SoftTimeLimitExceeded()
+
+        m_orchestrator.return_value.feed.return_value = feed()
+
+        with pytest.raises(SoftTimeLimitExceeded):
+            create_sheet_task(self.sheet.model_dump_json())
+
+        # the row archived before the time limit was not lost
+        assert (
+            db_session.query(models.Archive)
+            .filter(models.Archive.url == self.URL)
+            .count()
+            == 1
+        )
+        m_orchestrator.return_value.cleanup.assert_called_once()
+
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("celery.app.task.Task.request")
+    def test_interrupted_run_is_resumed(
+        self, m_req, m_args, m_orchestrator, m_urls, db_session
+    ):
+        gw = MagicMock()
+        gw.wks.title = "Sheet1"
+
+        def row(n):
+            item = Metadata().set_url(f"https://x.com/{n}").success()
+            item.set_context("gsheet", {"row": n, "worksheet": gw})
+            return item
+
+        def feed():
+            for feeder in m_orchestrator.return_value.feeders:
+                for item in feeder:
+                    if item.get_url() == "https://x.com/4":
+                        raise SoftTimeLimitExceeded()
+                    yield item
+
+        m_req.id = "first-task"
+        m_req.delivery_info = {}
+        m_req.timelimit = None
+        m_orchestrator.return_value.feeders = [[row(2), row(3), row(4)]]
+        m_orchestrator.return_value.feed.side_effect = feed
+        with pytest.raises(SoftTimeLimitExceeded):
+            create_sheet_task(self.sheet.model_dump_json())
+
+        checkpoint = db_session.get(models.SheetCheckpoint, "123")
+        assert checkpoint.run_id == "first-task"
+        assert checkpoint.rows == {"Sheet1": 3}
+        assert checkpoint.stats["archived"] == 2
+
+        m_req.id = "second-task"
+        m_orchestrator.return_value.feeders = [[row(4), row(5)]]
+        m_orchestrator.return_value.feed.side_effect = lambda: (
+            item
+            for feeder in m_orchestrator.return_value.feeders
+            for item in feeder
+        )
+        resumed_after = []
+        with patch("app.worker.main.sheet_shards.resume_after") as m_resume:
+            m_resume.side_effect = lambda o, rows, finished: (
+                resumed_after.append(dict(rows))
+            )
+            res = create_sheet_task(self.sheet.model_dump_json())
+
+        assert resumed_after == [{"Sheet1": 3}]
+        assert res["run_id"] == "first-task" and res["runs"] == 2
+        assert res["stats"]["archived"] == 4
+        db_session.expire_all()
+        assert db_session.get(models.SheetCheckpoint, "123") is None
+
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.DOMAIN_LIMITER")
+    @patch("celery.app.task.Task.request")
+    def test_throttled_rows_are_deferred(
+        self, m_req, m_limiter, m_args, m_orchestrator, m_urls, db_session
+    ):
+        m_req.id = "sheet-task-id"
+        m_req.delivery_info = {}
+        m_req.timelimit = None
+        items = [
+            Metadata().set_url(f"https://x.com/{i}").success() for i in range(3)
+        ]
+        m_orchestrator.return_value.feeders = [items]
+        m_orchestrator.return_value.feed.side_effect = lambda: (
+            item
+            for feeder in m_orchestrator.return_value.feeders
+            for item in feeder
+        )
+
+        def gate(feeder, holder, deferred):
+            assert holder == "sheet-task-id"
+            deferred.extend([40.0, 15.0])
+            yield list(feeder)[1]
+
+        m_limiter.gate.side_effect = gate
+
+        with (
+            patch.object(create_sheet_task, "apply_async") as m_apply,
+            pytest.raises(Ignore),
+        ):
+            create_sheet_task(self.sheet.model_dump_json())
+
+        # the allowed row is stored before the sheet goes back to the queue
+        assert db_session.query(models.Archive).one().url == "https://x.com/1"
+        assert m_apply.call_args.kwargs["task_id"] == "sheet-task-id"
+        assert 15 <= m_apply.call_args.kwargs["countdown"] <= 25
+
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("celery.app.task.Task.request")
+    def test_throttled_runs_read_each_row_once(
+        self, m_req, m_args, m_orchestrator, m_urls, db_session
+    ):
+        # a worksheet of 10 rows of one domain with a burst of 3
+        gw = MagicMock()
+        gw.wks.title = "Sheet1"
+        gw.count_rows.return_value = 11
+        status_reads = []
+
+        def get_cell(row, col, fresh=False):
+            if col == "url":
+                return f"https://x.com/{row}"
+            if fresh:
+                # a Sheets API read
+                status_reads.append(row)
+            return ""
+
+        gw.get_cell.side_effect = get_cell
+
+        class Feeder:
+            # the row reading of the gsheet feeder
+            header = 1
+
+            def __iter__(self):
+                yield from self._process_rows(gw)
+
+            def _process_rows(self, gw):
+                spans = {"Sheet1": [(2, gw.count_rows())]}
+                yield from sheet_shards._rows_in_spans(self, spans)(gw)
+
+            def _set_context(self, item, gw, row):
+                item.set_context("gsheet", {"row": row, "worksheet": gw})
+
+        m_req.id = "sheet-task-id"
+        m_req.delivery_info = {}
+        m_req.timelimit = None
+        m_orchestrator.return_value.feed.side_effect = lambda: (
+            item.success()
+            for feeder in m_orchestrator.return_value.feeders
+            for item in feeder
+        )
+        burst = [3]
+
+        def acquire(url, holder, lease_seconds=None):
+            if burst[0]:
+                burst[0] -= 1
+                return 0
+            burst[0] = 3
+            return 30.0
+
+        with (
+            patch.object(DOMAIN_LIMITER, "limits", {"x.com": MagicMock()}),
+            patch.object(DOMAIN_LIMITER, "acquire", side_effect=acquire),
+            patch.object(DOMAIN_LIMITER, "release"),
+            patch.object(create_sheet_task, "apply_async") as m_apply,
+        ):
+            for _ in range(2):
+                m_orchestrator.return_value.feeders = [Feeder()]
+                with pytest.raises(Ignore):
+                    create_sheet_task(self.sheet.model_dump_json())
+
+        # each run stops at its first throttled row and the next one resumes
+        # there, instead of both reading all the rows after it
+        assert m_apply.call_count == 2
+        assert status_reads == [2, 3, 4, 5, 5, 6, 7, 8]
+        assert {a.url for a in db_session.query(models.Archive)} == {
+            f"https://x.com/{row}" for row in range(2, 8)
+        }
+        checkpoint = db_session.get(models.SheetCheckpoint, "123")
+        assert checkpoint.rows == {"Sheet1": 7}
+
+    @pytest.mark.parametrize("force", [False, True])
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    @patch("app.worker.main.NEGATIVE_CACHE.get")
+    @patch("app.worker.main.publish_metric")
+    def test_recently_failed_rows_are_skipped(
+        self,
+        m_publish,
+        m_get,
+        m_args,
+        m_orchestrator,
+        m_urls,
+        force,
+        db_session,
+    ):
+        items = [
+            Metadata().set_url(f"https://x.com/{i}").success() for i in range(3)
+        ]
+        m_orchestrator.return_value.feeders = [items]
+        m_orchestrator.return_value.feed.side_effect = lambda: (
+            item
+            for feeder in m_orchestrator.return_value.feeders
+            for item in feeder
+        )
+        m_get.side_effect = lambda url: (
+            {"failure_class": "removed"} if url.endswith("/1") else None
+        )
+        sheet = self.sheet.model_copy(update={"force": force})
+
+        res = create_sheet_task(sheet.model_dump_json())
+
+        if force:
+            m_get.assert_not_called()
+            assert res["stats"]["archived"] == 3
+            assert "suppressed" not in res["stats"]
+        else:
+            assert res["stats"]["archived"] == 2
+            assert res["stats"]["suppressed"] == 1
+            m_publish.assert_any_call(
+                "negative_cache_suppressed",
+                source="sheet",
+                failure_class="removed",
+            )
+
+    @patch("app.worker.main.chord")
+    @patch("app.worker.main.sheet_shards.plan_shards")
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_sharded(
+        self, m_args, m_orchestrator, m_plan, m_chord, m_group_snapshots
+    ):
+        m_group_snapshots.get.return_value = GROUP._replace(
+            permissions={**GROUP.permissions, "max_sheet_fan_out": 4}
+        )
+        shards = [[("Sheet1", 2, 30)], [("Sheet1", 31, 60)]]
+        m_plan.return_value = shards
+        m_chord.return_value.return_value.id = "merge-task-id"
+
+        res = create_sheet_task(self.sheet.model_dump_json())
+
+        assert m_plan.call_args[0][1:] == (4, 25, {}, [])
+        m_orchestrator.return_value.feed.assert_not_called()
+        m_orchestrator.return_value.cleanup.assert_called_once()
+        header = list(m_chord.call_args[0][0])
+        assert [s.args[1] for s in header] == shards
+        assert m_chord.return_value.call_args[0][0].args == (
+            self.sheet.model_dump_json(),
+        )
+        assert res["success"]
+        assert res["stats"]["shards"] == 2
+        assert res["stats"]["merge_task_id"] == "merge-task-id"
+
+    @patch("app.worker.main.sheet_shards.plan_shards")
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_small_sheet_is_not_sharded(
+        self, m_args, m_orchestrator, m_plan, m_group_snapshots
+    ):
+        m_group_snapshots.get.return_value = GROUP._replace(
+            permissions={**GROUP.permissions, "max_sheet_fan_out": 4}
+        )
+        m_plan.return_value = [[("Sheet1", 2, 3)]]
+        m_orchestrator.return_value.feed.return_value = iter([])
+
+        res = create_sheet_task(self.sheet.model_dump_json())
+        m_orchestrator.return_value.feed.assert_called_once()
+        assert res["stats"] == {"archived": 0, "failed": 0, "errors": []}
+
+    @patch("app.worker.main.get_all_urls", return_value=[])
+    @patch("app.worker.main.sheet_shards.restrict_to_rows")
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_shard_task(
+        self, m_args, m_orchestrator, m_restrict, m_urls, db_session
+    ):
+        m_orchestrator.return_value.feed.return_value = iter(
+            [Metadata().set_url(self.URL).success(), False]
+        )
+
+        stats = create_sheet_shard_task(
+            self.sheet.model_dump_json(), [["Sheet1", 2, 3]]
+        )
+
+        m_restrict.assert_called_once_with(
+            m_orchestrator.return_value, [["Sheet1", 2, 3]]
+        )
+        assert stats["archived"] == 1
+        assert stats["failed"] == 1
+
+        # a failing shard still reports its stats for the merge
+        m_orchestrator.return_value.setup.side_effect = Exception("no sheet")
+        stats = create_sheet_shard_task(
+            self.sheet.model_dump_json(), [["Sheet1", 4, 5]]
+        )
+        assert stats == {"archived": 0, "failed": 0, "errors": ["no sheet"]}
+
+    @patch("app.worker.main.sheet_shards.restrict_to_rows")
+    @patch("app.worker.main.ArchivingOrchestrator")
+    @patch("app.worker.main.get_orchestrator_args")
+    def test_shard_task_cleans_up_when_restricting_fails(
+        self, m_args, m_orchestrator, m_restrict
+    ):
+        m_restrict.side_effect = Exception("no feeder")
+
+        stats = create_sheet_shard_task(
+            self.sheet.model_dump_json(), [["Sheet1", 2, 3]]
+        )
+
+        assert stats == {"archived": 0, "failed": 0, "errors": ["no feeder"]}
+        m_orchestrator.return_value.feed.assert_not_called()
+        m_orchestrator.return_value.cleanup.assert_called_once()
+
+    def test_merge_shards(self, db_session):
+        db_session.add(models.Sheet(id="123"))
+        db_session.commit()
+        before = db_session.get(models.Sheet, "123").last_url_archived_at
+
+        res = merge_sheet_shards_task(
+            [
+                {"archived": 2, "failed": 1, "errors": ["boom"]},
+                {"archived": 1, "failed": 0, "errors": []},
+            ],
+            self.sheet.model_dump_json(),
+        )
+
+        assert res["success"]
+        assert res["sheet_id"] == "123"
+        assert res["stats"] == {"archived": 3, "failed": 1, "errors": ["boom"]}
+        db_session.expire_all()
+        assert db_session.get(models.Sheet, "123").last_url_archived_at > before
+
+
+@pytest.mark.parametrize(
+    "pool, pool_size",
+    [("prefork", 5), ("threads", 40), ("gevent", 40)],
+)
+@patch("app.worker.main.configure_engine")
+@patch("app.worker.main.settings")
+def test_size_db_pool(m_settings, m_configure, pool, pool_size):
+    m_settings.WORKER_POOL = pool
+    m_settings.WORKER_DB_POOL_SIZE = 5
+    m_settings.WORKER_DB_MAX_OVERFLOW = 10
+
+    size_db_pool(sender=MagicMock(concurrency=8))
+
+    m_configure.assert_called_once_with(pool_size, 10)
@@ -0,0 +1,124 @@
+import time
+from unittest.mock import patch
+
+from app.shared import schemas
+from app.shared.db import models, worker_crud
+from app.worker.write_buffer import ArchiveWriteBuffer, flush_active_buffers
+
+
+def make_archive(i, url=None):
+    return schemas.ArchiveCreate(
+        id=f"archive-{i}",
+        url=url or f"https://example-{i}.com",
+        result={},
+        author_id="rick@example.com",
+        group_id="spaceship",
+        tags=[],
+        urls=[],
+    )
+
+
+def count(db_session):
+    db_session.expire_all()
+    return db_session.query(models.Archive).count()
+
+
+def test_flushes_every_n_rows(db_session):
+    buffer = ArchiveWriteBuffer(max_rows=3, max_seconds=3600)
+    with patch(
+        "app.worker.write_buffer.worker_crud.store_archived_urls",
+        wraps=worker_crud.store_archived_urls,
+    ) as m_store:
+        for i in range(7):
+            buffer.add(make_archive(i))
+        assert m_store.call_count == 2
+        assert count(db_session) == 6
+        assert len(buffer.pending) == 1
+
+        assert buffer.flush() == 1
+        assert buffer.flush() == 0
+        assert m_store.call_count == 3
+    assert buffer.stored == 7
+    assert count(db_session) == 7
+
+
+def test_flushes_after_t_seconds(db_session):
+    buffer = ArchiveWriteBuffer(max_rows=100, max_seconds=30)
+    with patch("app.worker.write_buffer.time.monotonic") as m_time:
+        m_time.return_value = 1000
+        buffer.add(make_archive(0))
+        m_time.return_value = 1010
+        buffer.add(make_archive(1))
+        assert count(db_session) == 0
+
+        m_time.return_value = 1030
+        buffer.add(make_archive(2))
+    assert count(db_session) == 3
+    assert buffer.pending == []
+
+
+def test_duplicates_fall_back_to_single_inserts(db_session):
+    buffer = ArchiveWriteBuffer(max_rows=10, max_seconds=3600)
+    buffer.add(make_archive(0))
+    buffer.add(make_archive(0, url="https://duplicate.com"))
+    buffer.add(make_archive(1))
+
+    assert buffer.flush() == 2
+    assert buffer.duplicates == 1
+    assert buffer.errors == []
+    assert count(db_session) == 2
+
+
+def test_unexpected_error_is_recorded(db_session):
+    buffer = ArchiveWriteBuffer(max_rows=10, max_seconds=3600)
+    buffer.add(make_archive(0))
+    buffer.add(make_archive(1))
+    with patch(
+        "app.worker.write_buffer.worker_crud.store_archived_urls",
+        side_effect=ValueError("db is gone"),
+    ):
+        assert buffer.flush() == 0
+
+    assert buffer.errors == ["db is gone", "db is gone"]
+    assert buffer.pending == []
+    assert count(db_session) == 0
+
+
+def test_flush_active_buffers(db_session):
+    buffer = ArchiveWriteBuffer(max_rows=10, max_seconds=3600)
+    buffer.add(make_archive(0))
+    flush_active_buffers()
+    assert buffer.stored == 1
+    assert count(db_session) == 1
+
+
+def test_flushes_on_a_timer(db_session):
+    # the oldest row is stored while the next one is still being archived
+    buffer = ArchiveWriteBuffer(max_rows=100, max_seconds=0.05)
+    buffer.add(make_archive(0))
+    for _ in range(100):
+        if not buffer.pending:
+            break
+        time.sleep(0.05)
+    assert buffer.stored == 1
+    assert count(db_session) == 1
+
+
+def test_on_flushed_reports_stored_rows(db_session):
+    flushed = []
+    buffer = ArchiveWriteBuffer(
+        max_rows=10,
+        max_seconds=3600,
+        on_flushed=lambda archive, stored: flushed.append((archive.id, stored)),
+    )
+    buffer.add(make_archive(0))
+    buffer.add(make_archive(0, url="https://duplicate.com"))
+    buffer.add(make_archive(1))
+    assert flushed == []
+
+    buffer.flush()
+    assert flushed == [
+        ("archive-0", True),
+        ("archive-0", False),
+        ("archive-1", True),
+    ]
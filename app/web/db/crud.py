@@ -18,10 +18,12 @@ from sqlalchemy import (
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, load_only
 
+from app.shared import schemas
 from app.shared.db import models
 from app.shared.db.models import Archive, Group
 from app.shared.log import logger
 from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
 from app.shared.user_groups import UserGroups
 from app.shared.utils.misc import fnv1a_hash_mod
 from app.web.config import ALLOW_ANY_EMAIL
@@ -67,6 +69,7 @@ def search_archives_by_url(
     archived_after: datetime = None,
     archived_before: datetime = None,
     absolute_search: bool = False,
+    successful_only: bool = False,
 ) -> list[Type[Archive]]:
     # searches for partial URLs, if email is * no ownership
     # (or read/read_public) filtering happens
@@ -88,6 +91,11 @@ def search_archives_by_url(
         query = query.filter(models.Archive.created_at > archived_after)
     if archived_before:
         query = query.filter(models.Archive.created_at < archived_before)
+    if successful_only:
+        # same test as Metadata.is_success
+        query = query.filter(
+            models.Archive.result["status"].as_string().like("%success%")
+        )
     return (
         query.order_by(models.Archive.created_at.desc())
         .offset(skip)
@@ -96,6 +104,56 @@ def search_archives_by_url(
     )
 
 
+def find_recent_archive(
+    db: Session,
+    url: str,
+    email: str,
+    read_groups: bool | set[str],
+    read_public: bool,
+    within_minutes: int,
+) -> models.Archive | None:
+    # most recent successful archive of this exact URL the user can read
+    recent = search_archives_by_url(
+        db,
+        url,
+        email,
+        read_groups,
+        read_public,
+        limit=1,
+        archived_after=datetime.now() - timedelta(minutes=within_minutes),
+        absolute_search=True,
+        successful_only=True,
+    )
+    return recent[0] if recent else None
+
+
+def create_archive_copy(
+    db: Session, archive: schemas.ArchiveCreate
+) -> models.Archive:
+    # stores an archive whose result comes from another one, see
+    # find_recent_archive
+    upsert_user(db, archive.author_id)
+    db_archive = models.Archive(
+        id=archive.id,
+        url=archive.url,
+        result=archive.result,
+        public=archive.public,
+        author_id=archive.author_id,
+        group_id=archive.group_id,
+        store_until=archive.store_until,
+        source_archive_id=archive.source_archive_id,
+    )
+    db_archive.tags = [
+        db.get(models.Tag, tag) or models.Tag(id=tag)
+        for tag in (archive.tags or [])
+    ]
+    db_archive.urls = archive.urls
+    db.add(db_archive)
+    db.commit()
+    db.refresh(db_archive)
+    return db_archive
+
+
 def search_archives_by_email(
     db: Session, email: str, skip: int = 0, limit: int = 100
 ):
@@ -175,12 +233,32 @@ async def soft_delete_expired_archives(db: AsyncSession) -> int:
 # --------------- TAG
 
 
-async def get_group_priority_async(db: AsyncSession, group_id: str) -> dict:
+def get_archive_result(db: Session, archive_id: str) -> dict | None:
+    return (
+        db.query(models.Archive.result)
+        .filter(models.Archive.id == archive_id, not_(models.Archive.deleted))
+        .scalar()
+    )
+
+
+def get_group_reuse_window(db: Session, group_id: str) -> int:
+    db_group = db.get(models.Group, group_id)
+    if not db_group or not db_group.permissions:
+        return 0
+    return max(0, db_group.permissions.get("reuse_within_minutes", 0))
+
+
+async def get_group_priority_async(
+    db: AsyncSession, group_id: str, sheet: bool = False
+) -> dict:
     db_group = await db.get(models.Group, group_id)
-    priority = (
-        db_group.permissions.get("priority", "low") if db_group else "low"
+    permissions = (db_group.permissions or {}) if db_group else {}
+    return convert_priority_to_queue_dict(
+        permissions.get("priority", "low"),
+        sheet,
+        group_id,
+        permissions.get("share", 0),
     )
-    return convert_priority_to_queue_dict(priority)
 
 
 @cached(cache=LRUCache(maxsize=128), key=lambda db, email: hashkey(email))
@@ -340,6 +418,7 @@ def upsert_user_groups(db: Session):
             db_groups[group_id].users.append(db_user)
 
     db.commit()
+    bump_group_config_version()
     count_user_groups = db.query(models.association_table_user_groups).count()
     count_groups = db.query(func.count(models.Group.id)).scalar()
 
@@ -348,6 +427,15 @@ def upsert_user_groups(db: Session):
     )
 
 
+def bump_group_config_version():
+    # workers cache group settings until they see a new version
+    key = get_settings().REDIS_GROUP_CONFIG_VERSION_KEY
+    try:
+        get_redis().incr(key)
+    except Exception as e:
+        logger.warning(f"[CONFIG] Could not bump {key}: {e}")
+
+
 # --------------- SHEET
 def create_sheet(
     db: Session,
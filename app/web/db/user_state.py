@@ -322,10 +322,10 @@ class UserState:
             return True
         return user_sheets < sheet_quota
 
-    def has_quota_max_monthly_urls(self, group_id: str) -> bool:
+    def has_quota_max_monthly_urls(self, group_id: str, urls: int = 1) -> bool:
         """
-        Checks if a user has reached their monthly url quota for a group, if
-        global then group should be empty string
+        Checks if a user can archive `urls` more URLs within their monthly
+        url quota for a group, if global then group should be empty string
         """
         quota = 0
         if not group_id:
@@ -352,7 +352,7 @@ class UserState:
             .count()
         )
 
-        return user_urls < quota
+        return user_urls + urls <= quota
 
     def has_quota_max_monthly_mbs(self, group_id: str) -> bool:
         """
@@ -426,13 +426,15 @@ class UserState:
 
         return frequency in self.permissions[group_id].sheet_frequency
 
-    def priority_group(self, group_id: str) -> dict:
+    def priority_group(self, group_id: str, sheet: bool = False) -> dict:
         priority = "low"
+        share = 0
         for group in self.user_groups:
             if group.id != group_id:
                 continue
             if not group.permissions:
                 continue
             priority = group.permissions.get("priority", priority)
+            share = group.permissions.get("share", share)
             break
-        return convert_priority_to_queue_dict(priority)
+        return convert_priority_to_queue_dict(priority, sheet, group_id, share)
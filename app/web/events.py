@@ -17,19 +17,38 @@ from app.shared.db.database import (
     make_engine,
     wal_checkpoint,
 )
+from app.shared.fair_queue import get_fair_queue
 from app.shared.log import logger
+from app.shared.priority_aging import get_priority_aging
 from app.shared.settings import get_settings
-from app.shared.task_messaging import get_celery
+from app.shared.sheet_lease import get_sheet_leases
+from app.shared.task_heartbeats import get_task_heartbeats
+from app.shared.task_messaging import get_celery, queue_name
+from app.shared.time_limits import get_adaptive_time_limits
 from app.shared.utils.sheets import get_sheet_access_error
 from app.web.db import crud
 from app.web.middleware import increase_exceptions_counter
 from app.web.utils.metrics import (
+    FAIR_QUEUE_DISPATCHED,
+    FAIR_QUEUE_PENDING_TASKS,
+    FAIR_QUEUE_PENDING_USERS,
+    ORPHANED_TASKS_REQUEUED,
+    QUEUE_MAX_WAIT_SECONDS,
+    SHEET_RUNS_COALESCED,
+    TASKS_PROMOTED,
     measure_regular_metrics,
+    observe_fair_queue_wait,
     redis_subscribe_worker_exceptions,
+    redis_subscribe_worker_metrics,
 )
 
 
 celery = get_celery()
+CELERY_QUEUES = [
+    queue_name(priority, sheet)
+    for sheet in (False, True)
+    for priority in ("high", "low")
+]
 
 # Throttle cache: track when each sheet was last notified about missing
 # permissions so users are not spammed on every cron cycle.
@@ -60,6 +79,11 @@ async def lifespan(app: FastAPI):
             get_settings().REDIS_EXCEPTIONS_CHANNEL
         )
     )
+    asyncio.create_task(
+        redis_subscribe_worker_metrics(
+            get_settings().REDIS_WORKER_METRICS_CHANNEL
+        )
+    )
     asyncio.create_task(repeat_measure_regular_metrics())
     with get_db() as db:
         crud.upsert_user_groups(db)
@@ -81,6 +105,24 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("[CRON] Delete scheduled archives cronjob is disabled.")
 
+    if get_settings().FAIR_QUEUES:
+        asyncio.create_task(dispatch_fair_queues_cronjob())
+    else:
+        logger.warning("[CRON] Fair queues are disabled.")
+
+    # measures queue wait ages even when aged tasks are not promoted
+    asyncio.create_task(age_queued_tasks_cronjob())
+    if not get_settings().PRIORITY_AGING_SECONDS:
+        logger.warning("[CRON] Priority aging is disabled.")
+
+    if (
+        get_settings().CRON_REQUEUE_ORPHANED_TASKS
+        and get_settings().TASK_HEARTBEAT_INTERVAL_SECONDS
+    ):
+        asyncio.create_task(requeue_orphaned_tasks_cronjob())
+    else:
+        logger.warning("[CRON] Requeue orphaned tasks cronjob is disabled.")
+
     wal_checkpoint()
 
     yield  # separates startup from shutdown instructions
@@ -115,10 +157,65 @@ async def archive_daily_sheets_cronjob():
     await archive_sheets_cronjob("daily", 24, datetime.datetime.now().hour)
 
 
+@repeat_every(
+    seconds=60, wait_first=60, on_exception=increase_exceptions_counter
+)
+async def requeue_orphaned_tasks_cronjob():
+    requeued = await asyncio.to_thread(
+        get_task_heartbeats().requeue_dead,
+        celery,
+        get_settings().TASK_HEARTBEAT_DEAD_SECONDS,
+    )
+    for task in requeued:
+        ORPHANED_TASKS_REQUEUED.labels(task=task["name"]).inc()
+
+
+@repeat_every(
+    seconds=get_settings().FAIR_QUEUE_DISPATCH_SECONDS,
+    on_exception=increase_exceptions_counter,
+)
+async def dispatch_fair_queues_cronjob():
+    fair_queue = get_fair_queue()
+    dispatched = await asyncio.to_thread(fair_queue.dispatch, celery)
+    for task in dispatched:
+        observe_fair_queue_wait(
+            task["queue"], task["author_id"], task["wait_seconds"]
+        )
+        FAIR_QUEUE_DISPATCHED.labels(
+            queue=task["queue"], lane=task["lane"]
+        ).inc(task["cost"])
+    for queue, pending in (await asyncio.to_thread(fair_queue.pending)).items():
+        FAIR_QUEUE_PENDING_TASKS.labels(queue=queue).set(pending["tasks"])
+        FAIR_QUEUE_PENDING_USERS.labels(queue=queue).set(pending["users"])
+
+
+@repeat_every(
+    seconds=60, wait_first=60, on_exception=increase_exceptions_counter
+)
+async def age_queued_tasks_cronjob():
+    aging = get_priority_aging()
+    if get_settings().PRIORITY_AGING_SECONDS:
+        promoted = await asyncio.to_thread(
+            aging.promote_aged,
+            get_settings().PRIORITY_AGING_SECONDS,
+            get_settings().PRIORITY_AGING_MAX_PER_RUN,
+        )
+        for queue, task_ids in promoted.items():
+            TASKS_PROMOTED.labels(queue=queue).inc(len(task_ids))
+    for queue in CELERY_QUEUES:
+        wait = await asyncio.to_thread(aging.max_wait_seconds, queue)
+        QUEUE_MAX_WAIT_SECONDS.labels(queue=queue, stage="celery").set(wait)
+    if get_settings().FAIR_QUEUES:
+        waits = await asyncio.to_thread(get_fair_queue().max_wait_seconds)
+        for queue, wait in waits.items():
+            QUEUE_MAX_WAIT_SECONDS.labels(queue=queue, stage="fair").set(wait)
+
+
 async def archive_sheets_cronjob(
     frequency: str, interval: int, current_time_unit: int
 ):
     triggered_jobs = []
+    coalesced_jobs = []
     no_access_sheets: dict[str, list[tuple]] = defaultdict(list)
 
     async with get_db_async() as db:
@@ -144,19 +241,35 @@ async def archive_sheets_cronjob(
                     )
                     continue
 
-            group_queue = await crud.get_group_priority_async(db, s.group_id)
-            task = celery.signature(
-                "create_sheet_task",
-                args=[
-                    schemas.SubmitSheet(
-                        sheet_id=s.id,
-                        author_id=s.author_id,
-                        group_id=s.group_id,
-                    ).model_dump_json()
-                ],
-            ).apply_async(**group_queue)
-
-            triggered_jobs.append({"sheet_id": s.id, "task_id": task.id})
+            group_queue = await crud.get_group_priority_async(
+                db, s.group_id, sheet=True
+            )
+            task_id, sent = get_sheet_leases().send_once(
+                s.id,
+                lambda task_id, s=s, group_queue=group_queue: (
+                    get_fair_queue().submit(
+                        celery,
+                        "create_sheet_task",
+                        [
+                            schemas.SubmitSheet(
+                                sheet_id=s.id,
+                                author_id=s.author_id,
+                                group_id=s.group_id,
+                            ).model_dump_json()
+                        ],
+                        s.author_id,
+                        task_id=task_id,
+                        **group_queue,
+                        **get_adaptive_time_limits().for_sheet(s.id),
+                    )
+                ),
+                get_settings().SHEET_LEASE_QUEUED_SECONDS,
+            )
+            if not sent:
+                SHEET_RUNS_COALESCED.labels(source="cron").inc()
+                coalesced_jobs.append({"sheet_id": s.id, "task_id": task_id})
+                continue
+            triggered_jobs.append({"sheet_id": s.id, "task_id": task_id})
 
     if no_access_sheets:
         await _notify_sheet_permission_issues(no_access_sheets)
@@ -164,6 +277,10 @@ async def archive_sheets_cronjob(
     logger.debug(
         f"[CRON {frequency.upper()}:{current_time_unit}] Triggered {len(triggered_jobs)} sheet tasks: {triggered_jobs}"
     )
+    if coalesced_jobs:
+        logger.info(
+            f"[CRON {frequency.upper()}:{current_time_unit}] Skipped {len(coalesced_jobs)} sheets with a run still queued or running: {coalesced_jobs}"
+        )
 
 
 async def _notify_sheet_permission_issues(
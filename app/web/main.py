@@ -11,6 +11,7 @@ from app.shared.task_messaging import get_celery
 from app.web.config import API_DESCRIPTION, VERSION
 from app.web.events import lifespan
 from app.web.middleware import logging_middleware
+from app.web.routers.admin import router as admin_router
 from app.web.routers.default import router as default_router
 from app.web.routers.interoperability import router as interoperability_router
 from app.web.routers.sheet import router as sheet_router
@@ -53,6 +54,7 @@ def app_factory(settings: Settings = None):
     app.include_router(sheet_router)
     app.include_router(task_router)
     app.include_router(interoperability_router)
+    app.include_router(admin_router)
 
     # prometheus exposed in /metrics with authentication
     Instrumentator(
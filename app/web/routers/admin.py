@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from app.shared.settings import get_settings
+from app.shared.time_limits import get_adaptive_time_limits
+from app.web.security import token_api_key_auth
+
+
+router = APIRouter(prefix="/admin", tags=["Admin operations"])
+
+
+@router.get(
+    "/time-limits",
+    summary="Time limits learned per URL host and per sheet from recent archiving durations, null while there are too few samples.",
+)
+def get_time_limits(auth=Depends(token_api_key_auth)) -> JSONResponse:
+    settings = get_settings()
+    learned = get_adaptive_time_limits().learned()
+    return JSONResponse(
+        {
+            "enabled": settings.ADAPTIVE_TIME_LIMITS,
+            "min_samples": settings.ADAPTIVE_TIME_LIMIT_MIN_SAMPLES,
+            "factor": settings.ADAPTIVE_TIME_LIMIT_FACTOR,
+            **{
+                f"{kind}s": {
+                    name: limits._asdict() if limits else None
+                    for name, limits in sorted(by_name.items())
+                }
+                for kind, by_name in learned.items()
+            },
+        }
+    )
@@ -7,18 +7,23 @@ from sqlalchemy.orm import Session
 
 from app.shared.db import models
 from app.shared.db.database import get_db_dependency
+from app.shared.fair_queue import get_fair_queue
 from app.shared.schemas import (
     DeleteResponse,
     SheetAdd,
     SheetResponse,
     SubmitSheet,
 )
+from app.shared.settings import get_settings
+from app.shared.sheet_lease import get_sheet_leases
 from app.shared.task_messaging import get_celery
+from app.shared.time_limits import get_adaptive_time_limits
 from app.shared.utils.sheets import get_sheet_access_error
 from app.web.config import ALLOW_ANY_EMAIL
 from app.web.db import crud
 from app.web.db.user_state import UserState
 from app.web.security import get_token_or_user_auth, get_user_state
+from app.web.utils.metrics import SHEET_RUNS_COALESCED
 from app.web.utils.misc import convert_priority_to_queue_dict
 
 
@@ -114,10 +119,11 @@ def delete_sheet(
     "/{sheet_id}/archive",
     status_code=HTTPStatus.CREATED,
     summary="Trigger an archiving task for a GSheet you own, or any sheet with the API token.",
-    response_description="task_id for the archiving task.",
+    response_description="task_id for the archiving task, or of the run of the sheet already queued or running (200, coalesced).",
 )
 def archive_user_sheet(
     sheet_id: str,
+    force: bool = False,
     email: str = Depends(get_token_or_user_auth),
     db: Session = Depends(get_db_dependency),
 ) -> JSONResponse:
@@ -130,7 +136,7 @@ def archive_user_sheet(
             raise HTTPException(
                 status_code=HTTPStatus.NOT_FOUND, detail="Sheet not found."
             )
-        group_queue = convert_priority_to_queue_dict("high")
+        group_queue = convert_priority_to_queue_dict("high", sheet=True)
         author_id = sheet.author_id
     else:
         user = UserState(db, email)
@@ -153,7 +159,7 @@ def archive_user_sheet(
                 detail="User cannot manually trigger sheet archiving in this group.",
             )
 
-        group_queue = user.priority_group(sheet.group_id)
+        group_queue = user.priority_group(sheet.group_id, sheet=True)
         author_id = user.email
 
     # Check if the service account has write access to the Google Sheet
@@ -172,13 +178,30 @@ def archive_user_sheet(
                 detail=access_error,
             )
 
-    task = celery.signature(
-        "create_sheet_task",
-        args=[
-            SubmitSheet(
-                sheet_id=sheet_id, author_id=author_id, group_id=sheet.group_id
-            ).model_dump_json()
-        ],
-    ).apply_async(**group_queue)
+    def send(task_id: str) -> str:
+        return get_fair_queue().submit(
+            celery,
+            "create_sheet_task",
+            [
+                SubmitSheet(
+                    sheet_id=sheet_id,
+                    author_id=author_id,
+                    group_id=sheet.group_id,
+                    force=force,
+                ).model_dump_json()
+            ],
+            author_id,
+            task_id=task_id,
+            **group_queue,
+            **get_adaptive_time_limits().for_sheet(sheet_id),
+        )
 
-    return JSONResponse({"id": task.id}, status_code=HTTPStatus.CREATED)
+    task_id, sent = get_sheet_leases().send_once(
+        sheet_id, send, get_settings().SHEET_LEASE_QUEUED_SECONDS
+    )
+    if not sent:
+        SHEET_RUNS_COALESCED.labels(source="manual").inc()
+        return JSONResponse(
+            {"id": task_id, "coalesced": True}, status_code=HTTPStatus.OK
+        )
+    return JSONResponse({"id": task_id}, status_code=HTTPStatus.CREATED)
@@ -1,12 +1,18 @@
+from typing import AsyncIterator
+
 from celery.result import AsyncResult
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
 
-from app.shared import schemas
-from app.shared.constants import STATUS_FAILURE
+from app.shared import schemas, sheet_progress
+from app.shared.constants import STATUS_FAILURE, STATUS_SUCCESS
+from app.shared.db.database import get_db_dependency
 from app.shared.log import log_error
-from app.shared.task_messaging import get_celery
+from app.shared.task_messaging import get_async_redis, get_celery
+from app.web.db import crud
 from app.web.security import get_token_or_user_auth
 from app.web.utils.misc import custom_jsonable_encoder
 
@@ -15,13 +21,18 @@ router = APIRouter(prefix="/task", tags=["Async task operations"])
 
 celery = get_celery()
 
+# how long to wait for new progress before sending a keep-alive comment
+PROGRESS_BLOCK_MS = 15_000
+
 
 @router.get(
     "/{task_id}",
     summary="Check the status of an async task by its id, works for URLs and Sheet tasks.",
 )
 def get_status(
-    task_id, email=Depends(get_token_or_user_auth)
+    task_id,
+    email=Depends(get_token_or_user_auth),
+    db: Session = Depends(get_db_dependency),
 ) -> schemas.TaskResult:
     task = AsyncResult(task_id, app=celery)
     try:
@@ -32,7 +43,10 @@ def get_status(
             # https://docs.celeryq.dev/en/stable/_modules/celery/result.html#AsyncResult
             raise task.result
 
-        response = {"id": task_id, "status": task.status, "result": task.result}
+        result = task.result
+        if task.status == STATUS_SUCCESS:
+            result = resolve_archive_result(db, result)
+        response = {"id": task_id, "status": task.status, "result": result}
         return JSONResponse(
             jsonable_encoder(
                 response,
@@ -50,3 +64,70 @@ def get_status(
                 "result": {"error": str(e)},
             }
         )
+
+
+def resolve_archive_result(db: Session, result):
+    """
+    URL archiving tasks only store a schemas.ArchiveResultRef, this returns
+    the full result of its archive instead. Any other result, or a reference
+    to an archive that has since been deleted, is returned as is.
+    """
+    if not (
+        isinstance(result, dict)
+        and result.keys() == schemas.ArchiveResultRef.model_fields.keys()
+    ):
+        return result
+    archive_result = crud.get_archive_result(db, result["archive_id"])
+    return result if archive_result is None else archive_result
+
+
+@router.get(
+    "/{task_id}/progress",
+    summary="Stream the progress of a sheet task as Server-Sent Events, replaying the events so far to late subscribers.",
+    response_class=StreamingResponse,
+)
+async def stream_progress(
+    task_id: str,
+    last_event_id: str | None = Header(None),
+    email=Depends(get_token_or_user_auth),
+) -> StreamingResponse:
+    return StreamingResponse(
+        progress_events(task_id, last_event_id or "0"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def progress_events(task_id: str, cursor: str) -> AsyncIterator[str]:
+    """
+    Yields the task's progress stream from `cursor` on as SSE messages, the
+    whole stream for a new subscriber and the missed events for a reconnecting
+    EventSource (Last-Event-ID). Ends after the "done" event, or once the task
+    is over and has no stream.
+    """
+    Redis = get_async_redis()
+    key = sheet_progress.stream_key(task_id)
+    try:
+        while True:
+            entries = await Redis.xread(
+                {key: cursor}, count=100, block=PROGRESS_BLOCK_MS
+            )
+            if not entries:
+                if not await Redis.exists(key) and await run_in_threadpool(
+                    lambda: AsyncResult(task_id, app=celery).ready()
+                ):
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for entry_id, fields in entries[0][1]:
+                cursor = entry_id.decode()
+                event = fields[b"event"].decode()
+                data = fields[b"data"].decode()
+                yield f"id: {cursor}\nevent: {event}\ndata: {data}\n\n"
+                if event == sheet_progress.DONE:
+                    return
+    except Exception as e:
+        log_error(e, f"progress stream of {task_id=}")
+        yield "event: error\ndata: {}\n\n"
+    finally:
+        await Redis.aclose()
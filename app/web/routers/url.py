@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from http import HTTPStatus
 from urllib.parse import urlparse
@@ -6,21 +7,35 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
-from app.shared import schemas
+from app.shared import business_logic, schemas, singleflight
+from app.shared.constants import STATUS_SUCCESS
+from app.shared.db import models
 from app.shared.db.database import get_db_dependency
+from app.shared.fair_queue import get_fair_queue
 from app.shared.log import logger
+from app.shared.negative_cache import get_negative_cache
 from app.shared.schemas import DeleteResponse
-from app.shared.task_messaging import get_celery
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_celery, get_redis
+from app.shared.time_limits import get_adaptive_time_limits
 from app.web.config import ALLOW_ANY_EMAIL
 from app.web.db import crud
 from app.web.db.user_state import UserState
 from app.web.security import get_token_or_user_auth, get_user_state
+from app.web.utils.metrics import (
+    ARCHIVE_REUSE,
+    ARCHIVE_REUSE_SECONDS_SAVED,
+    ARCHIVE_SINGLEFLIGHT,
+    NEGATIVE_CACHE_BYPASSED,
+    NEGATIVE_CACHE_SUPPRESSED,
+)
 from app.web.utils.misc import convert_priority_to_queue_dict
 
 
 router = APIRouter(prefix="/url", tags=["Single URL operations"])
 
 celery = get_celery()
+Redis = get_redis()
 
 
 @router.post(
@@ -31,6 +46,7 @@ celery = get_celery()
 )
 def archive_url(
     archive: schemas.ArchiveTrigger,
+    force: bool = False,
     email=Depends(get_token_or_user_auth),
     db: Session = Depends(get_db_dependency),
 ) -> JSONResponse:
@@ -38,40 +54,106 @@ def archive_url(
         f"new {archive.public=} task for {email=} and {archive.group_id=}: {archive.url}"
     )
 
-    parsed_url = urlparse(archive.url)
-    if not all([parsed_url.scheme, parsed_url.netloc]):
+    validate_url(archive.url)
+    archive_create = schemas.ArchiveCreate(**archive.model_dump())
+    archive_create.author_id = get_author_id(email, archive.author_id)
+    group_queue = authorize_archive_in_group(email, archive.group_id, db)
+    check_recent_failure(archive_create.url, force)
+
+    if reused_id := reuse_recent_archive(email, archive_create, db):
+        return JSONResponse(
+            schemas.Task(id=reused_id).model_dump(),
+            status_code=HTTPStatus.CREATED,
+        )
+
+    leader_id, follower_id = join_in_flight_archive(archive_create)
+    if follower_id:
+        return JSONResponse(
+            schemas.Task(id=follower_id).model_dump(),
+            status_code=HTTPStatus.CREATED,
+        )
+
+    time_limits = get_adaptive_time_limits().for_url(archive_create.url)
+    try:
+        task_id = get_fair_queue().submit(
+            celery,
+            "create_archive_task",
+            [archive_create.model_dump_json()],
+            archive_create.author_id,
+            task_id=leader_id,
+            **group_queue,
+            **time_limits,
+        )
+    except Exception as e:
+        if leader_id:
+            abandon_in_flight_archive(archive_create, leader_id, e)
+        raise
+    task_response = schemas.Task(id=task_id)
+    return JSONResponse(
+        task_response.model_dump(), status_code=HTTPStatus.CREATED
+    )
+
+
+@router.post(
+    "/archive/batch",
+    status_code=HTTPStatus.CREATED,
+    summary="Submit many URL archive requests of the same group, they are archived by a single task.",
+    response_description="task_id for the batch and one task_id per URL, each will match its archive id.",
+)
+def archive_url_batch(
+    batch: schemas.ArchiveBatchTrigger,
+    force: bool = False,
+    email=Depends(get_token_or_user_auth),
+    db: Session = Depends(get_db_dependency),
+) -> JSONResponse:
+    """
+    Each URL goes through the same checks as in /url/archive: recently failed
+    URLs fail right away unless `force`d, recent archives are reused and URLs
+    already being archived follow that task, only the rest are sent in the
+    batch. The batch id is null when no URL is left to archive.
+    """
+    max_urls = get_settings().ARCHIVE_BATCH_MAX_URLS
+    if len(batch.archives) > max_urls:
         raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST, detail="Invalid URL received."
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail=f"A batch can have at most {max_urls} URLs.",
         )
+    group_ids = {a.group_id for a in batch.archives}
+    if len(group_ids) > 1:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="All URLs in a batch must belong to the same group.",
+        )
+    group_id = group_ids.pop()
+    logger.info(
+        f"new batch task with {len(batch.archives)} URLs for {email=} and {group_id=}"
+    )
 
-    archive_create = schemas.ArchiveCreate(**archive.model_dump())
-    if email != ALLOW_ANY_EMAIL:
-        archive_create.author_id = email
-        user = UserState(db, email)
-        if archive.group_id and not user.in_group(archive.group_id):
-            raise HTTPException(
-                status_code=HTTPStatus.FORBIDDEN,
-                detail="User does not have access to this group.",
-            )
-        if not user.has_quota_max_monthly_urls(archive.group_id):
-            raise HTTPException(
-                status_code=HTTPStatus.TOO_MANY_REQUESTS,
-                detail="User has reached their monthly URL quota.",
-            )
-        if not user.has_quota_max_monthly_mbs(archive.group_id):
-            raise HTTPException(
-                status_code=HTTPStatus.TOO_MANY_REQUESTS,
-                detail="User has reached their monthly MB quota.",
-            )
-        group_queue = user.priority_group(archive_create.group_id)
-    else:
-        archive_create.author_id = archive.author_id or email
-        group_queue = convert_priority_to_queue_dict("high")
+    requested = []
+    for archive in batch.archives:
+        validate_url(archive.url)
+        archive_create = schemas.ArchiveCreate(
+            **archive.model_dump(), id=models.generate_uuid()
+        )
+        archive_create.author_id = get_author_id(email, archive.author_id)
+        requested.append(archive_create)
+    # batches run as long as sheets, on the sheet worker pool
+    group_queue = authorize_archive_in_group(
+        email, group_id, db, len(requested), sheet=True
+    )
+
+    archives, tasks = [], []
+    for archive_create in requested:
+        task_id = skip_batch_url(email, archive_create, force, db)
+        if not task_id:
+            archives.append(archive_create)
+            task_id = archive_create.id
+        tasks.append(schemas.UrlTask(id=task_id, url=archive_create.url))
 
-    task = celery.signature(
-        "create_archive_task", args=[archive_create.model_dump_json()]
-    ).apply_async(**group_queue)
-    task_response = schemas.Task(id=task.id)
+    task_id = None
+    if archives:
+        task_id = submit_archive_batch(archives, group_queue)
+    task_response = schemas.BatchTask(id=task_id, tasks=tasks)
     return JSONResponse(
         task_response.model_dump(), status_code=HTTPStatus.CREATED
     )
@@ -123,3 +205,268 @@ def delete_archive(
         id=archive_id,
         deleted=crud.soft_delete_archive(db, archive_id, user.email),
     )
+
+
+def validate_url(url: str) -> None:
+    parsed_url = urlparse(url)
+    if not all([parsed_url.scheme, parsed_url.netloc]):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST, detail="Invalid URL received."
+        )
+
+
+def get_author_id(email: str, requested_author_id: str | None) -> str:
+    # only the API token can archive on behalf of someone else
+    if email != ALLOW_ANY_EMAIL:
+        return email
+    return requested_author_id or email
+
+
+def authorize_archive_in_group(
+    email: str, group_id: str, db: Session, urls: int = 1, sheet: bool = False
+) -> dict:
+    """
+    Ensures the user can archive `urls` URLs in the group and is within
+    their quotas, returns the celery queue arguments for the group's
+    priority, in the sheet queues if `sheet`.
+    """
+    if email == ALLOW_ANY_EMAIL:
+        return convert_priority_to_queue_dict("high", sheet=sheet)
+
+    user = UserState(db, email)
+    if group_id and not user.in_group(group_id):
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail="User does not have access to this group.",
+        )
+    if not user.has_quota_max_monthly_urls(group_id, urls):
+        raise HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail=(
+                "User has reached their monthly URL quota."
+                if urls == 1
+                else f"A batch of {urls} URLs exceeds the user's monthly URL quota."
+            ),
+        )
+    if not user.has_quota_max_monthly_mbs(group_id):
+        raise HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail="User has reached their monthly MB quota.",
+        )
+    return user.priority_group(group_id, sheet=sheet)
+
+
+def check_recent_failure(url: str, force: bool) -> None:
+    """
+    Refuses URLs that failed to archive recently, unless `force`d, see
+    app/shared/negative_cache.py
+    """
+    failure = get_negative_cache().get(url)
+    if not failure:
+        return
+    if force:
+        NEGATIVE_CACHE_BYPASSED.labels(source="url").inc()
+        return
+    NEGATIVE_CACHE_SUPPRESSED.labels(
+        source="url", failure_class=failure["failure_class"]
+    ).inc()
+    raise HTTPException(
+        status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+        detail=(
+            f"This URL failed to archive recently ({failure['failure_class']}): "
+            f"{failure['error']}. Try again later or use force=true."
+        ),
+        headers={"Retry-After": str(failure["retry_after"])},
+    )
+
+
+def reuse_recent_archive(
+    email: str, archive: schemas.ArchiveCreate, db: Session
+) -> str | None:
+    """
+    If the group allows it, looks for an archive of the same URL created in
+    the last `reuse_within_minutes` that the user can read. It is returned
+    as is when it matches the request, otherwise it is cloned for the
+    requesting author/group. Returns the id to report as the task id, or None
+    if the URL should be archived.
+    """
+    within_minutes = crud.get_group_reuse_window(db, archive.group_id)
+    if not within_minutes:
+        return None
+
+    read_groups, read_public = True, True
+    if email != ALLOW_ANY_EMAIL:
+        user = UserState(db, email)
+        read_groups, read_public = user.read, user.read_public
+    recent = crud.find_recent_archive(
+        db,
+        archive.url,
+        archive.author_id,
+        read_groups,
+        read_public,
+        within_minutes,
+    )
+    if not recent:
+        ARCHIVE_REUSE.labels(outcome="miss").inc()
+        return None
+
+    if (
+        recent.author_id == archive.author_id
+        and recent.group_id == archive.group_id
+        and recent.public == archive.public
+        and {t.id for t in recent.tags} == (archive.tags or set())
+    ):
+        outcome, archive_id = "returned", recent.id
+    else:
+        outcome, archive_id = "cloned", clone_archive(recent, archive, db)
+    # so /task/{id} can be polled just like for an archiving task
+    celery.backend.store_result(
+        archive_id,
+        schemas.ArchiveResultRef(
+            archive_id=archive_id, status=STATUS_SUCCESS, url=archive.url
+        ).model_dump(),
+        STATUS_SUCCESS,
+    )
+
+    logger.info(f"[REUSE] {outcome} {recent.id} for {archive.url}")
+    ARCHIVE_REUSE.labels(outcome=outcome).inc()
+    metadata = (recent.result or {}).get("metadata") or {}
+    if isinstance(metadata.get("archive_duration_seconds"), (int, float)):
+        ARCHIVE_REUSE_SECONDS_SAVED.inc(metadata["archive_duration_seconds"])
+    return archive_id
+
+
+def clone_archive(
+    source: models.Archive, archive: schemas.ArchiveCreate, db: Session
+) -> str:
+    archive = archive.model_copy(
+        update={
+            "id": models.generate_uuid(),
+            "result": source.result,
+            "urls": [
+                models.ArchiveUrl(url=u.url, key=u.key) for u in source.urls
+            ],
+            "store_until": business_logic.get_store_archive_until_or_never(
+                db, archive.group_id
+            ),
+            "source_archive_id": source.id,
+        }
+    )
+    return crud.create_archive_copy(db, archive).id
+
+
+def join_in_flight_archive(
+    archive: schemas.ArchiveCreate,
+) -> tuple[str | None, str | None]:
+    """
+    Coalesces this request with an identical one (same group and URL) that
+    is still being archived, see app/shared/singleflight.py. Returns
+    (leader_id, None) if a new task must be sent with that id, or
+    (None, follower_id) if the running task will resolve this request.
+    """
+    candidate_id = models.generate_uuid()
+    follower = archive.model_copy(update={"id": candidate_id})
+    try:
+        is_leader, leader_id = singleflight.join(
+            Redis,
+            archive.group_id,
+            archive.url,
+            candidate_id,
+            follower.model_dump_json(),
+            get_settings().ARCHIVE_SINGLEFLIGHT_QUEUED_SECONDS,
+        )
+    except Exception as e:
+        logger.warning(f"[SINGLEFLIGHT] not coalescing {archive.url}: {e}")
+        return None, None
+
+    if is_leader:
+        ARCHIVE_SINGLEFLIGHT.labels(role="leader").inc()
+        return leader_id, None
+    logger.info(f"[SINGLEFLIGHT] {candidate_id} follows {leader_id}")
+    ARCHIVE_SINGLEFLIGHT.labels(role="follower").inc()
+    return None, candidate_id
+
+
+def skip_batch_url(
+    email: str, archive: schemas.ArchiveCreate, force: bool, db: Session
+) -> str | None:
+    """
+    The checks of /url/archive for one URL of a batch. Returns the id to
+    report for a URL the batch should not archive: it failed recently (its
+    task id fails right away), a recent archive is reused or it follows an
+    in-flight task. Returns None for URLs to archive, a singleflight leader
+    keeps its reserved id.
+    """
+    try:
+        check_recent_failure(archive.url, force)
+    except HTTPException as e:
+        celery.backend.mark_as_failure(archive.id, Exception(e.detail))
+        return archive.id
+
+    if reused_id := reuse_recent_archive(email, archive, db):
+        return reused_id
+
+    leader_id, follower_id = join_in_flight_archive(archive)
+    if follower_id:
+        return follower_id
+    if leader_id:
+        archive.id = leader_id
+    return None
+
+
+def submit_archive_batch(
+    archives: list[schemas.ArchiveCreate], group_queue: dict
+) -> str:
+    # a batch weighs as much as its URLs when sharing a queue with other
+    # users, it is queued for the author of its first URL
+    try:
+        return get_fair_queue().submit(
+            celery,
+            "create_archive_batch_task",
+            [[a.model_dump_json() for a in archives]],
+            archives[0].author_id,
+            cost=len(archives),
+            **group_queue,
+            **batch_time_limits(archives),
+        )
+    except Exception as e:
+        for archive in archives:
+            abandon_in_flight_archive(archive, archive.id, e)
+        raise
+
+
+def batch_time_limits(archives: list[schemas.ArchiveCreate]) -> dict:
+    """
+    The learned time limits of the URLs of a batch added up, up to the
+    ceiling of sheet runs. No override unless every URL has learned limits.
+    """
+    limits = [get_adaptive_time_limits().for_url(a.url) for a in archives]
+    if not all(limits):
+        return {}
+    soft = min(
+        sum(lim["soft_time_limit"] for lim in limits),
+        get_settings().SHEET_TIME_LIMIT_CEILING_SECONDS,
+    )
+    grace = max(lim["time_limit"] - lim["soft_time_limit"] for lim in limits)
+    return {"soft_time_limit": soft, "time_limit": soft + grace}
+
+
+def abandon_in_flight_archive(
+    archive: schemas.ArchiveCreate, leader_id: str, error: Exception
+) -> None:
+    """
+    Releases the singleflight lock of a leader whose task could not be sent,
+    and fails the requests that already joined it, which would otherwise
+    follow a task that never runs.
+    """
+    try:
+        followers = singleflight.finish(
+            Redis, archive.group_id, archive.url, leader_id
+        )
+        for follower_json in followers:
+            follower_id = json.loads(follower_json)["id"]
+            celery.backend.mark_as_failure(follower_id, error)
+    except Exception as e:
+        logger.warning(
+            f"[SINGLEFLIGHT] could not release {leader_id} of {archive.url}: {e}"
+        )
@@ -4,10 +4,10 @@ import os
 import shutil
 from urllib.parse import urlparse
 
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter, Gauge, Histogram
 
 from app.shared.db.database import get_db
-from app.shared.log import log_error
+from app.shared.log import log_error, logger
 from app.shared.task_messaging import get_redis
 from app.web.db import crud
 
@@ -20,8 +20,8 @@ EXCEPTION_COUNTER = Counter(
 )
 WORKER_EXCEPTION = Counter(
     "worker_exceptions_total",
-    "Number of times a certain exception has occurred on the worker.",
-    labelnames=["type", "exception", "task", "traceback"],
+    "Number of times a certain exception has occurred on the worker, by fingerprint (see app/worker/exception_summary.py and record_worker_exceptions).",
+    labelnames=["type", "task", "fingerprint"],
 )
 DISK_UTILIZATION = Gauge(
     "disk_utilization", "Disk utilization in GB", labelnames=["type"]
@@ -41,6 +41,159 @@ REFERER_COUNTER = Counter(
     "Number of requests received, grouped by their referer origin.",
     labelnames=["referer"],
 )
+ORCHESTRATOR_POOL_EVENTS = Counter(
+    "worker_orchestrator_pool_events",
+    "Worker orchestrator pool hits, misses, evictions and discards.",
+    labelnames=["event"],
+)
+ORCHESTRATOR_SETUP_SECONDS = Counter(
+    "worker_orchestrator_setup_seconds",
+    "Total seconds workers spent setting up new orchestrators.",
+)
+ARCHIVE_REUSE = Counter(
+    "archive_reuse_lookups",
+    "URL archive requests checked for a recent archive, by outcome: miss, returned or cloned.",
+    labelnames=["outcome"],
+)
+ARCHIVE_REUSE_SECONDS_SAVED = Counter(
+    "archive_reuse_worker_seconds_saved",
+    "Archiving seconds, as measured on the original archive, that reused archives did not spend on workers.",
+)
+ARCHIVE_SINGLEFLIGHT = Counter(
+    "archive_singleflight_requests",
+    "URL archive requests that started a task (leader) or joined an identical running one (follower).",
+    labelnames=["role"],
+)
+DOMAIN_LIMITER_TOKENS = Gauge(
+    "worker_domain_limiter_tokens",
+    "Tokens left in the rate limit bucket of a configured domain, as last seen by a worker.",
+    labelnames=["domain"],
+)
+DOMAIN_LIMITER_IN_FLIGHT = Gauge(
+    "worker_domain_limiter_in_flight",
+    "Archives of a configured domain currently in progress across all workers.",
+    labelnames=["domain"],
+)
+DOMAIN_LIMITER_THROTTLED = Counter(
+    "worker_domain_limiter_throttled",
+    "Archives of a configured domain deferred because it hit its rate or concurrency limit.",
+    labelnames=["domain", "reason"],
+)
+TASK_PHASE_SECONDS = Histogram(
+    "worker_task_phase_seconds",
+    "Duration of each phase of worker tasks: setup, feed, get_all_urls, serialize, db_insert and total.",
+    labelnames=["task", "phase", "group", "queue", "domain"],
+    buckets=(
+        0.01,
+        0.05,
+        0.1,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+        30,
+        60,
+        120,
+        300,
+        600,
+        1200,
+        2400,
+    ),
+)
+WORKER_CHILD_RSS_BYTES = Gauge(
+    "worker_child_rss_bytes",
+    "Peak resident memory of each worker child process after its last task, by host:pool index.",
+    labelnames=["child"],
+)
+WORKER_CHILD_RECYCLES = Counter(
+    "worker_child_recycles",
+    "Worker child processes replaced for going over WORKER_MAX_RSS_MB.",
+)
+TASK_FAILURES = Counter(
+    "worker_task_failures",
+    "Failed attempts of retried worker tasks by failure class, kind (transient or permanent) and whether the attempt was a retry.",
+    labelnames=["task", "failure_class", "kind", "retry"],
+)
+TASK_FAILURE_SECONDS = Counter(
+    "worker_task_failure_seconds",
+    "Worker seconds spent on failed attempts, by the same labels as worker_task_failures.",
+    labelnames=["task", "failure_class", "kind", "retry"],
+)
+TASK_RETRY_SECONDS = Counter(
+    "worker_task_retry_seconds",
+    "Worker seconds spent on retries that succeeded, failed retries are in worker_task_failure_seconds{retry=yes}.",
+    labelnames=["task"],
+)
+NEGATIVE_CACHE_SUPPRESSED = Counter(
+    "negative_cache_suppressed",
+    "Archive attempts of URLs skipped because they failed recently, by source (url or sheet) and failure class.",
+    labelnames=["source", "failure_class"],
+)
+NEGATIVE_CACHE_BYPASSED = Counter(
+    "negative_cache_bypassed",
+    "Archive attempts of URLs that failed recently let through with force=true.",
+    labelnames=["source"],
+)
+SHEET_RUNS_COALESCED = Counter(
+    "sheet_runs_coalesced",
+    "Sheet runs not started because another run of the sheet was queued or running, by source (cron, manual or worker).",
+    labelnames=["source"],
+)
+FAIR_QUEUE_WAIT_SECONDS = Histogram(
+    "fair_queue_wait_seconds",
+    "Seconds tasks waited in the fair queue of their author before being sent to the celery queue, by user (see observe_fair_queue_wait).",
+    labelnames=["queue", "user"],
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600),
+)
+FAIR_QUEUE_DISPATCHED = Counter(
+    "fair_queue_dispatched",
+    "Cost (URLs) of the tasks sent from the fair queues to celery, by lane: a group with a share, or _shared for the others.",
+    labelnames=["queue", "lane"],
+)
+FAIR_QUEUE_PENDING_TASKS = Gauge(
+    "fair_queue_pending_tasks",
+    "Tasks waiting in the fair queues of their authors.",
+    labelnames=["queue"],
+)
+FAIR_QUEUE_PENDING_USERS = Gauge(
+    "fair_queue_pending_users",
+    "Users with tasks waiting in a fair queue.",
+    labelnames=["queue"],
+)
+QUEUE_MAX_WAIT_SECONDS = Gauge(
+    "queue_max_wait_seconds",
+    "Seconds the oldest task of a queue has been waiting, by stage: in the fair queues of their authors, or in the celery queue.",
+    labelnames=["queue", "stage"],
+)
+TASKS_PROMOTED = Counter(
+    "tasks_promoted",
+    "Low priority tasks moved to the front of the high priority queue after waiting longer than PRIORITY_AGING_SECONDS.",
+    labelnames=["queue"],
+)
+ORPHANED_TASKS_REQUEUED = Counter(
+    "orphaned_tasks_requeued",
+    "Tasks put back in their queue because their heartbeat stopped, their worker died mid-task.",
+    labelnames=["task"],
+)
+
+# metrics the worker is allowed to report through
+# app/worker/worker_metrics.py::publish_metric, by name
+WORKER_METRICS = {
+    "orchestrator_pool_events": ORCHESTRATOR_POOL_EVENTS,
+    "orchestrator_setup_seconds": ORCHESTRATOR_SETUP_SECONDS,
+    "domain_limiter_tokens": DOMAIN_LIMITER_TOKENS,
+    "domain_limiter_in_flight": DOMAIN_LIMITER_IN_FLIGHT,
+    "domain_limiter_throttled": DOMAIN_LIMITER_THROTTLED,
+    "task_phase_seconds": TASK_PHASE_SECONDS,
+    "worker_child_rss_bytes": WORKER_CHILD_RSS_BYTES,
+    "worker_child_recycles": WORKER_CHILD_RECYCLES,
+    "task_failures": TASK_FAILURES,
+    "task_failure_seconds": TASK_FAILURE_SECONDS,
+    "task_retry_seconds": TASK_RETRY_SECONDS,
+    "negative_cache_suppressed": NEGATIVE_CACHE_SUPPRESSED,
+    "sheet_runs_coalesced": SHEET_RUNS_COALESCED,
+}
 
 # Maximum number of distinct referer origins tracked as individual Prometheus
 # labels. Once the cap is reached every new origin is recorded as "other" to
@@ -84,22 +237,115 @@ def increment_referer_counter(referer: str | None) -> None:
     REFERER_COUNTER.labels(referer=origin).inc()
 
 
+# Same cap for the users fair queue wait times are labeled with, the others
+# share the "other" label.
+_FAIR_QUEUE_MAX_USERS: int = 100
+_fair_queue_users: set[str] = set()
+
+
+def observe_fair_queue_wait(queue: str, author_id: str, seconds: float) -> None:
+    user = author_id
+    if user not in _fair_queue_users:
+        if len(_fair_queue_users) >= _FAIR_QUEUE_MAX_USERS:
+            user = "other"
+        else:
+            _fair_queue_users.add(user)
+    FAIR_QUEUE_WAIT_SECONDS.labels(queue=queue, user=user).observe(seconds)
+
+
+# Same cap for the exception fingerprints worker exceptions are labeled with,
+# the others share the "other" label.
+_WORKER_EXCEPTION_MAX_FINGERPRINTS: int = 200
+_worker_exception_fingerprints: set[str] = set()
+
+
+def record_worker_exceptions(data: dict) -> None:
+    """
+    Counts the exceptions of a worker summary message by fingerprint. The
+    example message and traceback of a fingerprint are only logged the first
+    time it is seen, Prometheus labels never hold them. Messages of a single
+    exception from older workers count under the "unknown" fingerprint.
+    """
+    for summary in data.get("exceptions", [data]):
+        key = summary.get("fingerprint") or "unknown"
+        if key not in _worker_exception_fingerprints:
+            if len(_worker_exception_fingerprints) >= (
+                _WORKER_EXCEPTION_MAX_FINGERPRINTS
+            ):
+                key = "other"
+            else:
+                _worker_exception_fingerprints.add(key)
+                logger.error(
+                    f"worker exception {key} in {data['task']}: "
+                    f"{summary['type']}: {summary.get('exception')}\n"
+                    f"{summary.get('traceback', '')}"
+                )
+        WORKER_EXCEPTION.labels(
+            type=summary["type"], task=data["task"], fingerprint=key
+        ).inc(summary.get("count", 1))
+
+
 async def redis_subscribe_worker_exceptions(redis_exceptions_channel: str):
-    # Subscribe to Redis channel and increment the counter for each exception
-    # with info on the exception and task
+    # Subscribe to Redis channel and count every pending worker exception
+    # summary on each tick
     Redis = get_redis()
     PubSubExceptions = Redis.pubsub()
     PubSubExceptions.subscribe(redis_exceptions_channel)
     while True:
-        message = PubSubExceptions.get_message()
-        if message and message["type"] == "message":
-            data = json.loads(message["data"].decode("utf-8"))
-            WORKER_EXCEPTION.labels(
-                type=data["type"],
-                exception=data["exception"],
-                task=data["task"],
-                traceback=data["traceback"],
-            ).inc()
+        while message := PubSubExceptions.get_message():
+            if message["type"] != "message":
+                continue
+            try:
+                record_worker_exceptions(
+                    json.loads(message["data"].decode("utf-8"))
+                )
+            except Exception as e:
+                log_error(
+                    e, extra=f"invalid worker exception: {message['data']}"
+                )
+        await asyncio.sleep(1)
+
+
+def record_worker_metric(data: dict) -> None:
+    """
+    Applies one worker metric sample to its Prometheus collector, unknown
+    metric names are ignored so a newer worker cannot break the web process.
+    A batch carries many samples, and a sample may carry many `values`.
+    """
+    if "batch" in data:
+        for sample in data["batch"]:
+            record_worker_metric(sample)
+        return
+    metric = WORKER_METRICS.get(data.get("metric"))
+    if metric is None:
+        return
+    if labels := data.get("labels"):
+        metric = metric.labels(**labels)
+    for value in data.get("values", [data.get("value", 1)]):
+        if isinstance(metric, Counter):
+            metric.inc(value)
+        elif isinstance(metric, Gauge):
+            metric.set(value)
+        else:
+            metric.observe(value)
+
+
+async def redis_subscribe_worker_metrics(redis_metrics_channel: str):
+    # Subscribe to Redis channel and drain all pending worker metric samples
+    # on every tick, the worker may publish several per task
+    Redis = get_redis()
+    PubSubMetrics = Redis.pubsub()
+    PubSubMetrics.subscribe(redis_metrics_channel)
+    while True:
+        while message := PubSubMetrics.get_message():
+            if message["type"] != "message":
+                continue
+            try:
+                record_worker_metric(
+                    json.loads(message["data"].decode("utf-8"))
+                )
+            except Exception as e:
+                log_error(e, extra=f"invalid worker metric: {message['data']}")
         await asyncio.sleep(1)
 
 
@@ -2,6 +2,8 @@ import base64
 
 from fastapi.encoders import jsonable_encoder
 
+from app.shared.task_messaging import queue_options
+
 
 def custom_jsonable_encoder(obj):
     if isinstance(obj, bytes):
@@ -9,8 +11,7 @@ def custom_jsonable_encoder(obj):
     return jsonable_encoder(obj)
 
 
-def convert_priority_to_queue_dict(priority: str) -> dict:
-    return {
-        "priority": 0 if priority == "high" else 10,
-        "queue": f"{priority}_priority",
-    }
+def convert_priority_to_queue_dict(
+    priority: str, sheet: bool = False, group_id: str = None, share: int = 0
+) -> dict:
+    return queue_options(priority, sheet, group_id, share)
@@ -0,0 +1,187 @@
+"""
+Per-domain rate and concurrency limits shared by every worker, so that a
+sheet full of links to the same platform does not get all of our archivers
+blocked by it.
+
+Each configured domain has a token bucket (requests started per minute) and a
+semaphore (requests in progress) in Redis, both checked and taken in a single
+Lua script. Semaphore slots are leased rather than held, so a worker that dies
+mid-archive only keeps its slot until the lease runs out.
+
+Whenever Redis is unavailable the limiter lets everything through: it protects
+the archived platforms, it must never stop archiving altogether.
+"""
+
+from typing import Container, Iterable, Iterator
+
+from auto_archiver.core import Metadata
+
+from app.shared.log import logger
+from app.shared.settings import DomainLimit
+from app.shared.task_messaging import get_redis
+from app.shared.utils.misc import url_host
+from app.worker.worker_metrics import publish_metric
+
+
+Redis = get_redis()
+
+BUCKET_PREFIX = "domain-limit:bucket"
+SLOTS_PREFIX = "domain-limit:slots"
+
+# returns {allowed, reason, retry after seconds, tokens left, slots in use}
+_ACQUIRE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_slots = tonumber(ARGV[3])
+local holder = ARGV[4]
+local lease = tonumber(ARGV[5])
+local retry = ARGV[6]
+
+local in_use = 0
+if max_slots > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    in_use = redis.call('ZCARD', KEYS[2])
+    if in_use >= max_slots and not redis.call('ZSCORE', KEYS[2], holder) then
+        return {0, 'concurrency', retry, '-1', in_use}
+    end
+end
+
+local tokens = -1
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        return {0, 'rate', tostring((1 - tokens) / rate), tostring(tokens), in_use}
+    end
+    tokens = tokens - 1
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+end
+
+if max_slots > 0 then
+    redis.call('ZADD', KEYS[2], now + lease, holder)
+    redis.call('EXPIRE', KEYS[2], math.ceil(lease))
+    in_use = redis.call('ZCARD', KEYS[2])
+end
+return {1, 'ok', '0', tostring(tokens), in_use}
+"""
+
+_RELEASE = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+def match_domain(url: str, domains: Container[str]) -> str | None:
+    """
+    The domain of `domains` that `url` belongs to, the host itself or its
+    closest parent domain, eg: "mobile.x.com" belongs to "x.com".
+    """
+    parts = url_host(url).split(".")
+    for i in range(len(parts) - 1):
+        domain = ".".join(parts[i:])
+        if domain in domains:
+            return domain
+    return None
+
+
+class DomainLimiter:
+    def __init__(
+        self,
+        limits: dict[str, DomainLimit],
+        retry_seconds: int,
+        lease_seconds: int,
+    ):
+        self.limits = {url_host(f"//{d}"): limit for d, limit in limits.items()}
+        self.retry_seconds = retry_seconds
+        self.lease_seconds = lease_seconds
+
+    def domain_for(self, url: str) -> str | None:
+        # the configured domain limiting `url`
+        return match_domain(url, self.limits)
+
+    def acquire(
+        self, url: str, holder: str, lease_seconds: float | None = None
+    ) -> float:
+        """
+        Takes a token and a slot for `holder` on the domain of `url`, the slot
+        leased for `lease_seconds` (by default, that of the limiter): it must
+        outlive the archive. Returns 0 when allowed to go ahead, otherwise how
+        many seconds to wait before trying again. Must be paired with
+        release() when allowed.
+        """
+        domain = self.domain_for(url)
+        if domain is None:
+            return 0
+        limit = self.limits[domain]
+        try:
+            allowed, reason, retry_after, tokens, in_use = (
+                Redis.register_script(_ACQUIRE)(
+                    keys=[
+                        f"{BUCKET_PREFIX}:{domain}",
+                        f"{SLOTS_PREFIX}:{domain}",
+                    ],
+                    args=[
+                        limit.per_minute / 60,
+                        max(1, limit.burst),
+                        limit.max_concurrency,
+                        holder,
+                        lease_seconds or self.lease_seconds,
+                        self.retry_seconds,
+                    ],
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Domain limiter unavailable for {domain}: {e}")
+            return 0
+
+        if limit.per_minute > 0:
+            publish_metric(
+                "domain_limiter_tokens", float(tokens), domain=domain
+            )
+        if limit.max_concurrency > 0:
+            publish_metric("domain_limiter_in_flight", in_use, domain=domain)
+        if allowed:
+            return 0
+        reason = reason.decode() if isinstance(reason, bytes) else reason
+        publish_metric("domain_limiter_throttled", domain=domain, reason=reason)
+        return max(1.0, float(retry_after))
+
+    def release(self, url: str, holder: str) -> None:
+        domain = self.domain_for(url)
+        if domain is None or not self.limits[domain].max_concurrency:
+            return
+        try:
+            in_use = Redis.register_script(_RELEASE)(
+                keys=[f"{SLOTS_PREFIX}:{domain}"], args=[holder]
+            )
+        except Exception as e:
+            logger.warning(f"Domain limiter unavailable for {domain}: {e}")
+            return
+        publish_metric("domain_limiter_in_flight", in_use, domain=domain)
+
+    def gate(
+        self, items: Iterable[Metadata], holder: str, deferred: list[float]
+    ) -> Iterator[Metadata]:
+        """
+        Lets through the items whose domain is within its limits, holding
+        each one's slot until the next item is requested. The first item
+        throttled ends the feed and its wait is appended to `deferred`: the
+        task is requeued to continue from that item, instead of reading every
+        remaining row of the sheet only to skip those of the same domain.
+        """
+        for item in items:
+            url = item.get_url()
+            wait = self.acquire(url, holder)
+            if wait:
+                deferred.append(wait)
+                return
+            try:
+                yield item
+            finally:
+                self.release(url, holder)
@@ -0,0 +1,91 @@
+"""
+Exceptions reported to the web process by fingerprint rather than one by one:
+a sheet with thousands of broken rows used to publish as many messages, each
+a worker_exceptions_total label set of its own with the full traceback.
+
+A fingerprint is the exception type and the innermost frames of its traceback
+(file and function, without line numbers so it survives deploys), or its
+message with numbers and URLs masked when there is no traceback. The same
+bug on different rows shares a fingerprint. An ExceptionSummary counts the
+exceptions of a task by fingerprint and publishes them in one message every
+EXCEPTION_SUMMARY_INTERVAL_SECONDS and when the task ends, with the message
+and traceback of the first occurrence as an example.
+"""
+
+import hashlib
+import json
+import re
+import time
+
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
+
+
+Redis = get_redis()
+
+# innermost frames a fingerprint is made of
+FINGERPRINT_FRAMES = 5
+# length of the example message and traceback of a fingerprint
+MAX_EXAMPLE_LENGTH = 2000
+
+_FRAME = re.compile(r'File "(?:.*[/\\])?([^/\\"]+)", line \d+, in (\S+)')
+_VARIABLE = re.compile(r"\w+://\S+|0x[0-9a-f]+|\d+", re.IGNORECASE)
+
+
+def fingerprint(exception: BaseException, trace_back: str = "") -> str:
+    frames = _FRAME.findall(trace_back or "")[-FINGERPRINT_FRAMES:]
+    if frames:
+        where = ";".join(f"{file}:{function}" for file, function in frames)
+    else:
+        where = _VARIABLE.sub("*", str(exception))
+    key = f"{exception.__class__.__name__}|{where}"
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+class ExceptionSummary:
+    def __init__(self, task_name: str, interval_seconds: float = 0):
+        self.task_name = task_name
+        # 0 only publishes on publish()
+        self.interval_seconds = interval_seconds
+        self.exceptions: dict[str, dict] = {}
+        self._published_at = time.monotonic()
+
+    def add(self, exception: BaseException, trace_back: str = "") -> None:
+        # counts the exception, publishes the summary once the interval passed
+        key = fingerprint(exception, trace_back)
+        summary = self.exceptions.setdefault(
+            key,
+            {
+                "type": exception.__class__.__name__,
+                "fingerprint": key,
+                "count": 0,
+                "exception": str(exception)[:MAX_EXAMPLE_LENGTH],
+                "traceback": (trace_back or "")[-MAX_EXAMPLE_LENGTH:],
+            },
+        )
+        summary["count"] += 1
+        elapsed = time.monotonic() - self._published_at
+        if self.interval_seconds and elapsed >= self.interval_seconds:
+            self.publish()
+
+    def publish(self) -> None:
+        # sends the exceptions counted since the last publish, if any
+        self._published_at = time.monotonic()
+        if not self.exceptions:
+            return
+        exceptions, self.exceptions = list(self.exceptions.values()), {}
+        channel = get_settings().REDIS_EXCEPTIONS_CHANNEL
+        try:
+            Redis.publish(
+                channel,
+                json.dumps(
+                    {"task": self.task_name, "exceptions": exceptions},
+                    default=str,
+                ),
+            )
+        except Exception as e:
+            logger.error(
+                f"[CRITICAL] Could not publish {len(exceptions)} exception "
+                f"fingerprints of {self.task_name} to {channel}: {e}"
+            )
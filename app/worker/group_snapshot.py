@@ -0,0 +1,97 @@
+import datetime
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+from cachetools import TTLCache
+
+from app.shared import business_logic
+from app.shared.db import models, worker_crud
+from app.shared.db.database import task_db
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
+
+
+Redis = get_redis()
+
+
+class GroupSnapshot(NamedTuple):
+    """
+    Read-only copy of the group settings an archiving task needs, taken once
+    per task so the archiving loop never goes back to the database for them.
+    """
+
+    id: str
+    orchestrator: str | None
+    orchestrator_sheet: str | None
+    service_account_email: str | None
+    permissions: MappingProxyType
+
+    @classmethod
+    def from_group(cls, group: models.Group) -> "GroupSnapshot":
+        return cls(
+            id=group.id,
+            orchestrator=group.orchestrator,
+            orchestrator_sheet=group.orchestrator_sheet,
+            service_account_email=group.service_account_email,
+            permissions=MappingProxyType(dict(group.permissions or {})),
+        )
+
+    @property
+    def priority(self) -> str:
+        return self.permissions.get("priority", "low")
+
+    def store_until(self) -> datetime.datetime | None:
+        # same rules as business_logic.get_store_archive_until
+        assert self.permissions, f"Group {self.id} has no permissions."
+        return business_logic.store_until_from_lifespan(
+            self.permissions.get("max_archive_lifespan_months", -1)
+        )
+
+
+class GroupSnapshotCache:
+    """
+    Per worker process TTL cache of GroupSnapshot by group id.
+
+    The whole cache is dropped as soon as the config version in Redis changes,
+    which upsert_user_groups bumps on every user-groups reload, the TTL only
+    bounds staleness if that signal is lost.
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int = 256):
+        self._cache: TTLCache = TTLCache(maxsize=max_size, ttl=ttl_seconds)
+        self._version = None
+        # cachetools caches are not thread-safe
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, group_id: str) -> GroupSnapshot:
+        self._check_version()
+        with self._lock:
+            snapshot = self._cache.get(group_id)
+        if snapshot is None:
+            with task_db() as session:
+                group = worker_crud.get_group(session, group_id)
+                assert group, f"Group {group_id} not found."
+                snapshot = GroupSnapshot.from_group(group)
+            with self._lock:
+                self._cache[group_id] = snapshot
+        return snapshot
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def _check_version(self) -> None:
+        key = get_settings().REDIS_GROUP_CONFIG_VERSION_KEY
+        try:
+            version = Redis.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read {key} from redis: {e}")
+            return
+        if version != self._version:
+            self.clear()
+            self._version = version
@@ -1,20 +1,62 @@
 import datetime
+import functools
 import json
+import random
+import time
 import traceback
+from contextlib import contextmanager
 
 from auto_archiver.core.orchestrator import ArchivingOrchestrator
-from celery.signals import task_failure
-from sqlalchemy import exc
+from auto_archiver.utils.url import check_url_or_raise
+from celery import chord
+from celery.exceptions import Ignore, Retry, SoftTimeLimitExceeded
+from celery.signals import (
+    task_failure,
+    task_postrun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
 
-from app.shared import business_logic, constants, schemas
+from app.shared import (
+    constants,
+    failures,
+    schemas,
+    sheet_progress,
+    singleflight,
+)
 from app.shared.db import models, worker_crud
-from app.shared.db.database import get_db
+from app.shared.db.database import (
+    configure_engine,
+    task_db,
+    unit_of_work,
+)
 from app.shared.log import log_error
+from app.shared.negative_cache import NegativeCache
 from app.shared.settings import get_settings
-from app.shared.task_messaging import get_celery, get_redis
+from app.shared.sheet_lease import SheetLeases
+from app.shared.sheet_progress import SheetProgress
+from app.shared.task_heartbeats import TaskHeartbeats
+from app.shared.task_messaging import (
+    get_celery,
+    get_redis,
+    reset_redis_clients,
+)
+from app.shared.time_limits import AdaptiveTimeLimits
 from app.shared.utils.misc import get_all_urls
 from app.shared.utils.sheets import get_sheet_access_error
+from app.worker import sheet_shards, task_timing
+from app.worker.domain_limiter import DomainLimiter
+from app.worker.exception_summary import ExceptionSummary
+from app.worker.group_snapshot import GroupSnapshot, GroupSnapshotCache
+from app.worker.memory_watchdog import check_child_rss
+from app.worker.orchestrator_pool import OrchestratorPool, SharedLogger
+from app.worker.sheet_checkpoint import SheetCheckpoint
+from app.worker.task_timing import PhaseTimer
 from app.worker.worker_log import logger, setup_celery_logger
+from app.worker.worker_metrics import publish_metric
+from app.worker.write_buffer import ArchiveWriteBuffer, flush_active_buffers
 
 
 # Time limits for tasks (in seconds)
@@ -28,12 +70,79 @@ SHEET_HARD_TIME_LIMIT = 6.5 * 60 * 60  # 6.5 hours
 settings = get_settings()
 
 celery = get_celery("worker")
+# gevent needs its monkey patching, so the pool is best chosen with --pool on
+# the command line, see WORKER_POOL
+celery.conf.worker_pool = settings.WORKER_POOL
+# children are recycled once over WORKER_MAX_RSS_MB, see memory_watchdog.py,
+# prefork only as threads and gevent run every task in the worker process
+celery.conf.worker_max_memory_per_child = (
+    settings.WORKER_MAX_RSS_MB * 1024 or None
+)
 Redis = get_redis()
 
 USER_GROUPS_FILENAME = settings.USER_GROUPS_FILENAME
 
 setup_celery_logger(celery)
-AA_LOGGER_ID = None
+# everything below is shared by the tasks of a process, which run concurrently
+# in threads or gevent pools, so it must not hold per-task state
+AA_LOGGER = SharedLogger()
+ORCHESTRATOR_POOL = OrchestratorPool(settings.ORCHESTRATOR_POOL_SIZE, AA_LOGGER)
+GROUP_SNAPSHOTS = GroupSnapshotCache(settings.GROUP_SNAPSHOT_TTL_SECONDS)
+DOMAIN_LIMITER = DomainLimiter(
+    settings.DOMAIN_LIMITS,
+    settings.DOMAIN_LIMIT_RETRY_SECONDS,
+    SINGLE_URL_HARD_TIME_LIMIT,
+)
+TIME_LIMITS = AdaptiveTimeLimits(Redis)
+NEGATIVE_CACHE = NegativeCache(Redis)
+HEARTBEATS = TaskHeartbeats(Redis, settings.TASK_HEARTBEAT_INTERVAL_SECONDS)
+SHEET_LEASES = SheetLeases(Redis)
+
+
+def retry_transient_only(run):
+    """
+    Classifies what a task raises, see app/shared/failures.py: permanent
+    failures are raised as a PermanentFailure which the task does not
+    autoretry, transient ones as they are. Failures and the worker seconds
+    spent on them, and on retries, are counted per failure class.
+    """
+
+    @functools.wraps(run)
+    def wrapper(task, *args, **kwargs):
+        started_at = time.perf_counter()
+        retry = "yes" if task.request.retries else "no"
+        try:
+            result = run(task, *args, **kwargs)
+        except (Ignore, Retry):
+            raise
+        except Exception as e:
+            seconds = time.perf_counter() - started_at
+            failure_class = failures.classify(e)
+            kind = failures.failure_kind(failure_class)
+            labels = {"task": task.name, "failure_class": failure_class}
+            publish_metric("task_failures", kind=kind, retry=retry, **labels)
+            publish_metric(
+                "task_failure_seconds",
+                seconds,
+                kind=kind,
+                retry=retry,
+                **labels,
+            )
+            if kind == failures.PERMANENT and not isinstance(
+                e, failures.PermanentFailure
+            ):
+                logger.info(f"{task.name} {failure_class} failure, no retry")
+                raise failures.PermanentFailure(str(e), failure_class) from e
+            raise
+        if retry == "yes":
+            publish_metric(
+                "task_retry_seconds",
+                time.perf_counter() - started_at,
+                task=task.name,
+            )
+        return result
+
+    return wrapper
 
 
 # TODO: after release, as it requires updating past entries with sheet_id where tag
@@ -42,6 +151,7 @@ AA_LOGGER_ID = None
     name="create_archive_task",
     bind=True,
     autoretry_for=(Exception,),
+    dont_autoretry_for=(failures.PermanentFailure,),
     retry_backoff=True,
     retry_kwargs={"max_retries": 1},
     soft_time_limit=SINGLE_URL_SOFT_TIME_LIMIT,
@@ -49,38 +159,183 @@ AA_LOGGER_ID = None
     acks_late=True,
     reject_on_worker_lost=True,
 )
+@retry_transient_only
+@unit_of_work()
 def create_archive_task(self, archive_json: str):
-    global AA_LOGGER_ID
     archive = schemas.ArchiveCreate.model_validate_json(archive_json)
+    check_url_or_raise(archive.url)
+    refresh_singleflight(archive, self.request.id)
+    timer = PhaseTimer(
+        self.name, archive.group_id, self.request.delivery_info, archive.url
+    )
+    group = GROUP_SNAPSHOTS.get(archive.group_id)
 
     # call auto-archiver
-    args = get_orchestrator_args(archive.group_id, False, [archive.url])
+    args = get_orchestrator_args(group, False, [archive.url])
+    # the slot lasts as long as this task may run, its limits can be raised
+    # above the static ones by the adaptive time limits
+    time_limit = (self.request.timelimit or (None,))[0]
+    if wait := DOMAIN_LIMITER.acquire(archive.url, self.request.id, time_limit):
+        requeue_throttled(self, wait)
     result = None
     orchestrator = None
+    healthy = False
+    aa_exit = None
     try:
-        orchestrator = ArchivingOrchestrator()
-        orchestrator.logger_id = AA_LOGGER_ID  # ensure single logger
-        orchestrator.setup(args)
-        AA_LOGGER_ID = orchestrator.logger_id
-        for orch_res in orchestrator.feed():
-            result = orch_res
+        with timer.phase(task_timing.SETUP):
+            orchestrator = ORCHESTRATOR_POOL.acquire(args, [archive.url])
+        with (
+            HEARTBEATS.beating(self),
+            timer.phase(task_timing.FEED),
+            timeout_recorded(
+                TIME_LIMITS.record_url_timeout, archive.url, self, timer
+            ),
+        ):
+            for orch_res in orchestrator.feed():
+                result = orch_res
+        healthy = True
     except SystemExit as e:
         log_error(e, "create_archive_task: SystemExit from AA")
+        aa_exit = e
     except Exception as e:
         log_error(e, "create_archive_task")
+        timer.publish()
         raise e
     finally:
-        cleanup_orchestrator(orchestrator)
-    assert result, f"UNABLE TO archive: {archive.url}"
+        ORCHESTRATOR_POOL.release(orchestrator, healthy)
+        DOMAIN_LIMITER.release(archive.url, self.request.id)
+    if not result:
+        timer.publish()
+        # chained so an AA configuration error is not retried
+        raise AssertionError(f"UNABLE TO archive: {archive.url}") from aa_exit
+    remember_outcome(archive.url, result)
 
     # prepare and insert in DB
-    archive.store_until = get_store_until(archive.group_id)
+    archive.store_until = get_store_until(group)
     archive.id = self.request.id
-    archive.urls = get_all_urls(result)
-    archive.result = json.loads(result.to_json())
-    insert_result_into_db(archive)
+    with timer.phase(task_timing.GET_ALL_URLS):
+        archive.urls = get_all_urls(result)
+    with timer.phase(task_timing.SERIALIZE):
+        archive.result = json.loads(result.to_json())
+    with timer.phase(task_timing.DB_INSERT):
+        insert_result_into_db(archive)
+    resolve_followers(self, archive, result)
+    TIME_LIMITS.record_url(archive.url, timer.durations[task_timing.FEED])
+    timer.done()
 
-    return archive.result
+    return result_ref(archive)
+
+
+@celery.task(
+    name="create_archive_batch_task",
+    bind=True,
+    soft_time_limit=SHEET_SOFT_TIME_LIMIT,
+    time_limit=SHEET_HARD_TIME_LIMIT,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+@unit_of_work()
+def create_archive_batch_task(self, archives_json: list[str]):
+    """
+    Archives many URLs of the same group through a single orchestrator feed.
+    Each archive carries its own pre-assigned id which doubles as a per-URL
+    task id: its outcome is written to the result backend as soon as it is
+    known, so /task/{id} works for every URL in the batch. Archives which
+    lead a singleflight request resolve or fail its followers as well.
+    """
+    archives = [
+        schemas.ArchiveCreate.model_validate_json(a) for a in archives_json
+    ]
+    assert archives, "empty archive batch"
+    group_id = archives[0].group_id
+    assert all(a.group_id == group_id for a in archives), (
+        "all archives in a batch must belong to the same group"
+    )
+    for archive in archives:
+        self.backend.mark_as_started(archive.id)
+        refresh_singleflight(archive, archive.id)
+
+    timer = PhaseTimer(self.name, group_id, self.request.delivery_info)
+    group = GROUP_SNAPSHOTS.get(group_id)
+    args = get_orchestrator_args(group, False, [archives[0].url])
+    store_until = get_store_until(group)
+    outcomes = {a.id: {"id": a.id, "url": a.url} for a in archives}
+    orchestrator = None
+    healthy = False
+    try:
+        with timer.phase(task_timing.SETUP):
+            orchestrator = ORCHESTRATOR_POOL.acquire(
+                args, [a.url for a in archives]
+            )
+        with HEARTBEATS.beating(self):
+            fed_at = time.perf_counter()
+            unmatched = list(archives)
+            for result in orchestrator.feed():
+                archive = match_batch_result(result, unmatched)
+                if archive is None:
+                    logger.warning(f"{self.name}: more results than urls")
+                    continue
+                feed_seconds = timer.observe(
+                    task_timing.FEED, time.perf_counter() - fed_at, archive.url
+                )
+                try:
+                    assert result, f"UNABLE TO archive: {archive.url}"
+                    archive.store_until = store_until
+                    with timer.phase(task_timing.GET_ALL_URLS, archive.url):
+                        archive.urls = get_all_urls(result)
+                    with timer.phase(task_timing.SERIALIZE, archive.url):
+                        archive.result = json.loads(result.to_json())
+                    with timer.phase(task_timing.DB_INSERT, archive.url):
+                        insert_result_into_db(archive)
+                    self.backend.mark_as_done(archive.id, result_ref(archive))
+                    resolve_followers(self, archive, result)
+                    TIME_LIMITS.record_url(archive.url, feed_seconds)
+                    outcomes[archive.id]["status"] = constants.STATUS_SUCCESS
+                except Exception as e:
+                    log_error(e, f"{self.name}: {archive.url}")
+                    self.backend.mark_as_failure(archive.id, e)
+                    fail_singleflight_followers(self, archive, archive.id, e)
+                    outcomes[archive.id]["status"] = constants.STATUS_FAILURE
+                    outcomes[archive.id]["error"] = str(e)
+                fed_at = time.perf_counter()
+        healthy = True
+    except SystemExit as e:
+        log_error(e, "create_archive_batch_task: SystemExit from AA")
+    finally:
+        ORCHESTRATOR_POOL.release(orchestrator, healthy)
+        timer.publish()
+        # anything the feed did not reach is reported as failed
+        for archive in archives:
+            outcome = outcomes[archive.id]
+            if "status" not in outcome:
+                error = Exception(f"UNABLE TO archive: {archive.url}")
+                self.backend.mark_as_failure(archive.id, error)
+                fail_singleflight_followers(self, archive, archive.id, error)
+                outcome["status"] = constants.STATUS_FAILURE
+                outcome["error"] = str(error)
+
+    timer.done()
+    logger.info(
+        f"BATCH DONE {len(archives)} urls for {group_id=}: "
+        f"{sum(o['status'] == constants.STATUS_SUCCESS for o in outcomes.values())} archived"
+    )
+    return {"results": list(outcomes.values())}
+
+
+def match_batch_result(
+    result, unmatched: list[schemas.ArchiveCreate]
+) -> schemas.ArchiveCreate | None:
+    """
+    Pops the archive of `unmatched` a feed() result belongs to: the first one
+    with its url, or else the next one, as feed() yields the results in order
+    but failed items may come without a url. Archives the feed skipped stay
+    in `unmatched`, None once all are matched.
+    """
+    url = result.get_url() if result else None
+    for i, archive in enumerate(unmatched):
+        if url and archive.url == url:
+            return unmatched.pop(i)
+    return unmatched.pop(0) if unmatched else None
 
 
 @celery.task(
@@ -91,18 +346,42 @@ def create_archive_task(self, archive_json: str):
     acks_late=True,
     reject_on_worker_lost=True,
 )
+@unit_of_work()
 def create_sheet_task(self, sheet_json: str):
-    global AA_LOGGER_ID
     sheet = schemas.SubmitSheet.model_validate_json(sheet_json)
-    queue_name = (create_sheet_task.request.delivery_info or {}).get(
-        "routing_key", "unknown"
+    claimed, active_task_id = SHEET_LEASES.claim(
+        sheet.sheet_id, self.request.id, settings.SHEET_LEASE_SECONDS
     )
-    logger.info(f"[queue={queue_name}] SHEET START {sheet=}")
+    if not claimed:
+        logger.info(
+            f"SHEET SKIPPED {sheet.sheet_id}: {active_task_id} is active"
+        )
+        publish_metric("sheet_runs_coalesced", source="worker")
+        return sheet_task_result(
+            SheetProgress(Redis, self.request.id, sheet.sheet_id),
+            False,
+            sheet.sheet_id,
+            {"archived": 0, "failed": 0, "errors": []},
+            active_task_id=active_task_id,
+        )
 
-    # Early check: does the service account have write access to the sheet?
-    with get_db() as session:
-        group = worker_crud.get_group(session, sheet.group_id)
-        if group and group.orchestrator_sheet:
+    with SHEET_LEASES.holding(
+        sheet.sheet_id,
+        self.request.id,
+        settings.SHEET_LEASE_SECONDS,
+        settings.TASK_HEARTBEAT_INTERVAL_SECONDS,
+    ) as lease:
+        delivery_info = create_sheet_task.request.delivery_info or {}
+        queue_name = delivery_info.get("routing_key", "unknown")
+        logger.info(f"[queue={queue_name}] SHEET START {sheet=}")
+        progress = SheetProgress(Redis, self.request.id, sheet.sheet_id)
+        progress.start()
+        timer = PhaseTimer(self.name, sheet.group_id, delivery_info)
+
+        group = GROUP_SNAPSHOTS.get(sheet.group_id)
+
+        # Early check: does the service account have write access to the sheet?
+        if group.orchestrator_sheet:
             access_error = get_sheet_access_error(
                 group.orchestrator_sheet,
                 group.service_account_email,
@@ -112,86 +391,464 @@ def create_sheet_task(self, sheet_json: str):
                 logger.warning(
                     f"SHEET SKIPPED {sheet.sheet_id}: {access_error}"
                 )
-                return schemas.CelerySheetTask(
-                    success=False,
-                    sheet_id=sheet.sheet_id,
-                    time=datetime.datetime.now().isoformat(),
-                    stats={
-                        "archived": 0,
-                        "failed": 0,
-                        "errors": [access_error],
-                    },
-                ).model_dump()
+                return sheet_task_result(
+                    progress,
+                    False,
+                    sheet.sheet_id,
+                    {"archived": 0, "failed": 0, "errors": [access_error]},
+                )
+
+        try:
+            orchestrator = setup_sheet_orchestrator(sheet, group, timer)
+        except SystemExit as e:
+            return sheet_task_result(
+                progress,
+                False,
+                sheet.sheet_id,
+                {"archived": 0, "failed": 0, "errors": [str(e)]},
+            )
 
+        checkpoint = resume_sheet_checkpoint(
+            sheet, self.request.id, orchestrator, progress
+        )
+
+        max_fan_out = group.permissions.get("max_sheet_fan_out", 1)
+        if max_fan_out > 1:
+            try:
+                shards = sheet_shards.plan_shards(
+                    orchestrator,
+                    max_fan_out,
+                    settings.SHEET_SHARD_MIN_ROWS,
+                    checkpoint.rows,
+                    checkpoint.finished_worksheets,
+                )
+            except BaseException:
+                cleanup_orchestrator(orchestrator)
+                raise
+            if len(shards) > 1:
+                cleanup_orchestrator(orchestrator)
+                # the shards continue this run, their merge releases the lease
+                lease.keep(
+                    settings.SHEET_LEASE_QUEUED_SECONDS + SHEET_HARD_TIME_LIMIT
+                )
+                return dispatch_sheet_shards(
+                    sheet_json, shards, delivery_info, progress
+                )
+
+        with timeout_recorded(
+            TIME_LIMITS.record_sheet_timeout, sheet.sheet_id, self, timer
+        ):
+            stats = archive_sheet_rows(
+                self, sheet, group, orchestrator, progress, timer, checkpoint
+            )
+
+        if stats["archived"] > 0:
+            with task_db() as session:
+                worker_crud.update_sheet_last_url_archived_at(
+                    session, sheet.sheet_id
+                )
+        if stats.get("deferred"):
+            # the requeued run resumes from the checkpoint, under the same lease
+            lease.keep(settings.SHEET_LEASE_QUEUED_SECONDS + stats["retry_in"])
+            requeue_throttled(self, stats["retry_in"])
+        TIME_LIMITS.record_sheet(sheet.sheet_id, timer.elapsed)
+        stats = checkpoint.finish(stats)
+
+        logger.info(f"SHEET DONE {sheet=}")
+        # TODO: is this used anywhere? maybe drop it
+        return sheet_task_result(
+            progress, True, sheet.sheet_id, stats, checkpoint
+        )
+
+
+@celery.task(
+    name="create_sheet_shard_task",
+    bind=True,
+    soft_time_limit=SHEET_SOFT_TIME_LIMIT,
+    time_limit=SHEET_HARD_TIME_LIMIT,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+@unit_of_work()
+def create_sheet_shard_task(
+    self, sheet_json: str, row_ranges: list, progress_id: str | None = None
+) -> dict:
+    """
+    Archives the pending rows of a sheet within `row_ranges` with its own
+    orchestrator, returns the stats for merge_sheet_shards_task. Never raises
+    so that one failed shard does not prevent the merge of the others.
+    Progress goes to the stream of the sheet task `progress_id`.
+    """
+    sheet = schemas.SubmitSheet.model_validate_json(sheet_json)
+    logger.info(f"SHEET SHARD START {sheet.sheet_id} {row_ranges=}")
+    progress = SheetProgress(
+        Redis, progress_id or self.request.id, sheet.sheet_id, self.request.id
+    )
+    timer = PhaseTimer(self.name, sheet.group_id, self.request.delivery_info)
+    try:
+        group = GROUP_SNAPSHOTS.get(sheet.group_id)
+        orchestrator = setup_sheet_orchestrator(sheet, group, timer)
+        try:
+            sheet_shards.restrict_to_rows(orchestrator, row_ranges)
+        except BaseException:
+            cleanup_orchestrator(orchestrator)
+            raise
+        stats = archive_sheet_rows(
+            self, sheet, group, orchestrator, progress, timer
+        )
+    except (Exception, SystemExit) as e:
+        log_error(e, f"{self.name}: {sheet.sheet_id} {row_ranges=}")
+        stats = {"archived": 0, "failed": 0, "errors": [str(e)]}
+    if stats.get("deferred"):
+        # the chord only moves on once this task id stores a result
+        requeue_throttled(self, stats["retry_in"])
+    logger.info(f"SHEET SHARD DONE {sheet.sheet_id} {row_ranges=}")
+    return stats
+
+
+@celery.task(name="merge_sheet_shards_task", bind=True)
+@unit_of_work()
+def merge_sheet_shards_task(
+    self,
+    shard_stats: list[dict],
+    sheet_json: str,
+    progress_id: str | None = None,
+):
+    sheet = schemas.SubmitSheet.model_validate_json(sheet_json)
+    progress = SheetProgress(
+        Redis, progress_id or self.request.id, sheet.sheet_id
+    )
+    stats = sheet_shards.merge_stats(shard_stats)
+
+    if stats["archived"] > 0:
+        with task_db() as session:
+            worker_crud.update_sheet_last_url_archived_at(
+                session, sheet.sheet_id
+            )
+    # the shards went through the rows after the checkpoint of the sheet task
+    checkpoint = SheetCheckpoint.load(
+        sheet.sheet_id,
+        progress_id or self.request.id,
+        settings.SHEET_CHECKPOINT_MAX_AGE_SECONDS,
+    )
+    stats = checkpoint.finish(stats)
+    # taken over from the sheet task when it dispatched the shards
+    SHEET_LEASES.release(sheet.sheet_id, progress_id or self.request.id)
+
+    logger.info(f"SHEET DONE {sheet=} in {len(shard_stats)} shards")
+    return sheet_task_result(progress, True, sheet.sheet_id, stats, checkpoint)
+
+
+def dispatch_sheet_shards(
+    sheet_json: str,
+    shards: list,
+    delivery_info: dict,
+    progress: SheetProgress,
+) -> dict:
+    # shards go to the same queue, with the same priority, as the sheet task
+    # and report their progress into its stream
+    routing = routing_from(delivery_info)
+    progress_id = create_sheet_task.request.id
+    result = chord(
+        create_sheet_shard_task.s(
+            sheet_json, row_ranges, progress_id=progress_id
+        ).set(**routing)
+        for row_ranges in shards
+    )(
+        merge_sheet_shards_task.s(sheet_json, progress_id=progress_id).set(
+            **routing
+        )
+    )
+
+    sheet = schemas.SubmitSheet.model_validate_json(sheet_json)
+    logger.info(f"SHEET SHARDED {sheet.sheet_id} into {len(shards)} shards")
+    progress.publish("sharded", shards=len(shards), merge_task_id=result.id)
+    return schemas.CelerySheetTask(
+        success=True,
+        sheet_id=sheet.sheet_id,
+        time=datetime.datetime.now().isoformat(),
+        stats={
+            "archived": 0,
+            "failed": 0,
+            "errors": [],
+            "shards": len(shards),
+            "merge_task_id": result.id,
+        },
+    ).model_dump()
+
+
+def setup_sheet_orchestrator(
+    sheet: schemas.SubmitSheet, group: GroupSnapshot, timer: PhaseTimer
+) -> ArchivingOrchestrator:
     args = get_orchestrator_args(
-        sheet.group_id, True, [constants.SHEET_ID, sheet.sheet_id]
+        group, True, [constants.SHEET_ID, sheet.sheet_id]
     )
     orchestrator = ArchivingOrchestrator()
-    orchestrator.logger_id = AA_LOGGER_ID  # ensure single logger
     try:
-        orchestrator.setup(args)
+        with timer.phase(task_timing.SETUP):
+            AA_LOGGER.setup(orchestrator, args)
     except SystemExit as e:
         log_error(e, "create_sheet_task: SystemExit from AA during setup")
         cleanup_orchestrator(orchestrator)
-        return schemas.CelerySheetTask(
-            success=False,
-            sheet_id=sheet.sheet_id,
-            time=datetime.datetime.now().isoformat(),
-            stats={"archived": 0, "failed": 0, "errors": [str(e)]},
-        ).model_dump()
+        raise
     except Exception as e:
         log_error(e, "create_sheet_task: error during orchestrator setup")
         cleanup_orchestrator(orchestrator)
         raise
-    AA_LOGGER_ID = orchestrator.logger_id
+    return orchestrator
+
+
+def resume_sheet_checkpoint(
+    sheet: schemas.SubmitSheet,
+    task_id: str,
+    orchestrator: ArchivingOrchestrator,
+    progress: SheetProgress,
+) -> SheetCheckpoint:
+    # the checkpoint of the run, moving the orchestrator past the rows that
+    # an interrupted run of the sheet went through
+    checkpoint = SheetCheckpoint.load(
+        sheet.sheet_id, task_id, settings.SHEET_CHECKPOINT_MAX_AGE_SECONDS
+    )
+    if checkpoint.resumed:
+        logger.info(
+            f"SHEET RESUME {sheet.sheet_id} run={checkpoint.run_id} "
+            f"runs={checkpoint.runs} after rows {checkpoint.rows}"
+        )
+        progress.publish(
+            "resumed",
+            run_id=checkpoint.run_id,
+            runs=checkpoint.runs,
+            rows=checkpoint.rows,
+        )
+        checkpoint.resume(orchestrator)
+    return checkpoint
 
+
+def archive_sheet_rows(
+    task,
+    sheet: schemas.SubmitSheet,
+    group: GroupSnapshot,
+    orchestrator: ArchivingOrchestrator,
+    progress: SheetProgress,
+    timer: PhaseTimer,
+    checkpoint: SheetCheckpoint | None = None,
+) -> dict:
     stats = {"archived": 0, "failed": 0, "errors": []}
+    # the results of the rows waiting in the write buffer
+    buffered = {}
+    write_buffer = ArchiveWriteBuffer(
+        settings.SHEET_WRITE_BUFFER_ROWS,
+        settings.SHEET_WRITE_BUFFER_SECONDS,
+        stored_row_reporter(progress, buffered),
+    )
+
+    def run_stats() -> dict:
+        # rows still in the write buffer are not stored yet
+        return {
+            "archived": write_buffer.stored,
+            "failed": stats["failed"] + len(write_buffer.errors),
+            "errors": stats["errors"] + write_buffer.errors,
+        }
+
+    # one message per fingerprint and interval instead of one per failed row
+    exceptions = ExceptionSummary(
+        task.name, settings.EXCEPTION_SUMMARY_INTERVAL_SECONDS
+    )
+    deferred, suppressed = gate_sheet_feeders(
+        task, sheet, orchestrator, checkpoint, run_stats
+    )
     try:
-        for result in orchestrator.feed():
-            try:
-                assert result, f"ERROR archiving URL for sheet {sheet.sheet_id}"
-                archive = schemas.ArchiveCreate(
-                    author_id=sheet.author_id,
-                    url=result.get_url(),
-                    group_id=sheet.group_id,
-                    tags=sheet.tags,
-                    id=models.generate_uuid(),
-                    result=json.loads(result.to_json()),
-                    sheet_id=sheet.sheet_id,
-                    urls=get_all_urls(result),
-                    store_until=get_store_until(sheet.group_id),
+        with HEARTBEATS.beating(task):
+            fed_at = time.perf_counter()
+            for result in orchestrator.feed():
+                url = result.get_url() if result else None
+                feed_seconds = timer.observe(
+                    task_timing.FEED, time.perf_counter() - fed_at, url
                 )
-                insert_result_into_db(archive)
-                stats["archived"] += 1
-            except exc.IntegrityError as e:
-                logger.warning(f"cached result detected: {e}")
-            except Exception as e:
-                log_error(e, extra=f"{self.name}: {sheet_json}")
-                redis_publish_exception(e, self.name, traceback.format_exc())
-                stats["failed"] += 1
-                stats["errors"].append(str(e))
+                try:
+                    assert result, (
+                        f"ERROR archiving URL for sheet {sheet.sheet_id}"
+                    )
+                    with timer.phase(task_timing.SERIALIZE, url):
+                        result_json = json.loads(result.to_json())
+                    with timer.phase(task_timing.GET_ALL_URLS, url):
+                        urls = get_all_urls(result)
+                    archive = schemas.ArchiveCreate(
+                        author_id=sheet.author_id,
+                        url=url,
+                        group_id=sheet.group_id,
+                        tags=sheet.tags,
+                        id=models.generate_uuid(),
+                        result=result_json,
+                        sheet_id=sheet.sheet_id,
+                        urls=urls,
+                        store_until=get_store_until(group),
+                    )
+                    # timed per row, includes the rows' share of buffer flushes
+                    buffered[id(archive)] = result
+                    with timer.phase(task_timing.DB_INSERT, url):
+                        write_buffer.add(archive)
+                    TIME_LIMITS.record_url(url, feed_seconds)
+                except Exception as e:
+                    log_error(
+                        e, extra=f"{task.name}: {sheet.model_dump_json()}"
+                    )
+                    NEGATIVE_CACHE.record(url, failures.classify(e), str(e))
+                    exceptions.add(e, traceback.format_exc())
+                    stats["failed"] += 1
+                    stats["errors"].append(str(e))
+                    progress.row(url, False)
+                fed_at = time.perf_counter()
 
     except SystemExit as e:
         log_error(e, "create_sheet_task: SystemExit from AA")
     finally:
+        # forced flush, including when the soft time limit interrupts feed()
+        with timer.phase(task_timing.DB_INSERT):
+            write_buffer.flush()
+        if checkpoint:
+            checkpoint.save(run_stats())
         cleanup_orchestrator(orchestrator)
+        exceptions.publish()
+        timer.publish()
+    timer.done()
+    stats["archived"] = write_buffer.stored
+    stats["failed"] += len(write_buffer.errors)
+    stats["errors"].extend(write_buffer.errors)
+    for failure in suppressed:
+        publish_metric(
+            "negative_cache_suppressed",
+            source="sheet",
+            failure_class=failure["failure_class"],
+        )
+    if suppressed:
+        logger.info(f"SHEET {sheet.sheet_id} skipped {len(suppressed)} rows")
+        stats["suppressed"] = len(suppressed)
+    if deferred:
+        logger.info(f"SHEET {sheet.sheet_id} deferred {len(deferred)} rows")
+        stats["deferred"] = len(deferred)
+        stats["retry_in"] = min(deferred)
+    return stats
 
-    if stats["archived"] > 0:
-        with get_db() as session:
-            worker_crud.update_sheet_last_url_archived_at(
-                session, sheet.sheet_id
+
+def gate_sheet_feeders(
+    task,
+    sheet: schemas.SubmitSheet,
+    orchestrator: ArchivingOrchestrator,
+    checkpoint: SheetCheckpoint | None,
+    run_stats,
+) -> tuple[list[float], list[dict]]:
+    """
+    Wraps the orchestrator's feeders so the feed ends at the first row
+    throttled by its domain (deferred), rows that failed recently
+    (suppressed) are skipped, and the checkpoint follows the rows handed to
+    the orchestrator. Deferred and skipped rows keep an empty status, so the
+    requeued or a later run of the sheet picks them up again.
+    """
+    deferred: list[float] = []
+    suppressed: list[dict] = []
+    if DOMAIN_LIMITER.limits:
+        orchestrator.feeders = [
+            DOMAIN_LIMITER.gate(feeder, task.request.id, deferred)
+            for feeder in orchestrator.feeders
+        ]
+    if not sheet.force:
+        orchestrator.feeders = [
+            NEGATIVE_CACHE.gate(feeder, suppressed)
+            for feeder in orchestrator.feeders
+        ]
+    if checkpoint:
+        # outermost, it only sees the rows that were not skipped
+        orchestrator.feeders = [
+            checkpoint.gate(
+                feeder,
+                [deferred, suppressed],
+                run_stats,
+                settings.SHEET_WRITE_BUFFER_ROWS,
+                settings.SHEET_WRITE_BUFFER_SECONDS,
             )
+            for feeder in orchestrator.feeders
+        ]
+    return deferred, suppressed
 
-    logger.info(f"SHEET DONE {sheet=}")
-    # TODO: is this used anywhere? maybe drop it
+
+def sheet_task_result(
+    progress: SheetProgress,
+    success: bool,
+    sheet_id: str,
+    stats: dict,
+    checkpoint: SheetCheckpoint | None = None,
+    active_task_id: str | None = None,
+) -> dict:
+    progress.publish(sheet_progress.DONE, success=success, stats=stats)
     return schemas.CelerySheetTask(
-        success=True,
-        sheet_id=sheet.sheet_id,
+        success=success,
+        sheet_id=sheet_id,
         time=datetime.datetime.now().isoformat(),
         stats=stats,
+        run_id=checkpoint.run_id if checkpoint else None,
+        runs=checkpoint.runs if checkpoint else 1,
+        active_task_id=active_task_id,
     ).model_dump()
 
 
+def routing_from(delivery_info: dict) -> dict:
+    # apply_async options sending a task where `delivery_info` came from
+    return {
+        k: v
+        for k, v in (
+            ("queue", delivery_info.get("routing_key")),
+            ("priority", delivery_info.get("priority")),
+        )
+        if v is not None
+    }
+
+
+def requeue_throttled(task, countdown: float):
+    """
+    Sends the running task back to its queue under the same id to run again
+    in `countdown` seconds, instead of blocking a worker slot while waiting
+    on a domain limit, and ends the current run without storing a result.
+    """
+    routing = routing_from(task.request.delivery_info or {})
+    # keeps the time limits the task was enqueued with
+    time_limit, soft_time_limit = task.request.timelimit or (None, None)
+    # jitter so throttled tasks do not all come back at the same instant
+    countdown += random.uniform(0, min(countdown, 10))
+    logger.info(
+        f"THROTTLED {task.name} {task.request.id}, retry in {countdown=:.0f}s"
+    )
+    task.apply_async(
+        args=task.request.args,
+        kwargs=task.request.kwargs,
+        task_id=task.request.id,
+        countdown=countdown,
+        time_limit=time_limit,
+        soft_time_limit=soft_time_limit,
+        **routing,
+    )
+    raise Ignore()
+
+
+def soft_time_limit(task) -> float | None:
+    # the soft limit of the running task: the one it was sent with, eg: a
+    # learned one, or else the task's own
+    return (task.request.timelimit or (None, None))[1] or task.soft_time_limit
+
+
+@contextmanager
+def timeout_recorded(record, subject: str, task, timer: PhaseTimer):
+    """
+    Records a run stopped by its soft time limit with `record`, one of the
+    TIME_LIMITS.record_*_timeout, so the learned limit of `subject` can rise.
+    """
+    try:
+        yield
+    except SoftTimeLimitExceeded:
+        record(subject, timer.elapsed, soft_time_limit(task))
+        raise
+
+
 def cleanup_orchestrator(orchestrator):
     """
     Clean up orchestrator resources to prevent leaks between tasks.
@@ -206,27 +863,23 @@ def cleanup_orchestrator(orchestrator):
 
 
 def get_orchestrator_args(
-    group_id: str, orchestrator_for_sheet: bool, cli_args: list = None
+    group: GroupSnapshot, orchestrator_for_sheet: bool, cli_args: list = None
 ) -> list:
     cli_args.append("--logging.enabled=false")
 
     aa_configs = []
-    with get_db() as session:
-        group = worker_crud.get_group(session, group_id)
-        if orchestrator_for_sheet:
-            orchestrator_fn = group.orchestrator_sheet
-        else:
-            orchestrator_fn = worker_crud.get_group(
-                session, group_id
-            ).orchestrator
-        assert orchestrator_fn, f"no orchestrator found for {group_id}"
+    if orchestrator_for_sheet:
+        orchestrator_fn = group.orchestrator_sheet
+    else:
+        orchestrator_fn = group.orchestrator
+    assert orchestrator_fn, f"no orchestrator found for {group.id}"
     aa_configs.extend(["--config", orchestrator_fn])
     aa_configs.extend(cli_args)
     return aa_configs
 
 
 def insert_result_into_db(archive: schemas.ArchiveCreate) -> str:
-    with get_db() as session:
+    with task_db() as session:
         db_archive = worker_crud.store_archived_url(session, archive)
         logger.debug(
             f"[ARCHIVE STORED] {db_archive.author_id} {db_archive.url}"
@@ -234,30 +887,175 @@ def insert_result_into_db(archive: schemas.ArchiveCreate) -> str:
         return db_archive.id
 
 
-def get_store_until(group_id: str) -> datetime.datetime:
-    with get_db() as session:
-        return business_logic.get_store_archive_until(session, group_id)
+def result_ref(archive: schemas.ArchiveCreate) -> dict:
+    # the full result is in the database, keeps the result backend small
+    return schemas.ArchiveResultRef(
+        archive_id=archive.id,
+        status=constants.STATUS_SUCCESS,
+        url=archive.url,
+    ).model_dump()
+
+
+def stored_row_reporter(progress: SheetProgress, buffered: dict):
+    """
+    The write buffer callback reporting an archived sheet row once it was
+    flushed, only then it is in the database. `buffered` maps the id() of
+    the archives in the buffer to their results.
+    """
+
+    def row_flushed(archive: schemas.ArchiveCreate, stored: bool) -> None:
+        result = buffered.pop(id(archive))
+        if stored:
+            remember_outcome(archive.url, result)
+        progress.row(archive.url, stored)
+
+    return row_flushed
+
+
+def remember_outcome(url: str, result) -> None:
+    # an archive that got nothing is cached as a failure, see negative_cache.py
+    if result.is_success():
+        NEGATIVE_CACHE.forget(url)
+    else:
+        NEGATIVE_CACHE.record(url, failures.NOTHING_ARCHIVED, result.status)
+
+
+def refresh_singleflight(archive: schemas.ArchiveCreate, task_id: str) -> None:
+    # the lock held while the task was queued now only needs to outlive it
+    try:
+        singleflight.refresh(
+            Redis,
+            archive.group_id,
+            archive.url,
+            task_id,
+            settings.ARCHIVE_SINGLEFLIGHT_LOCK_SECONDS,
+        )
+    except Exception as e:
+        logger.warning(f"could not refresh singleflight lock of {task_id}: {e}")
+
+
+def resolve_followers(task, archive: schemas.ArchiveCreate, result) -> None:
+    """
+    Gives every request that was coalesced into this archive task its own
+    archive entry copied from the leader one, and marks the follower task id
+    as done with the same result, see app/shared/singleflight.py
+    """
+    try:
+        followers = singleflight.finish(
+            Redis, archive.group_id, archive.url, archive.id
+        )
+    except Exception as e:
+        log_error(e, f"could not release singleflight lock of {archive.id}")
+        return
+
+    for follower_json in followers:
+        follower = schemas.ArchiveCreate.model_validate_json(follower_json)
+        try:
+            follower.store_until = archive.store_until
+            follower.urls = get_all_urls(result)
+            follower.result = archive.result
+            follower.source_archive_id = archive.id
+            insert_result_into_db(follower)
+            task.backend.mark_as_done(follower.id, result_ref(follower))
+        except Exception as e:
+            log_error(e, f"could not resolve follower {follower.id}")
+            task.backend.mark_as_failure(follower.id, e)
+
+
+def get_store_until(group: GroupSnapshot) -> datetime.datetime:
+    return group.store_until()
 
 
 def redis_publish_exception(exception, task_name, trace_back: str = ""):
-    REDIS_EXCEPTIONS_CHANNEL = settings.REDIS_EXCEPTIONS_CHANNEL
+    exceptions = ExceptionSummary(task_name)
+    exceptions.add(exception, trace_back)
+    exceptions.publish()
+
+
+@worker_init.connect
+def size_db_pool(sender=None, **kwargs):
+    # threads and gevent pools run every slot in this process, prefork
+    # children size their own in reset_connections_after_fork
+    slots = 1
+    if settings.WORKER_POOL in ("threads", "gevent"):
+        slots = getattr(sender, "concurrency", None) or 1
+    configure_engine(
+        settings.WORKER_DB_POOL_SIZE * slots, settings.WORKER_DB_MAX_OVERFLOW
+    )
+
+
+@worker_process_init.connect
+def reset_connections_after_fork(**kwargs):
+    # a prefork child runs one task at a time and must not reuse the SQLite
+    # and Redis connections it inherited from the parent
+    configure_engine(
+        settings.WORKER_DB_POOL_SIZE, settings.WORKER_DB_MAX_OVERFLOW
+    )
+    reset_redis_clients()
+
+
+@task_postrun.connect
+def memory_watchdog(**kwargs):
+    check_child_rss(
+        celery.conf.worker_max_memory_per_child, settings.WORKER_POOL
+    )
+
+
+# threads and gevent pools have no child processes to shut down
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def cleanup_orchestrator_pool(**kwargs):
+    ORCHESTRATOR_POOL.clear()
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def flush_write_buffers(**kwargs):
+    flush_active_buffers()
+
+
+@task_failure.connect(sender=create_archive_task)
+def fail_followers(sender, task_id, exception, args, **kwargs):
+    # the leader gave up, so do the requests coalesced into it
     try:
-        exception_data = {
-            "task": task_name,
-            "type": exception.__class__.__name__,
-            "exception": exception,
-            "traceback": trace_back,
-        }
-        Redis.publish(
-            REDIS_EXCEPTIONS_CHANNEL, json.dumps(exception_data, default=str)
+        archive = schemas.ArchiveCreate.model_validate_json(args[0])
+    except Exception as e:
+        log_error(e, f"could not fail singleflight followers of {task_id}")
+        return
+    fail_singleflight_followers(sender, archive, task_id, exception)
+
+
+def fail_singleflight_followers(
+    task, archive: schemas.ArchiveCreate, leader_id: str, exception
+) -> None:
+    # releases the singleflight lock of a failed archive and fails the
+    # requests that joined it
+    try:
+        followers = singleflight.finish(
+            Redis, archive.group_id, archive.url, leader_id
         )
+        for follower_json in followers:
+            follower_id = json.loads(follower_json)["id"]
+            task.backend.mark_as_failure(follower_id, exception)
     except Exception as e:
-        log_error(
-            e, f"[CRITICAL] Could not publish to {REDIS_EXCEPTIONS_CHANNEL}"
+        log_error(e, f"could not fail singleflight followers of {leader_id}")
+
+
+@task_failure.connect(sender=create_archive_task)
+def remember_failed_url(sender, exception, args, **kwargs):
+    # only called once the task is not retried anymore
+    try:
+        archive = schemas.ArchiveCreate.model_validate_json(args[0])
+        NEGATIVE_CACHE.record(
+            archive.url, failures.classify(exception), str(exception)
         )
+    except Exception as e:
+        log_error(e, "could not remember failed URL")
 
 
 @task_failure.connect(sender=create_sheet_task)
+@task_failure.connect(sender=merge_sheet_shards_task)
+@task_failure.connect(sender=create_archive_batch_task)
 @task_failure.connect(sender=create_archive_task)
 def task_failure_notifier(sender, **kwargs):
     # automatically capture exceptions in the worker tasks
@@ -0,0 +1,71 @@
+"""
+Recycles worker child processes by memory use instead of after a fixed number
+of tasks: a child is only replaced once its RSS goes over WORKER_MAX_RSS_MB.
+
+The replacement itself is billiard's worker_max_memory_per_child, which exits
+the child right after it has handed its last result to the parent. Exiting
+from within the task, eg: in task_postrun, would happen before that and make
+the parent treat the task as lost and redeliver it. The watchdog reports the
+same measure billiard decides on, the peak RSS of the child (ru_maxrss), after
+every task, so the recycles can be seen and tuned.
+"""
+
+import socket
+
+from billiard.compat import mem_rss
+from billiard.process import current_process
+
+from app.shared.log import logger
+from app.worker.worker_metrics import publish_metric
+
+
+# whether a pool without children to recycle warned about going over the limit
+_unenforced_warned = False
+
+
+def child_max_rss_kb() -> int | None:
+    # peak resident set size of this process in KB, as billiard measures it
+    try:
+        used_kb = mem_rss()
+    except (ImportError, OSError):
+        return None
+    return used_kb if used_kb > 0 else None
+
+
+def child_label() -> str:
+    # stable across recycles: the pool reuses the index of a replaced child
+    index = getattr(current_process(), "index", None)
+    return f"{socket.gethostname()}:{index if index is not None else 'main'}"
+
+
+def check_child_rss(max_memory_per_child: int | None, pool: str) -> bool:
+    """
+    Reports this child's peak RSS and whether it is over
+    `max_memory_per_child` KB, the worker_max_memory_per_child billiard
+    retires the child with once the current task is handed over. Only the
+    prefork pool has children to retire, other pools only report the RSS.
+    """
+    global _unenforced_warned
+    used_kb = child_max_rss_kb()
+    if used_kb is None:
+        return False
+    child = child_label()
+    publish_metric("worker_child_rss_bytes", used_kb * 1024, child=child)
+    if not max_memory_per_child or used_kb <= max_memory_per_child:
+        return False
+    if pool != "prefork":
+        # the peak never goes down, warning once is enough
+        if not _unenforced_warned:
+            _unenforced_warned = True
+            logger.warning(
+                f"worker {child} peaked at {used_kb / 1024:.0f}MB RSS, over "
+                f"{max_memory_per_child / 1024:.0f}MB, which the {pool} pool "
+                "does not enforce"
+            )
+        return False
+    logger.warning(
+        f"worker child {child} peaked at {used_kb / 1024:.0f}MB RSS, over "
+        f"{max_memory_per_child / 1024:.0f}MB, recycling it after this task"
+    )
+    publish_metric("worker_child_recycles")
+    return True
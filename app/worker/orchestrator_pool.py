@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from auto_archiver.core.orchestrator import ArchivingOrchestrator
+from auto_archiver.modules.cli_feeder.cli_feeder import CLIFeeder
+
+from app.shared.log import logger
+from app.worker.worker_metrics import publish_metric
+
+
+class PooledOrchestrator(NamedTuple):
+    orchestrator: ArchivingOrchestrator
+    # the real ArchivingOrchestrator.cleanup, see OrchestratorPool._setup
+    cleanup: Callable[[], None]
+
+
+class SharedLogger:
+    """
+    ArchivingOrchestrator.setup adds a loguru handler unless the orchestrator
+    already carries the id of one. Every orchestrator of a worker process
+    reuses the handler of the first one set up, also when tasks set them up
+    concurrently in a threads or gevent pool.
+    """
+
+    def __init__(self):
+        self.logger_id = None
+        self._lock = threading.Lock()
+
+    def setup(self, orchestrator: ArchivingOrchestrator, args: list) -> None:
+        if self.logger_id is None:
+            with self._lock:
+                if self.logger_id is None:
+                    orchestrator.logger_id = None
+                    orchestrator.setup(args)
+                    self.logger_id = orchestrator.logger_id
+                    return
+        orchestrator.logger_id = self.logger_id
+        orchestrator.setup(args)
+
+
+class OrchestratorPool:
+    """
+    Per worker process LRU pool of orchestrators that already went through
+    ArchivingOrchestrator.setup, so URL archiving tasks only pay for setup once
+    per orchestrator config file instead of once per URL.
+
+    Entries are keyed by the config path and its mtime, so editing the file
+    naturally misses the old entry which is then evicted. An orchestrator is
+    taken out of the pool while a task uses it and only goes back in if the
+    task finished cleanly. Safe to share between the tasks of a threads or
+    gevent pool, concurrent tasks with the same config each get their own.
+    """
+
+    def __init__(self, max_size: int, shared_logger: SharedLogger = None):
+        self.max_size = max(1, max_size)
+        self.shared_logger = shared_logger or SharedLogger()
+        self._lock = threading.Lock()
+        self._pool: OrderedDict[tuple, PooledOrchestrator] = OrderedDict()
+        self._in_use: dict[int, tuple[tuple, PooledOrchestrator]] = {}
+
+    def __len__(self):
+        return len(self._pool)
+
+    def acquire(self, args: list, urls: list[str]) -> ArchivingOrchestrator:
+        """
+        Returns an orchestrator whose feed() yields one result per url in
+        `urls`, in order. `args` are the full CLI args as built by
+        get_orchestrator_args and are only used when a new orchestrator needs
+        to be set up.
+        """
+        key = self._key(args)
+        with self._lock:
+            entry = self._pool.pop(key, None)
+        if entry and not self._is_healthy(entry.orchestrator):
+            logger.warning(f"[ORCHESTRATOR POOL] unhealthy entry for {key}")
+            self._discard(entry, "unhealthy")
+            entry = None
+
+        if entry:
+            publish_metric("orchestrator_pool_events", event="hit")
+        else:
+            publish_metric("orchestrator_pool_events", event="miss")
+            entry = self._setup(args)
+
+        self._reset(entry.orchestrator, urls)
+        with self._lock:
+            self._in_use[id(entry.orchestrator)] = (key, entry)
+        return entry.orchestrator
+
+    def release(
+        self, orchestrator: ArchivingOrchestrator | None, healthy: bool
+    ) -> None:
+        """
+        Returns an orchestrator to the pool after a task, orchestrators that
+        raised or exited mid-task are discarded as their state is unknown.
+        """
+        if orchestrator is None:
+            return
+        with self._lock:
+            key, entry = self._in_use.pop(id(orchestrator), (None, None))
+        if entry is None:
+            return
+        if not healthy:
+            self._discard(entry, "discarded")
+            return
+
+        evicted = []
+        with self._lock:
+            # a concurrent task with the same config released its own first
+            if previous := self._pool.pop(key, None):
+                evicted.append(previous)
+            self._pool[key] = entry
+            while len(self._pool) > self.max_size:
+                evicted.append(self._pool.popitem(last=False)[1])
+        for stale in evicted:
+            self._discard(stale, "evicted")
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = list(self._pool.values())
+            self._pool.clear()
+        for entry in entries:
+            self._discard(entry, "evicted")
+
+    def _setup(self, args: list) -> PooledOrchestrator:
+        orchestrator = ArchivingOrchestrator()
+        start = time.perf_counter()
+        try:
+            self.shared_logger.setup(orchestrator, args)
+        except BaseException:
+            if hasattr(orchestrator, "extractors"):
+                orchestrator.cleanup()
+            raise
+        publish_metric(
+            "orchestrator_setup_seconds", time.perf_counter() - start
+        )
+
+        entry = PooledOrchestrator(orchestrator, orchestrator.cleanup)
+        # feed() calls cleanup() once the feeders are exhausted, that tears
+        # down extractor state (eg: telethon session files) the next task
+        # still needs, so it is deferred until the orchestrator leaves the pool
+        orchestrator.cleanup = lambda: None
+        return entry
+
+    @staticmethod
+    def _reset(orchestrator: ArchivingOrchestrator, urls: list[str]) -> None:
+        # the cli_feeder reads its urls on every iteration, other feeders
+        # have their own config
+        for feeder in orchestrator.feeders:
+            if isinstance(feeder, CLIFeeder):
+                feeder.config["urls"] = list(urls)
+
+    @staticmethod
+    def _is_healthy(orchestrator: ArchivingOrchestrator) -> bool:
+        return bool(
+            getattr(orchestrator, "setup_finished", False)
+            and getattr(orchestrator, "feeders", None)
+            and getattr(orchestrator, "extractors", None)
+        )
+
+    @staticmethod
+    def _discard(entry: PooledOrchestrator, event: str) -> None:
+        publish_metric("orchestrator_pool_events", event=event)
+        try:
+            if hasattr(entry.orchestrator, "extractors"):
+                entry.cleanup()
+        except Exception as e:
+            logger.warning(f"Error cleaning up orchestrator: {e}")
+
+    @staticmethod
+    def _key(args: list) -> tuple:
+        config_path = None
+        if "--config" in args:
+            config_path = args[args.index("--config") + 1]
+        try:
+            mtime = os.path.getmtime(config_path)
+        except (OSError, TypeError):
+            mtime = None
+        return config_path, mtime
@@ -0,0 +1,174 @@
+"""
+Lets a sheet run that stopped before the end of the sheet (soft time limit, a
+dead worker, a domain limit requeue) resume where it stopped instead of
+reading every row of the sheet again.
+
+While the feed advances, the last row processed in each worksheet and the
+stats so far are saved in the sheet's checkpoint, as often as the write
+buffer flushes and once more when the run stops. The next run of the sheet
+within SHEET_CHECKPOINT_MAX_AGE_SECONDS starts after those rows. It continues
+the same logical run: its id and stats carry over until a run reaches the
+end of the sheet and removes the checkpoint. Database errors are logged and
+never fail the sheet task.
+"""
+
+import datetime
+import time
+from typing import Callable, Iterable, Iterator
+
+from auto_archiver.core.orchestrator import ArchivingOrchestrator
+
+from app.shared.db import models, worker_crud
+from app.shared.db.database import task_db
+from app.shared.log import logger
+from app.worker import sheet_shards
+
+
+class SheetCheckpoint:
+    def __init__(
+        self,
+        sheet_id: str,
+        run_id: str,
+        runs: int = 1,
+        rows: dict[str, int] = None,
+        finished_worksheets: list[str] = None,
+        previous_stats: dict = None,
+    ):
+        self.sheet_id = sheet_id
+        self.run_id = run_id
+        self.runs = runs
+        self.rows = dict(rows or {})
+        self.finished_worksheets = list(finished_worksheets or [])
+        self.previous_stats = previous_stats or {}
+        self._worksheet = None
+
+    @classmethod
+    def load(
+        cls, sheet_id: str, task_id: str, max_age_seconds: int
+    ) -> "SheetCheckpoint":
+        """
+        The checkpoint of an interrupted run of the sheet to resume, or a new
+        one for a run with id `task_id`. Older checkpoints are dropped.
+        """
+        try:
+            with task_db() as session:
+                saved = worker_crud.get_sheet_checkpoint(session, sheet_id)
+                if saved and _age_seconds(saved) > max_age_seconds:
+                    logger.info(f"SHEET {sheet_id} dropped stale checkpoint")
+                    worker_crud.delete_sheet_checkpoint(session, sheet_id)
+                    saved = None
+                if not saved:
+                    return cls(sheet_id, task_id)
+                return cls(
+                    sheet_id,
+                    saved.run_id,
+                    (saved.runs or 1) + 1,
+                    saved.rows,
+                    saved.finished_worksheets,
+                    saved.stats,
+                )
+        except Exception as e:
+            logger.warning(f"Could not load checkpoint of {sheet_id}: {e}")
+            return cls(sheet_id, task_id)
+
+    @property
+    def resumed(self) -> bool:
+        return self.runs > 1
+
+    def resume(self, orchestrator: ArchivingOrchestrator) -> None:
+        # makes the orchestrator skip the rows earlier runs went through
+        if self.rows or self.finished_worksheets:
+            sheet_shards.resume_after(
+                orchestrator, self.rows, self.finished_worksheets
+            )
+
+    def gate(
+        self,
+        items: Iterable,
+        skipped: list[list],
+        run_stats: Callable[[], dict],
+        every_rows: int = 50,
+        every_seconds: float = 30,
+    ) -> Iterator:
+        """
+        Yields the feeder items (Metadata) handed to the orchestrator,
+        advancing past each one once the next is asked for. The checkpoint is
+        saved every `every_rows` rows or `every_seconds` seconds, callers must
+        save() once done. Stops advancing once a row was skipped (the lists
+        in `skipped`: deferred or suppressed rows), so a resume never skips
+        it.
+        """
+        unsaved, saved_at = 0, time.monotonic()
+        for item in items:
+            yield item
+            if any(skipped):
+                continue
+            self._advance(item)
+            unsaved += 1
+            if (
+                unsaved >= every_rows
+                or time.monotonic() - saved_at >= every_seconds
+            ):
+                self.save(run_stats())
+                unsaved, saved_at = 0, time.monotonic()
+
+    def save(self, stats: dict) -> None:
+        # persists the position and the stats of the logical run so far
+        checkpoint = models.SheetCheckpoint(
+            sheet_id=self.sheet_id,
+            run_id=self.run_id,
+            runs=self.runs,
+            rows=dict(self.rows),
+            finished_worksheets=list(self.finished_worksheets),
+            stats=self.merged(stats),
+        )
+        try:
+            with task_db() as session:
+                worker_crud.save_sheet_checkpoint(session, checkpoint)
+        except Exception as e:
+            logger.warning(f"Could not save checkpoint of {self.sheet_id}: {e}")
+
+    def finish(self, stats: dict) -> dict:
+        """
+        Removes the checkpoint once the run reached the end of the sheet,
+        returns the stats of the whole logical run.
+        """
+        try:
+            with task_db() as session:
+                worker_crud.delete_sheet_checkpoint(session, self.sheet_id)
+        except Exception as e:
+            logger.warning(
+                f"Could not remove checkpoint of {self.sheet_id}: {e}"
+            )
+        return self.merged(stats)
+
+    def merged(self, stats: dict) -> dict:
+        # the stats of this run added to those of the runs it resumes
+        if not self.previous_stats:
+            return stats
+        merged = sheet_shards.merge_stats([self.previous_stats, stats])
+        for key in ("deferred", "retry_in"):
+            if key in stats:
+                merged[key] = stats[key]
+        return merged
+
+    def _advance(self, item) -> None:
+        context = item.get_context("gsheet") or {}
+        if "worksheet" not in context:
+            return
+        worksheet = context["worksheet"].wks.title
+        if self._worksheet and worksheet != self._worksheet:
+            self.finished_worksheets.append(self._worksheet)
+        self._worksheet = worksheet
+        self.rows[worksheet] = context["row"]
+
+
+def _age_seconds(checkpoint: models.SheetCheckpoint) -> float:
+    updated = checkpoint.updated_at or checkpoint.created_at
+    if updated is None:
+        return 0
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=datetime.timezone.utc)
+    return (
+        datetime.datetime.now(datetime.timezone.utc) - updated
+    ).total_seconds()
@@ -0,0 +1,189 @@
+import math
+
+from auto_archiver.core import Metadata
+from auto_archiver.core.orchestrator import ArchivingOrchestrator
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+
+# a shard is a list of (worksheet title, first row, last row) row ranges
+RowRanges = list[tuple[str, int, int]]
+
+
+def _sheet_feeders(orchestrator: ArchivingOrchestrator) -> list:
+    return [f for f in orchestrator.feeders if hasattr(f, "_process_rows")]
+
+
+def plan_shards(
+    orchestrator: ArchivingOrchestrator,
+    max_shards: int,
+    min_rows: int,
+    rows: dict[str, int] | None = None,
+    finished_worksheets: list[str] | None = None,
+) -> list[RowRanges]:
+    """
+    Finds the pending rows of the sheet of the set-up orchestrator's gsheet
+    feeder and splits them into at most `max_shards` contiguous shards of at
+    least `min_rows` rows each. Returns a single shard if the sheet is too
+    small to be worth splitting. Like resume_after, leaves out
+    `finished_worksheets` and the rows up to the last one processed in `rows`.
+    """
+    pending = []
+    for feeder in _sheet_feeders(orchestrator):
+        pending.extend(
+            _pending_rows(feeder, rows or {}, finished_worksheets or [])
+        )
+
+    n_shards = max(1, min(max_shards, len(pending) // max(1, min_rows)))
+    shard_size = math.ceil(len(pending) / n_shards) if pending else 0
+    shards = []
+    for start in range(0, len(pending), shard_size or 1):
+        ranges: dict[str, tuple[int, int]] = {}
+        for title, row in pending[start : start + shard_size]:
+            first, _ = ranges.get(title, (row, row))
+            ranges[title] = (first, row)
+        shards.append([(t, first, last) for t, (first, last) in ranges.items()])
+    return shards
+
+
+def _pending_rows(
+    feeder, rows: dict[str, int], finished_worksheets: list[str]
+) -> list[tuple[str, int]]:
+    """
+    The (worksheet title, row) of every row with a URL and no status, the
+    rows the feeder would go through. Instead of iterating the feeder, which
+    reads the status of each row again, it reads the header rows and then the
+    url and status columns of all the worksheets in one batch request each.
+    """
+    spreadsheet = feeder.open_sheet()
+    titles = [
+        w.title
+        for w in feeder.enumerate_sheets(spreadsheet)
+        if w.title not in finished_worksheets
+        and feeder.should_process_sheet(w.title)
+    ]
+    header = f"{feeder.header}:{feeder.header}"
+    headers = _batch_get(
+        spreadsheet, [absolute_range_name(t, header) for t in titles], "ROWS"
+    )
+
+    columns = {}
+    for title, names in zip(titles, headers, strict=True):
+        names = [n.lower() for n in (names[0] if names else [])]
+        try:
+            columns[title] = [
+                names.index(feeder.columns[c].lower()) + 1
+                for c in ("url", "status")
+            ]
+        except ValueError:
+            # missing a required column, the feeder skips it too
+            continue
+
+    values = _batch_get(
+        spreadsheet,
+        [
+            absolute_range_name(title, _column_range(column))
+            for title, url_and_status in columns.items()
+            for column in url_and_status
+        ],
+        "COLUMNS",
+    )
+    pending = []
+    for i, title in enumerate(columns):
+        urls, statuses = (v[0] if v else [] for v in values[2 * i : 2 * i + 2])
+        first = max(1 + feeder.header, rows.get(title, 0) + 1)
+        for row in range(first, len(urls) + 1):
+            status = statuses[row - 1] if row <= len(statuses) else ""
+            if urls[row - 1].strip() and status in ["", None]:
+                pending.append((title, row))
+    return pending
+
+
+def _column_range(column: int) -> str:
+    # A1 notation of a whole column, eg: 3 is C:C
+    letter = rowcol_to_a1(1, column)[:-1]
+    return f"{letter}:{letter}"
+
+
+def _batch_get(spreadsheet, ranges: list[str], major_dimension: str) -> list:
+    # the values of every range, in a single request
+    if not ranges:
+        return []
+    response = spreadsheet.values_batch_get(
+        ranges, params={"majorDimension": major_dimension}
+    )
+    return [r.get("values", []) for r in response.get("valueRanges", [])]
+
+
+def restrict_to_rows(
+    orchestrator: ArchivingOrchestrator, row_ranges: RowRanges
+) -> None:
+    """
+    Makes the orchestrator's gsheet feeder only go through `row_ranges`, so a
+    shard does not read (and refresh the status of) rows of other shards.
+    """
+    spans: dict[str, list[tuple[int, int]]] = {}
+    for title, first, last in row_ranges:
+        spans.setdefault(title, []).append((first, last))
+
+    for feeder in _sheet_feeders(orchestrator):
+        feeder._process_rows = _rows_in_spans(feeder, spans)
+
+
+def resume_after(
+    orchestrator: ArchivingOrchestrator,
+    rows: dict[str, int],
+    finished_worksheets: list[str],
+) -> None:
+    """
+    Makes the orchestrator's gsheet feeder skip `finished_worksheets` and,
+    in the others, the rows up to the last one processed in `rows`, so a
+    resumed run does not read them again.
+    """
+    for feeder in _sheet_feeders(orchestrator):
+        feeder._process_rows = _rows_after(feeder, rows, finished_worksheets)
+
+
+def _rows_after(feeder, rows: dict[str, int], finished_worksheets: list[str]):
+    def _process_rows(gw):
+        title = gw.wks.title
+        if title in finished_worksheets:
+            return
+        first = max(1 + feeder.header, rows.get(title, 0) + 1)
+        spans = {title: [(first, gw.count_rows())]}
+        yield from _rows_in_spans(feeder, spans)(gw)
+
+    return _process_rows
+
+
+def _rows_in_spans(feeder, spans: dict[str, list[tuple[int, int]]]):
+    # same row checks as GsheetsFeederDB._process_rows, over a subset of rows
+    def _process_rows(gw):
+        for first, last in spans.get(gw.wks.title, []):
+            for row in range(first, min(last, gw.count_rows()) + 1):
+                url = gw.get_cell(row, "url").strip()
+                if not len(url):
+                    continue
+                original_status = gw.get_cell(row, "status")
+                status = gw.get_cell(
+                    row, "status", fresh=original_status in ["", None]
+                )
+                if status not in ["", None]:
+                    continue
+                item = Metadata().set_url(url)
+                feeder._set_context(item, gw, row)
+                yield item
+
+    return _process_rows
+
+
+def merge_stats(shard_stats: list[dict]) -> dict:
+    stats = {"archived": 0, "failed": 0, "errors": []}
+    for shard in shard_stats:
+        stats["archived"] += shard.get("archived", 0)
+        stats["failed"] += shard.get("failed", 0)
+        stats["errors"].extend(shard.get("errors", []))
+        if shard.get("suppressed"):
+            stats["suppressed"] = (
+                stats.get("suppressed", 0) + shard["suppressed"]
+            )
+    return stats
@@ -0,0 +1,102 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.shared.settings import get_settings
+from app.worker.domain_limiter import match_domain
+from app.worker.worker_metrics import publish_metric_batch
+
+
+# phases a task is split into, "total" is the whole task
+SETUP = "setup"
+FEED = "feed"
+GET_ALL_URLS = "get_all_urls"
+SERIALIZE = "serialize"
+DB_INSERT = "db_insert"
+TOTAL = "total"
+
+
+def metric_domain(url: str | None) -> str:
+    # a bounded set of domains, so it is safe to use as a Prometheus label
+    settings = get_settings()
+    domain = match_domain(
+        url or "", settings.METRIC_DOMAINS | settings.DOMAIN_LIMITS.keys()
+    )
+    return domain or "other"
+
+
+class PhaseTimer:
+    """
+    Times the phases of one worker task as task_phase_seconds samples, labeled
+    by task name, group, queue and domain of the archived URL. The samples
+    are shipped to the web process in one batch every `interval_seconds` and
+    when the task is done, a sheet times several phases per row.
+    """
+
+    def __init__(
+        self,
+        task_name: str,
+        group_id: str,
+        delivery_info: dict | None,
+        url: str | None = None,
+        interval_seconds: float | None = None,
+    ):
+        self.labels = {
+            "task": task_name,
+            "group": group_id,
+            "queue": (delivery_info or {}).get("routing_key") or "unknown",
+            "domain": metric_domain(url),
+        }
+        if interval_seconds is None:
+            interval_seconds = get_settings().TASK_PHASE_INTERVAL_SECONDS
+        # 0 only publishes on publish()
+        self.interval_seconds = interval_seconds
+        self.started_at = time.perf_counter()
+        self._published_at = time.monotonic()
+        # last duration of each phase
+        self.durations: dict[str, float] = {}
+        # durations not published yet, by phase and domain
+        self.pending: dict[tuple[str, str], list[float]] = {}
+
+    @contextmanager
+    def phase(self, name: str, url: str | None = None) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, url)
+
+    def observe(
+        self, name: str, seconds: float, url: str | None = None
+    ) -> float:
+        domain = self.labels["domain"] if url is None else metric_domain(url)
+        self.pending.setdefault((name, domain), []).append(seconds)
+        self.durations[name] = seconds
+        elapsed = time.monotonic() - self._published_at
+        if self.interval_seconds and elapsed >= self.interval_seconds:
+            self.publish()
+        return seconds
+
+    def publish(self) -> None:
+        # sends the durations observed since the last publish, if any
+        self._published_at = time.monotonic()
+        pending, self.pending = self.pending, {}
+        publish_metric_batch(
+            [
+                {
+                    "metric": "task_phase_seconds",
+                    "labels": {**self.labels, "phase": name, "domain": domain},
+                    "values": values,
+                }
+                for (name, domain), values in pending.items()
+            ]
+        )
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def done(self) -> None:
+        # the whole task, from when the timer was created
+        self.observe(TOTAL, self.elapsed)
+        self.publish()
@@ -0,0 +1,41 @@
+import json
+
+from app.shared.log import logger
+from app.shared.settings import get_settings
+from app.shared.task_messaging import get_redis
+
+
+Redis = get_redis()
+
+
+def publish_metric(metric: str, value: float = 1, **labels) -> None:
+    """
+    Ships one metric sample to the web process, which owns the Prometheus
+    registry and maps `metric` to a known collector, see
+    app/web/utils/metrics.py::record_worker_metric
+    """
+    channel = get_settings().REDIS_WORKER_METRICS_CHANNEL
+    try:
+        Redis.publish(
+            channel,
+            json.dumps({"metric": metric, "value": value, "labels": labels}),
+        )
+    except Exception as e:
+        logger.warning(f"Could not publish {metric=} to {channel}: {e}")
+
+
+def publish_metric_batch(samples: list[dict]) -> None:
+    """
+    Ships many samples in one message, each a dict of `metric`, `labels` and
+    `values`, all observed, see publish_metric.
+    """
+    if not samples:
+        return
+    channel = get_settings().REDIS_WORKER_METRICS_CHANNEL
+    try:
+        Redis.publish(channel, json.dumps({"batch": samples}))
+    except Exception as e:
+        logger.warning(
+            f"Could not publish a batch of {len(samples)} metrics to "
+            f"{channel}: {e}"
+        )
@@ -0,0 +1,127 @@
+import threading
+import time
+import weakref
+from typing import Callable
+
+from sqlalchemy import exc
+
+from app.shared import schemas
+from app.shared.db import worker_crud
+from app.shared.db.database import task_db
+from app.shared.log import log_error, logger
+
+
+# buffers with pending rows, flushed on worker shutdown
+_ACTIVE_BUFFERS: weakref.WeakSet = weakref.WeakSet()
+
+
+class ArchiveWriteBuffer:
+    """
+    Write-behind buffer for archive results: rows are collected in memory and
+    inserted in one transaction every `max_rows` rows or once `max_seconds`
+    have gone by since the oldest pending row, whichever comes first. The
+    time is also kept by a timer, so the oldest row is not held back for as
+    long as the next one takes to archive. Callers must flush() when done.
+
+    Once a row is flushed, `on_flushed` is called with it and whether it was
+    stored, which is when it may be reported as archived.
+
+    If the batch insert hits an IntegrityError (eg: a duplicate URL) the rows
+    are retried one at a time so only the offending ones are dropped.
+    """
+
+    def __init__(
+        self,
+        max_rows: int,
+        max_seconds: float,
+        on_flushed: Callable[[schemas.ArchiveCreate, bool], None] | None = None,
+    ):
+        self.max_rows = max(1, max_rows)
+        self.max_seconds = max_seconds
+        self.on_flushed = on_flushed
+        self.pending: list[schemas.ArchiveCreate] = []
+        self._oldest = None
+        self._timer: threading.Timer | None = None
+        # the timer flushes from its own thread
+        self._lock = threading.RLock()
+        self.stored = 0
+        self.duplicates = 0
+        self.errors: list[str] = []
+        _ACTIVE_BUFFERS.add(self)
+
+    def add(self, archive: schemas.ArchiveCreate) -> None:
+        with self._lock:
+            if not self.pending:
+                self._oldest = time.monotonic()
+                self._start_timer()
+            self.pending.append(archive)
+            if (
+                len(self.pending) >= self.max_rows
+                or time.monotonic() - self._oldest >= self.max_seconds
+            ):
+                self.flush()
+
+    def flush(self) -> int:
+        """
+        Inserts all pending rows, returns how many were stored.
+        """
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return 0
+            archives, self.pending = self.pending, []
+            with task_db() as session:
+                try:
+                    worker_crud.store_archived_urls(session, archives)
+                    stored = archives
+                except exc.IntegrityError:
+                    stored = self._store_one_by_one(session, archives)
+                except Exception as e:
+                    log_error(e, f"could not store {len(archives)} archives")
+                    self.errors.extend([str(e)] * len(archives))
+                    stored = []
+            self.stored += len(stored)
+            logger.debug(
+                f"[ARCHIVES STORED] {len(stored)}/{len(archives)} rows"
+            )
+            if self.on_flushed:
+                stored_ids = {id(archive) for archive in stored}
+                for archive in archives:
+                    self.on_flushed(archive, id(archive) in stored_ids)
+            return len(stored)
+
+    def _start_timer(self) -> None:
+        if self.max_seconds <= 0:
+            return
+        self._timer = threading.Timer(self.max_seconds, self._flush_on_time)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_time(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            log_error(e, "could not flush the archive write buffer")
+
+    def _store_one_by_one(self, session, archives) -> list:
+        stored = []
+        for archive in archives:
+            try:
+                worker_crud.store_archived_url(session, archive)
+                stored.append(archive)
+            except exc.IntegrityError as e:
+                session.rollback()
+                self.duplicates += 1
+                logger.warning(f"cached result detected: {e}")
+            except Exception as e:
+                session.rollback()
+                log_error(e, f"could not store archive for {archive.url}")
+                self.errors.append(str(e))
+        return stored
+
+
+def flush_active_buffers() -> None:
+    for buffer in list(_ACTIVE_BUFFERS):
+        buffer.flush()
@@ -0,0 +1,88 @@
+"""
+Compares how much the Redis result backend holds for completed URL archiving
+tasks when they return the full archive result versus an ArchiveResultRef.
+Measures the payload celery writes for each task, the same bytes Redis keeps
+under celery-task-meta-<id> until result_expires.
+
+    poetry run python scripts/benchmark_result_memory.py --tasks 10000 \
+        --media 4
+"""
+
+import argparse
+import json
+
+from app.shared import schemas
+from app.shared.constants import STATUS_SUCCESS
+from app.shared.task_messaging import get_celery
+
+
+def synthetic_result(i: int, media: int) -> dict:
+    # shaped like Metadata.to_json() of a typical social media post
+    url = f"https://example.com/user/status/{i}"
+    return {
+        "status": "twitter_api: success",
+        "metadata": {
+            "url": url,
+            "title": f"post {i} " + "lorem ipsum " * 10,
+            "content": "dolor sit amet " * 40,
+            "timestamp": "2024-10-17T10:00:00+00:00",
+            "author": "someone",
+            "archive_duration_seconds": 12,
+            "tmp_dir": None,
+        },
+        "media": [
+            {
+                "filename": f"/tmp/tmp{i}_{m}/{i}_{m}.jpg",
+                "key": f"archives/{i}_{m}.jpg",
+                "urls": [f"https://cdn.example.com/archives/{i}_{m}.jpg"],
+                "properties": {
+                    "id": f"media_{m}",
+                    "hash": f"SHA-256:{'0' * 64}",
+                    "src": f"https://pbs.example.com/media/{i}_{m}.jpg",
+                },
+                "mimetype": "image/jpeg",
+            }
+            for m in range(media)
+        ],
+    }
+
+
+def stored_bytes(backend, result) -> int:
+    meta = backend._get_result_meta(result, STATUS_SUCCESS, None, None)
+    return len(backend.encode(meta))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--media", type=int, default=4)
+    args = parser.parse_args()
+
+    backend = get_celery().backend
+    full, slim = 0, 0
+    for i in range(args.tasks):
+        result = synthetic_result(i, args.media)
+        full += stored_bytes(backend, result)
+        ref = schemas.ArchiveResultRef(
+            archive_id=f"{i:08d}-0000-0000-0000-000000000000",
+            status=STATUS_SUCCESS,
+            url=result["metadata"]["url"],
+        )
+        slim += stored_bytes(backend, ref.model_dump())
+
+    print(
+        json.dumps(
+            {
+                "tasks": args.tasks,
+                "full_result_mb": round(full / 2**20, 2),
+                "result_ref_mb": round(slim / 2**20, 2),
+                "bytes_per_task": [full // args.tasks, slim // args.tasks],
+                "saved": f"{1 - slim / full:.1%}",
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compares how fast create_sheet_task results reach the database when inserted
+one transaction per row versus through the ArchiveWriteBuffer.
+
+    DATABASE_PATH=sqlite:///benchmark.db poetry run python \
+        scripts/benchmark_sheet_writes.py --rows 5000 --batch 50
+"""
+
+import argparse
+import os
+import time
+
+from app.shared import schemas
+from app.shared.db import models, worker_crud
+from app.shared.db.database import get_db, make_engine
+from app.shared.settings import get_settings
+from app.worker.write_buffer import ArchiveWriteBuffer
+
+
+def synthetic_sheet(rows: int, prefix: str) -> list[schemas.ArchiveCreate]:
+    return [
+        schemas.ArchiveCreate(
+            id=f"{prefix}-{i}",
+            url=f"https://example.com/{prefix}/{i}",
+            result={"status": "success", "metadata": {"title": f"row {i}"}},
+            author_id="benchmark@example.com",
+            group_id="benchmark",
+            tags=["benchmark"],
+            sheet_id="benchmark-sheet",
+            urls=[
+                models.ArchiveUrl(url=f"https://cdn.example.com/{i}", key="0")
+            ],
+        )
+        for i in range(rows)
+    ]
+
+
+def per_row(archives: list[schemas.ArchiveCreate]) -> None:
+    for archive in archives:
+        with get_db() as db:
+            worker_crud.store_archived_url(db, archive)
+
+
+def buffered(archives: list[schemas.ArchiveCreate], batch: int) -> None:
+    buffer = ArchiveWriteBuffer(batch, 3600)
+    for archive in archives:
+        buffer.add(archive)
+    buffer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    database_path = get_settings().DATABASE_PATH
+    sqlite_file = database_path.replace("sqlite:///", "")
+    if os.path.exists(sqlite_file):
+        raise SystemExit(f"refusing to run against existing {sqlite_file}")
+    models.Base.metadata.create_all(make_engine(database_path))
+
+    try:
+        for name, run in (
+            ("per-row", lambda a: per_row(a)),
+            (f"buffered({args.batch})", lambda a: buffered(a, args.batch)),
+        ):
+            archives = synthetic_sheet(args.rows, name)
+            start = time.perf_counter()
+            run(archives)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>14}: {args.rows} rows in {elapsed:.2f}s "
+                f"= {args.rows / elapsed:.0f} rows/sec"
+            )
+    finally:
+        os.remove(sqlite_file)
+
+
+if __name__ == "__main__":
+    main()
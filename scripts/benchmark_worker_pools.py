@@ -0,0 +1,188 @@
+"""
+Compares URLs archived per hour per GB of RAM across the celery pools a URL
+worker can run with, see WORKER_POOL. Each pool runs in a fresh process that
+imports auto-archiver like a worker does, then archives synthetic URLs that
+mostly wait on the network (--latency), burn some CPU (--cpu-ms) and hold a
+media buffer (--task-mb). Memory is the peak PSS of the whole process tree,
+so pages prefork children share with their parent are only counted once.
+
+    poetry run python scripts/benchmark_worker_pools.py --tasks 400 \
+        --concurrency prefork=4 threads=32 gevent=64
+
+gevent is skipped when it is not installed.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+POOLS = ("prefork", "threads", "gevent")
+DEFAULT_CONCURRENCY = {"prefork": 4, "threads": 32, "gevent": 64}
+
+
+def archive_like(i: int, latency: float, cpu_ms: float, task_mb: int) -> int:
+    # touch every page so the buffer is really resident
+    media = bytearray(task_mb * 2**20)
+    media[:: os.sysconf("SC_PAGE_SIZE")] = b"\x01" * len(
+        range(0, len(media), os.sysconf("SC_PAGE_SIZE"))
+    )
+    time.sleep(latency / 2)
+    deadline = time.perf_counter() + cpu_ms / 1000
+    digest = str(i).encode()
+    while time.perf_counter() < deadline:
+        digest = hashlib.sha256(digest).digest()
+    time.sleep(latency / 2)
+    return len(media)
+
+
+def tree_pss_bytes(pid: int) -> int:
+    # PSS of `pid` and its descendants, RSS where smaps_rollup is missing
+    total = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            total += next(
+                int(line.split()[1]) * 1024
+                for line in smaps
+                if line.startswith("Pss:")
+            )
+    except (OSError, StopIteration):
+        try:
+            with open(f"/proc/{pid}/statm") as statm:
+                total += int(statm.read().split()[1]) * os.sysconf(
+                    "SC_PAGE_SIZE"
+                )
+        except OSError:
+            return 0
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return total
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as children:
+                total += sum(
+                    tree_pss_bytes(int(c)) for c in children.read().split()
+                )
+        except OSError:
+            continue
+    return total
+
+
+def run_child(pool: str, concurrency: int, args) -> dict:
+    # runs in its own process, prints the measurements as JSON
+    if pool == "gevent":
+        from gevent import monkey
+
+        monkey.patch_all()
+    import threading
+
+    # what every worker process pays before its first task
+    import auto_archiver.core.orchestrator  # noqa: F401
+
+    peak = tree_pss_bytes(os.getpid())
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not stop.wait(0.2):
+            peak = max(peak, tree_pss_bytes(os.getpid()))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    task_args = [
+        (i, args.latency, args.cpu_ms, args.task_mb) for i in range(args.tasks)
+    ]
+    start = time.perf_counter()
+    if pool == "prefork":
+        import multiprocessing
+
+        with multiprocessing.get_context("fork").Pool(concurrency) as workers:
+            workers.starmap(archive_like, task_args, chunksize=1)
+    elif pool == "threads":
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(concurrency) as workers:
+            list(workers.map(lambda a: archive_like(*a), task_args))
+    else:
+        from gevent.pool import Pool
+
+        Pool(concurrency).map(lambda a: archive_like(*a), task_args)
+    seconds = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    peak = max(peak, tree_pss_bytes(os.getpid()))
+
+    urls_per_hour = args.tasks / seconds * 3600
+    return {
+        "pool": pool,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 1),
+        "urls_per_hour": round(urls_per_hour),
+        "peak_mb": round(peak / 2**20),
+        "urls_per_hour_per_gb": round(urls_per_hour / (peak / 2**30)),
+    }
+
+
+def parse_concurrency(values: list[str]) -> dict[str, int]:
+    concurrency = dict(DEFAULT_CONCURRENCY)
+    for value in values:
+        pool, _, slots = value.partition("=")
+        assert pool in POOLS, f"unknown pool {pool}, one of {POOLS}"
+        concurrency[pool] = int(slots)
+    return concurrency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument(
+        "--latency", type=float, default=2.0, help="network seconds per URL"
+    )
+    parser.add_argument("--cpu-ms", type=float, default=50)
+    parser.add_argument("--task-mb", type=int, default=8)
+    parser.add_argument("--pools", nargs="+", default=list(POOLS))
+    parser.add_argument(
+        "--concurrency", nargs="*", default=[], help="eg: threads=32"
+    )
+    parser.add_argument("--child", choices=POOLS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    concurrency = parse_concurrency(args.concurrency)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, concurrency[args.child], args)))
+        return
+
+    print(
+        f"{args.tasks} URLs, {args.latency}s network + {args.cpu_ms}ms CPU "
+        f"+ {args.task_mb}MB each"
+    )
+    print(
+        f"{'pool':<8} {'slots':>5} {'seconds':>8} {'URLs/h':>8} "
+        f"{'peak MB':>8} {'URLs/h/GB':>10}"
+    )
+    for pool in args.pools:
+        if pool == "gevent" and not importlib.util.find_spec("gevent"):
+            print(f"{pool:<8} skipped, gevent is not installed")
+            continue
+        child = subprocess.run(
+            [sys.executable, __file__, *sys.argv[1:], "--child", pool],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        r = json.loads(child.stdout.strip().splitlines()[-1])
+        print(
+            f"{r['pool']:<8} {r['concurrency']:>5} {r['seconds']:>8} "
+            f"{r['urls_per_hour']:>8} {r['peak_mb']:>8} "
+            f"{r['urls_per_hour_per_gb']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()